@@ -0,0 +1,99 @@
+# app/benchmarks/bench_async_products.py
+"""Compares the blocking Session path with the AsyncSession path of GET /products.
+
+Both routes are served in-process through httpx's ASGI transport, so the
+numbers show how much the event loop can overlap, not network overhead.
+
+Usage (from the app directory, DB_URI pointing to a populated database):
+
+    python benchmarks/bench_async_products.py --requests 2000 --concurrency 10
+
+Keep --concurrency within the sync engine's pool size + overflow (15 by
+default): beyond that the blocking route holds the event loop while waiting
+for a connection that only a pending request teardown can release, and
+stalls until pool_timeout.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from crud import get_products, get_products_async
+from database import get_async_db, get_db
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    # The previous implementation: an async route calling the blocking crud function
+    @app.get("/sync")
+    async def sync_products(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
+        return get_products(db, skip=skip, limit=limit)
+
+    @app.get("/async")
+    async def async_products(skip: int = 0, limit: int = 10, db: AsyncSession = Depends(get_async_db)):
+        return await get_products_async(db, skip=skip, limit=limit)
+
+    return app
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def drive(client: httpx.AsyncClient, path: str, requests: int, concurrency: int, limit: int) -> dict:
+    latencies = []
+    queue = asyncio.Queue()
+    for index in range(requests):
+        queue.put_nowait(index)
+
+    async def worker():
+        while not queue.empty():
+            index = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.get(path, params={"skip": (index * limit) % 1000, "limit": limit})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "path": path,
+        "requests": requests,
+        "concurrency": concurrency,
+        "requests_per_second": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+async def main(args):
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # warm up both pools before measuring
+        await drive(client, "/sync", args.concurrency, args.concurrency, args.limit)
+        await drive(client, "/async", args.concurrency, args.concurrency, args.limit)
+        results = [
+            await drive(client, path, args.requests, args.concurrency, args.limit)
+            for path in ("/sync", "/async")
+        ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
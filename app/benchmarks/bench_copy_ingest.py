@@ -0,0 +1,77 @@
+# app/benchmarks/bench_copy_ingest.py
+"""Compares the batched upsert ingestion with the COPY merge and replace modes.
+
+Each mode loads the same generated file (see datagen.py) into an emptied
+products table and then once more on top of the loaded catalog, so both the
+initial load and the daily re-upload, where every row is unchanged, are measured.
+
+Usage (from the app directory, DB_URI pointing to a disposable PostgreSQL database):
+
+    python benchmarks/bench_copy_ingest.py --rows 2000000
+
+The products table is truncated between runs.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+from datagen import write_csv
+from database import SessionLocal
+from ingest import IngestMode, copy_file, ingest_file
+
+
+def run(path: str, mode: IngestMode, batch_size: int) -> dict:
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        if mode == IngestMode.batch:
+            reports = ingest_file(db, path, batch_size=batch_size)
+            report = {key: sum(report[key] for report in reports) for key in ("rows", "inserted", "updated", "unchanged", "rejected")}
+        else:
+            report = copy_file(db, path, mode, batch_size=batch_size)
+        db.commit()
+        elapsed = time.perf_counter() - started
+    finally:
+        db.close()
+    return {
+        "mode": mode.value,
+        **report,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(report["rows"] / elapsed),
+    }
+
+
+def truncate():
+    db = SessionLocal()
+    try:
+        db.execute(text("TRUNCATE products RESTART IDENTITY"))
+        db.commit()
+    finally:
+        db.close()
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_csv(os.path.join(directory, "products.csv"), args.rows, seed=args.seed)
+        results = []
+        for mode in (IngestMode.batch, IngestMode.merge, IngestMode.replace):
+            truncate()
+            results.append({"load": "initial", **run(path, mode, args.batch_size)})
+            results.append({"load": "reload", **run(path, mode, args.batch_size)})
+        truncate()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,141 @@
+# app/benchmarks/bench_listing_serialization.py
+"""Compares the per-row cost of the previous and the current GET /products serialization.
+
+legacy: ORM Product instances copied into dicts, wrapped in ListProductResponse
+        and encoded by FastAPI (jsonable_encoder + json.dumps).
+fast:   column select read as tuples and encoded with orjson by OrjsonResponse.
+
+Both routes bypass the product cache and are driven in-process through httpx's
+ASGI transport in alternating rounds. By default the rows live in an in-memory
+SQLite database seeded from datagen; pass --db-uri to read a populated database.
+
+Usage (from the app directory):
+
+    python benchmarks/bench_listing_serialization.py --limit 1000 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DB_URI", "sqlite://")
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from datagen import generate_rows
+from crud import get_products_async, next_cursor
+from database import Base, async_database_url
+from models import Product
+from responses import OrjsonResponse
+import schemas
+
+
+def legacy_dict(product: Product) -> dict:
+    # the per-row copy of the previous crud._product_dict
+    return {
+        "id": product.id,
+        "part_number": product.part_number,
+        "branch_id": product.branch_id,
+        "part_price": product.part_price,
+        "short_desc": product.short_desc,
+        "createdat": product.createdat,
+        "updatedat": product.updatedat,
+    }
+
+
+def build_app(session_factory) -> FastAPI:
+    app = FastAPI()
+
+    async def get_session():
+        async with session_factory() as db:
+            yield db
+
+    @app.get("/legacy")
+    async def legacy(skip: int = 0, limit: int = 10, db=Depends(get_session)):
+        stmt = select(Product).order_by(Product.id).offset(skip).limit(limit)
+        products = [legacy_dict(product) for product in (await db.execute(stmt)).scalars().all()]
+        return schemas.ListProductResponse(
+            status="Success", results=len(products), products=products, next_cursor=next_cursor(products, limit)
+        )
+
+    @app.get("/fast", response_class=OrjsonResponse)
+    async def fast(skip: int = 0, limit: int = 10, db=Depends(get_session)):
+        products = await get_products_async(db, skip=skip, limit=limit)
+        return OrjsonResponse({
+            "status": "Success", "results": len(products), "products": products,
+            "next_cursor": next_cursor(products, limit),
+        })
+
+    return app
+
+
+async def seed(engine, rows: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        batch = []
+        for part_number, branch_id, price, description in generate_rows(rows, duplicate_ratio=0):
+            batch.append({
+                "part_number": part_number, "branch_id": branch_id,
+                "part_price": float(price), "short_desc": description,
+            })
+            if len(batch) == 5000:
+                await conn.execute(insert(Product), batch)
+                batch = []
+        if batch:
+            await conn.execute(insert(Product), batch)
+
+
+async def drive(client: httpx.AsyncClient, path: str, requests: int, limit: int) -> float:
+    """Seconds per request of `requests` sequential requests."""
+    started = time.perf_counter()
+    for index in range(requests):
+        response = await client.get(path, params={"skip": (index * 7) % 1000, "limit": limit})
+        response.raise_for_status()
+    return (time.perf_counter() - started) / requests
+
+
+async def main(args):
+    if args.db_uri:
+        engine = create_async_engine(async_database_url(args.db_uri))
+    else:
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        await seed(engine, args.limit + 1000)
+    app = build_app(async_sessionmaker(engine, expire_on_commit=False))
+
+    samples = {"legacy": [], "fast": []}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        legacy = (await client.get("/legacy", params={"limit": args.limit})).json()["products"]
+        fast = (await client.get("/fast", params={"limit": args.limit})).json()["products"]
+        assert legacy == fast, "both routes must return the same rows"
+        for _ in range(args.rounds):
+            for name in samples:
+                samples[name].append(await drive(client, f"/{name}", args.requests // args.rounds, args.limit))
+    await engine.dispose()
+
+    results = {
+        name: {
+            "ms_per_request": round(statistics.median(values) * 1000, 3),
+            "us_per_row": round(statistics.median(values) / args.limit * 1e6, 3),
+        }
+        for name, values in samples.items()
+    }
+    results["speedup"] = round(results["legacy"]["us_per_row"] / results["fast"]["us_per_row"], 2)
+    print(json.dumps({"limit": args.limit, **results}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--db-uri", default=None)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,147 @@
+# app/benchmarks/bench_metrics_overhead.py
+"""Measures the cost of the Prometheus instrumentation on GET /products.
+
+The same route is driven in-process through httpx's ASGI transport, bare and
+with MetricsMiddleware and the SQLAlchemy statement timers installed, in
+alternating rounds, so the difference is the instrumentation itself. End-to-end numbers
+are noisy next to a database round trip, so the middleware is also timed
+around a no-op ASGI app.
+
+Usage (from the app directory, DB_URI pointing to a populated database):
+
+    python benchmarks/bench_metrics_overhead.py --requests 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+from crud import get_products_async
+from database import engine, get_async_db
+import metrics
+from metrics import MetricsMiddleware, instrument_sqlalchemy
+
+
+def build_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/products")
+    async def products(skip: int = 0, limit: int = 10, db: AsyncSession = Depends(get_async_db)):
+        return await get_products_async(db, skip=skip, limit=limit)
+
+    if instrumented:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+async def drive(app: FastAPI, requests: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        queue = asyncio.Queue()
+        for index in range(requests):
+            queue.put_nowait(index)
+
+        async def worker():
+            while not queue.empty():
+                index = queue.get_nowait()
+                response = await client.get("/products", params={"skip": index % 100, "limit": 10})
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+
+async def middleware_cost(calls: int) -> float:
+    """Microseconds the middleware adds to one request around a no-op app."""
+    route = build_app(instrumented=False).routes[-1]
+    scope = {"type": "http", "method": "GET", "path": "/products", "route": route}
+
+    async def noop(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    wrapped = MetricsMiddleware(noop)
+    timings = []
+    for app in (noop, wrapped):
+        started = time.perf_counter()
+        for _ in range(calls):
+            await app(scope, receive, send)
+        timings.append(time.perf_counter() - started)
+    return (timings[1] - timings[0]) / calls * 1e6
+
+
+def statement_cost(calls: int) -> float:
+    """Microseconds per trivial statement on the sync engine."""
+    with engine.connect() as connection:
+        started = time.perf_counter()
+        for _ in range(calls):
+            connection.execute(text("SELECT 1"))
+        return (time.perf_counter() - started) / calls * 1e6
+
+
+def set_statement_timers(enabled: bool):
+    if enabled:
+        instrument_sqlalchemy()
+    else:
+        for name, listener in (
+            ("before_cursor_execute", metrics._before_cursor_execute),
+            ("after_cursor_execute", metrics._after_cursor_execute),
+        ):
+            if event.contains(Engine, name, listener):
+                event.remove(Engine, name, listener)
+
+
+async def main(args):
+    apps = {False: build_app(instrumented=False), True: build_app(instrumented=True)}
+    seconds = {False: [], True: []}
+    # alternate the variants so warm-up and machine drift hit both alike
+    for _ in range(args.rounds):
+        for instrumented in (False, True):
+            set_statement_timers(instrumented)
+            await drive(apps[instrumented], args.concurrency * 10, args.concurrency)
+            seconds[instrumented].append(await drive(apps[instrumented], args.requests, args.concurrency))
+    bare_seconds = statistics.median(seconds[False])
+    instrumented_seconds = statistics.median(seconds[True])
+
+    set_statement_timers(False)
+    bare_statement = statement_cost(args.requests * 5)
+    set_statement_timers(True)
+    instrumented_statement = statement_cost(args.requests * 5)
+
+    per_request = (instrumented_seconds - bare_seconds) / args.requests
+    print(json.dumps({
+        "requests": args.requests,
+        "rounds": args.rounds,
+        "bare_requests_per_second": round(args.requests / bare_seconds, 1),
+        "instrumented_requests_per_second": round(args.requests / instrumented_seconds, 1),
+        "overhead_us_per_request": round(per_request * 1e6, 1),
+        "overhead_percent": round(100 * (instrumented_seconds - bare_seconds) / bare_seconds, 2),
+        "middleware_us_per_request": round(await middleware_cost(args.requests * 10), 2),
+        "statement_timer_us_per_query": round(instrumented_statement - bare_statement, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,82 @@
+# app/benchmarks/compare.py
+"""Compares two result files of suite.py and flags regressions.
+
+Throughput metrics regress when they drop, latency and memory metrics when
+they grow, by more than --threshold (10% by default). The exit status is 1
+when any metric regressed, so the comparison can gate a CI job.
+
+Usage (from the app directory):
+
+    python benchmarks/compare.py base.json head.json --threshold 0.15
+"""
+import argparse
+import json
+import sys
+from typing import Iterator, Tuple
+
+# metric name -> True when higher is better
+METRICS = {
+    "rows_per_second": True,
+    "peak_rss_mb": False,
+    "requests_per_second": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+}
+
+
+def metrics(results: dict) -> Iterator[Tuple[str, str, float]]:
+    """Yields (section/name, metric, value) for every compared metric of a result file."""
+    for section in ("ingest", "http"):
+        for name, values in results.get(section, {}).items():
+            for metric in METRICS:
+                if metric in values:
+                    yield f"{section}/{name}", metric, values[metric]
+
+
+def compare(base: dict, head: dict, threshold: float) -> list:
+    """Returns one row per metric present in both files with the relative change and verdict."""
+    base_values = {(name, metric): value for name, metric, value in metrics(base)}
+    rows = []
+    for name, metric, value in metrics(head):
+        before = base_values.get((name, metric))
+        if before is None:
+            continue
+        change = (value - before) / before if before else 0.0
+        worse = -change if METRICS[metric] else change
+        rows.append({
+            "name": name,
+            "metric": metric,
+            "base": before,
+            "head": value,
+            "change": round(change, 4),
+            "regressed": worse > threshold,
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    parser.add_argument("--json", action="store_true", help="print the rows as JSON")
+    args = parser.parse_args()
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.head, encoding="utf-8") as f:
+        head = json.load(f)
+    rows = compare(base, head, args.threshold)
+
+    if args.json:
+        print(json.dumps({"base": base.get("commit"), "head": head.get("commit"), "rows": rows}, indent=2))
+    else:
+        print(f"{'benchmark':40} {'metric':20} {base.get('commit', 'base'):>12} {head.get('commit', 'head'):>12} {'change':>8}")
+        for row in rows:
+            flag = "  REGRESSED" if row["regressed"] else ""
+            print(
+                f"{row['name']:40} {row['metric']:20} {row['base']:>12} {row['head']:>12} "
+                f"{row['change'] * 100:>7.1f}%{flag}"
+            )
+    sys.exit(1 if any(row["regressed"] for row in rows) else 0)
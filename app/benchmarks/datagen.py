@@ -0,0 +1,100 @@
+# app/benchmarks/datagen.py
+"""Generates product CSV files shaped like data/data.csv for load tests.
+
+Part numbers follow the formats found in the sample (0121F00548, 0121G00047P,
+0163D00006-T006, 05700-001-16-88), branches are spread over a few codes and
+descriptions repeat the `GALV x FAB x ...` pattern, so row widths and the
+duplicate key ratio stay close to real uploads.
+
+Usage (from the app directory):
+
+    python benchmarks/datagen.py /tmp/products.csv --rows 2000000
+"""
+import argparse
+import csv
+import random
+from typing import Iterator, List, Optional, Tuple
+
+BRANCHES = ["TUC", "CIN", "PHX", "DEN", "ABQ", "ELP"]
+GAUGES = [".026", ".028", ".030", ".032", ".035", ".036", ".038", ".040", ".042", ".045"]
+
+
+def part_number(rng: random.Random, serial: int) -> str:
+    """Returns a part number in one of the sample formats, unique per serial."""
+    kind = serial % 4
+    prefix = f"{serial // 4 % 10000:04d}{'ABCDFG'[serial % 6]}{serial // 40000:05d}"
+    if kind == 0:
+        return prefix
+    if kind == 1:
+        return f"{prefix}P"
+    if kind == 2:
+        return f"{prefix}-T{rng.randint(1, 9):03d}"
+    return f"05700-{serial // 10000 % 1000:03d}-{serial // 100 % 100:02d}-{serial % 100:02d}"
+
+
+def branch_codes(count: int) -> List[str]:
+    """The sample branch codes, followed by B007, B008, ... when more are needed."""
+    return (BRANCHES + [f"B{n:03d}" for n in range(len(BRANCHES) + 1, count + 1)])[:count]
+
+
+def generate_rows(
+    rows: int,
+    seed: int = 0,
+    duplicate_ratio: float = 0.01,
+    branches: int = len(BRANCHES),
+    description_length: Optional[int] = None,
+) -> Iterator[Tuple[str, str, str, str]]:
+    """Yields (part_number, branch_id, part_price, short_desc) rows.
+
+    Args:
+        rows: Number of rows.
+        seed: Seed of the random generator, the same seed yields the same file.
+        duplicate_ratio: Share of rows repeating an earlier key with a new price.
+        branches: Number of distinct branch codes.
+        description_length: Pad or cut every description to this many characters,
+            by default they are 45 to 60 characters long like the sample.
+    """
+    rng = random.Random(seed)
+    codes = branch_codes(branches)
+    for serial in range(rows):
+        if serial and rng.random() < duplicate_ratio:
+            serial = rng.randrange(serial)
+        number = part_number(random.Random(serial), serial)
+        price = f"{rng.uniform(0.5, 500):.2f}"
+        description = (
+            f"GALV x FAB x {number} x 16093 x {rng.choice(GAUGES)} "
+            f"x {rng.uniform(10, 35):.2f} x {rng.uniform(10, 25):.2f}"
+        )
+        if description_length is not None:
+            while len(description) < description_length:
+                description += f" x {rng.choice(GAUGES)}"
+            description = description[:description_length].rstrip()
+        yield number, codes[serial % len(codes)], price, description
+
+
+def write_csv(
+    path: str,
+    rows: int,
+    seed: int = 0,
+    duplicate_ratio: float = 0.01,
+    branches: int = len(BRANCHES),
+    description_length: Optional[int] = None,
+) -> str:
+    """Writes a generated products CSV file with the upload header and returns its path."""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["part_number", "branch_id", "part_price", "short_desc"])
+        writer.writerows(generate_rows(rows, seed, duplicate_ratio, branches, description_length))
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.01)
+    parser.add_argument("--branches", type=int, default=len(BRANCHES))
+    parser.add_argument("--description-length", type=int, default=None)
+    args = parser.parse_args()
+    print(write_csv(args.path, args.rows, args.seed, args.duplicate_ratio, args.branches, args.description_length))
@@ -0,0 +1,307 @@
+# app/benchmarks/suite.py
+"""Reproducible benchmark suite of the ingestion pipeline and the read APIs.
+
+Phases:
+
+    insert_products_from_csv  the whole file through crud.insert_products_from_csv
+    process_csv               the celery upload task, run eagerly in the process
+    http                      GET /products, GraphQL `products` (pages and aliased
+                              exact lookups), GET /search and /search/typeahead
+                              with concurrent in-process clients
+
+Each ingestion phase loads the generated catalog (see datagen.py) into an
+emptied products table in a fresh process, so its peak RSS is its own. The
+http phase then reads the catalog left by the last ingestion.
+
+The suite runs offline: DB_URI defaults to a new SQLite file, Elasticsearch is
+the in-memory fake of tests/fake_elasticsearch.py, celery runs tasks eagerly
+with an in-memory broker and result backend and Redis defaults to a closed
+local port, so the product cache only uses its in-process tier. Point DB_URI
+and REDIS_CACHE_URL to local PostgreSQL and Redis for production-like numbers.
+The fake Elasticsearch scans every document in Python, so the search numbers
+track the API's own overhead, not Elasticsearch.
+
+Usage (from the app directory):
+
+    python benchmarks/suite.py --rows 20000 --output results.json
+    python benchmarks/compare.py base.json results.json
+
+The products table is emptied before every ingestion phase.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import multiprocessing
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(APP_DIR)
+sys.path.append(os.path.join(APP_DIR, "tests"))
+
+from datagen import branch_codes, write_csv
+
+
+INGEST_PHASES = ("insert_products_from_csv", "process_csv")
+
+
+def _offline_defaults(workdir: str):
+    # read by the app modules at import, so set before the first import
+    os.environ.setdefault("DB_URI", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    os.environ.setdefault("REDIS_CACHE_URL", "redis://127.0.0.1:1/1")
+    os.environ.setdefault("UPLOAD_DIR", os.path.join(workdir, "uploads"))
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _empty_products():
+    from sqlalchemy import delete
+
+    from database import Base, SessionLocal, engine
+    from models import Product
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        db.execute(delete(Product))
+        db.commit()
+    finally:
+        db.close()
+
+
+def run_ingest_phase(phase: str, path: str, batch_size: int) -> dict:
+    """Runs one ingestion phase, in a child process of the suite."""
+    _empty_products()
+    started = time.perf_counter()
+
+    if phase == "insert_products_from_csv":
+        from crud import insert_products_from_csv
+        from database import SessionLocal
+
+        with open(path, encoding="utf-8") as f:
+            content = f.read()
+        db = SessionLocal()
+        try:
+            reports = insert_products_from_csv(db, content, chunk_size=batch_size)
+        finally:
+            db.close()
+        totals = {key: sum(report.get(key, 0) for report in reports) for key in ("inserted", "updated", "unchanged")}
+    else:
+        os.environ["INGEST_BATCH_SIZE"] = str(batch_size)
+        from fake_elasticsearch import fake_elasticsearch
+        import search_index
+        from celery_tasks import celery, process_csv
+
+        search_index._es = fake_elasticsearch()
+        # celery_config is loaded with the CELERY namespace on the first read, replacing the earlier
+        # changes, and its prefixed keys win over the unprefixed ones: override those once loaded
+        celery.conf.get("CELERY_RESULT_BACKEND")
+        for key, value in {
+            "CELERY_TASK_ALWAYS_EAGER": True,
+            "CELERY_TASK_EAGER_PROPAGATES": True,
+            "CELERY_BROKER_URL": "memory://",
+            "CELERY_RESULT_BACKEND": "cache+memory://",
+        }.items():
+            celery.conf[key] = value
+        # the task deletes the upload once it is applied
+        upload = shutil.copy(path, f"{path}.{phase}")
+        result = process_csv.apply(args=[upload]).get()
+        totals = {key: result.get(key, 0) for key in ("inserted", "updated", "unchanged", "rejected")}
+
+    elapsed = time.perf_counter() - started
+    rows = sum(totals.get(key, 0) for key in ("inserted", "updated", "unchanged"))
+    return {
+        **totals,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def drive(client, make_request, requests: int, concurrency: int) -> dict:
+    """Sends `requests` requests from `concurrency` clients and summarizes their latencies."""
+    latencies = []
+    queue = asyncio.Queue()
+    for index in range(requests):
+        queue.put_nowait(index)
+
+    async def worker():
+        while not queue.empty():
+            index = queue.get_nowait()
+            started = time.perf_counter()
+            response = await make_request(client, index)
+            response.raise_for_status()
+            payload = response.json()
+            if isinstance(payload, dict) and payload.get("errors"):
+                raise RuntimeError(payload["errors"])
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "requests_per_second": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+    }
+
+
+def _scenarios(keys: list, rows: int, branches: list, page_size: int) -> dict:
+    rng = random.Random(0)
+    pages = max(rows // page_size, 1)
+
+    def rest_page(client, index):
+        return client.get("/products", params={"skip": (index % pages) * page_size, "limit": page_size})
+
+    def graphql_page(client, index):
+        query = "query ($skip: Int, $limit: Int) { products(skip: $skip, limit: $limit) { id partNumber branchId partPrice } }"
+        variables = {"skip": (index % pages) * page_size, "limit": page_size}
+        return client.post("/graphql", json={"query": query, "variables": variables})
+
+    def graphql_lookups(client, index):
+        fields = "\n".join(
+            f'p{n}: products(partNumber: "{part_number}", branchId: "{branch_id}") {{ partNumber partPrice }}'
+            for n, (part_number, branch_id) in enumerate(rng.sample(keys, min(10, len(keys))))
+        )
+        return client.post("/graphql", json={"query": f"{{ {fields} }}"})
+
+    def search(client, index):
+        return client.get("/search", params={"q": "GALV", "branch_id": branches[index % len(branches)], "size": 20})
+
+    def typeahead(client, index):
+        part_number = keys[index % len(keys)][0]
+        return client.get("/search/typeahead", params={"prefix": part_number[:4]})
+
+    return {
+        "rest_products": rest_page,
+        "graphql_products": graphql_page,
+        "graphql_lookups": graphql_lookups,
+        "search": search,
+        "search_typeahead": typeahead,
+    }
+
+
+async def run_http_phase(args) -> dict:
+    import httpx
+    from sqlalchemy import select
+
+    from database import SessionLocal
+    from fake_elasticsearch import fake_elasticsearch
+    from models import Product
+    import search_index
+
+    # index the loaded catalog into the fake cluster the search routes read
+    search_index._es = fake_elasticsearch()
+    db = SessionLocal()
+    try:
+        search_index.reindex_all(search_index._es, db)
+        keys = [tuple(row) for row in db.execute(select(Product.part_number, Product.branch_id))]
+    finally:
+        db.close()
+
+    from main import app
+
+    results = {}
+    scenarios = _scenarios(keys, len(keys), branch_codes(args.branches), args.page_size)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        for name, make_request in scenarios.items():
+            if args.scenario and name not in args.scenario:
+                continue
+            # warm up pools, caches and compiled statements
+            await drive(client, make_request, args.concurrency, args.concurrency)
+            results[name] = await drive(client, make_request, args.requests, args.concurrency)
+    return results
+
+
+def _commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench-suite-")
+    _offline_defaults(workdir)
+    path = write_csv(
+        os.path.join(workdir, "catalog.csv"), args.rows, args.seed, args.duplicate_ratio,
+        args.branches, args.description_length,
+    )
+
+    results = {
+        "commit": _commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "database": os.environ["DB_URI"].split(":", 1)[0],
+        "parameters": {key: value for key, value in vars(args).items() if key != "output"},
+        "ingest": {},
+        "http": {},
+    }
+    try:
+        context = multiprocessing.get_context("spawn")
+        for phase in INGEST_PHASES:
+            if args.skip_ingest:
+                break
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results["ingest"][phase] = executor.submit(run_ingest_phase, phase, path, args.batch_size).result()
+            print(f"{phase}: {results['ingest'][phase]}", file=sys.stderr)
+        if not args.skip_http:
+            results["http"] = asyncio.run(run_http_phase(args))
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.01)
+    parser.add_argument("--branches", type=int, default=6)
+    parser.add_argument("--description-length", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=500, help="requests per http scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--scenario", action="append", help="only run these http scenarios, may be repeated")
+    parser.add_argument("--skip-ingest", action="store_true")
+    parser.add_argument("--skip-http", action="store_true")
+    parser.add_argument("--keep", action="store_true", help="keep the generated catalog and SQLite database")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    output = json.dumps(main(args), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
@@ -0,0 +1,165 @@
+# branch_stats.py
+"""Per branch price aggregates for GET /products/stats and the GraphQL `branchStats` field.
+
+The aggregates live in branch_stats, one row per branch, and the number of
+products last updated on each day in branch_update_days, so reading them costs
+the same whatever the size of the catalog. The batch uploads apply their
+changes as deltas in the transaction of every chunk (see crud._upsert_chunk);
+a price change that may have moved the minimum or maximum of a branch flags it
+stale and refresh_stale recomputes the stale branches once the upload is done.
+COPY loads, which also delete products, rebuild every branch in their
+transaction.
+
+Usage (from the app directory):
+
+    python branch_stats.py rebuild   # recompute every branch from the products table
+"""
+import argparse
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from sqlalchemy import DateTime, delete, false, func, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import BranchStats, BranchUpdateDay, Product
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# Days, today included, of the updated_recently count
+STATS_RECENT_DAYS = int(os.getenv("STATS_RECENT_DAYS", "7"))
+
+
+def rebuild(db: Session, branch_ids: Optional[Iterable[str]] = None) -> int:
+    """Recomputes the aggregates of `branch_ids`, or of every branch, from the products table.
+
+    The caller owns the transaction.
+
+    Returns:
+        The number of branches written.
+    """
+    stats_scope, days_scope, products_scope = [], [], [Product.branch_id.is_not(None)]
+    if branch_ids is not None:
+        branch_ids = list(branch_ids)
+        stats_scope.append(BranchStats.branch_id.in_(branch_ids))
+        days_scope.append(BranchUpdateDay.branch_id.in_(branch_ids))
+        products_scope.append(Product.branch_id.in_(branch_ids))
+
+    db.execute(delete(BranchStats).where(*stats_scope))
+    db.execute(delete(BranchUpdateDay).where(*days_scope))
+    written = db.execute(insert(BranchStats).from_select(
+        ["branch_id", "product_count", "price_sum", "price_min", "price_max", "stale", "updatedat"],
+        select(
+            Product.branch_id,
+            func.count(),
+            func.coalesce(func.sum(Product.part_price), 0),
+            func.min(Product.part_price),
+            func.max(Product.part_price),
+            false(),
+            literal(datetime.utcnow(), DateTime),
+        ).where(*products_scope).group_by(Product.branch_id),
+    )).rowcount
+    day = func.date(Product.updatedat)
+    db.execute(insert(BranchUpdateDay).from_select(
+        ["branch_id", "day", "products"],
+        select(Product.branch_id, day, func.count())
+        .where(*products_scope, Product.updatedat.is_not(None))
+        .group_by(Product.branch_id, day),
+    ))
+    return written
+
+
+def refresh_stale(db: Session) -> List[str]:
+    """Recomputes and commits the branches flagged stale by the uploads.
+
+    Returns:
+        The refreshed branch ids.
+    """
+    branch_ids = list(db.execute(select(BranchStats.branch_id).where(BranchStats.stale)).scalars())
+    if branch_ids:
+        rebuild(db, branch_ids)
+        db.commit()
+        logger.info("Refreshed the stats of branches %s", branch_ids)
+    return branch_ids
+
+
+def rebuild_if_empty(db: Session) -> int:
+    """Fills branch_stats of an existing catalog the first time, e.g. when the table was just created."""
+    if db.execute(select(BranchStats.branch_id).limit(1)).first() is not None:
+        return 0
+    written = rebuild(db)
+    db.commit()
+    return written
+
+
+async def get_branch_stats_async(
+    db: AsyncSession,
+    branch_id: Optional[str] = None,
+    recent_days: int = STATS_RECENT_DAYS
+) -> List[dict]:
+    """Reads the aggregates of every branch, or of one, without touching the products table.
+
+    Args:
+        db: SQLAlchemy async session object.
+        branch_id: Only return this branch. Defaults to all branches.
+        recent_days: Count the products last updated in this many days, today (UTC) included.
+
+    Returns:
+        One dictionary per branch with products, average, minimum and maximum price
+        and the number of recently updated products, ordered by branch_id.
+    """
+    since = datetime.utcnow().date() - timedelta(days=recent_days - 1)
+    recent = (
+        select(BranchUpdateDay.branch_id, func.sum(BranchUpdateDay.products).label("products"))
+        .where(BranchUpdateDay.day >= since)
+        .group_by(BranchUpdateDay.branch_id)
+        .subquery()
+    )
+    stmt = (
+        select(
+            BranchStats.branch_id,
+            BranchStats.product_count,
+            BranchStats.price_sum,
+            BranchStats.price_min,
+            BranchStats.price_max,
+            func.coalesce(recent.c.products, 0),
+            BranchStats.updatedat,
+        )
+        .outerjoin(recent, recent.c.branch_id == BranchStats.branch_id)
+        .where(BranchStats.product_count > 0)
+        .order_by(BranchStats.branch_id)
+    )
+    if branch_id:
+        stmt = stmt.where(BranchStats.branch_id == branch_id)
+
+    return [
+        {
+            "branch_id": branch,
+            "product_count": count,
+            "avg_price": round(price_sum / count, 2),
+            "min_price": price_min,
+            "max_price": price_max,
+            "updated_recently": int(updated_recently),
+            "updatedat": updatedat,
+        }
+        for branch, count, price_sum, price_min, price_max, updated_recently, updatedat in await db.execute(stmt)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Branch stats maintenance")
+    parser.add_argument("command", choices=["rebuild"])
+    args = parser.parse_args()
+
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        written = rebuild(db)
+        db.commit()
+        print(f"{written} branches rebuilt")
+    finally:
+        db.close()
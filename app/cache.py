@@ -0,0 +1,399 @@
+# cache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import orjson
+import redis
+import redis.asyncio as aioredis
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# Redis database for cached product reads, db 0 is the celery result backend
+REDIS_CACHE_URL = os.getenv("REDIS_CACHE_URL", "redis://redis:6379/1")
+# Seconds a cached page lives in Redis
+PRODUCT_CACHE_TTL = int(os.getenv("PRODUCT_CACHE_TTL", "300"))
+# Seconds and number of entries kept in the in-process tier
+PRODUCT_CACHE_LOCAL_TTL = float(os.getenv("PRODUCT_CACHE_LOCAL_TTL", "30"))
+PRODUCT_CACHE_LOCAL_SIZE = int(os.getenv("PRODUCT_CACHE_LOCAL_SIZE", "1024"))
+# Seconds between catalog version reads, bounds how stale a page can be after an upload
+CATALOG_VERSION_CHECK_INTERVAL = float(os.getenv("CATALOG_VERSION_CHECK_INTERVAL", "1"))
+# Seconds Redis is skipped after a connection error
+REDIS_RETRY_INTERVAL = float(os.getenv("REDIS_RETRY_INTERVAL", "30"))
+
+# Seconds an applied upload is remembered for whole-file dedupe
+UPLOAD_DIGEST_TTL = int(os.getenv("UPLOAD_DIGEST_TTL", str(7 * 24 * 3600)))
+
+CATALOG_VERSION_KEY = "products:catalog_version"
+# Unix time of the last catalog version bump, also covers uploads that only delete rows
+CATALOG_MODIFIED_KEY = "products:catalog_modified"
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """Serializes a cached value with orjson, datetimes become ISO 8601 strings."""
+    return orjson.dumps(value, default=_json_default)
+
+
+def _fields_suffix(fields: Optional[Iterable[str]]) -> str:
+    # projected reads are cached apart from the full rows
+    return f":{','.join(fields)}" if fields else ""
+
+
+def _as_of_suffix(as_of: Optional[datetime]) -> str:
+    # reads priced from the history are cached apart from the current prices
+    return f"@{as_of.isoformat()}" if as_of is not None else ""
+
+
+def list_key(
+    skip: int,
+    limit: int,
+    after: Optional[str],
+    fields: Optional[Iterable[str]] = None,
+    as_of: Optional[datetime] = None,
+) -> str:
+    """Cache key of a product listing page, optionally projected to `fields` or priced as of `as_of`."""
+    return f"list:{skip}:{limit}:{after or ''}{_as_of_suffix(as_of)}{_fields_suffix(fields)}"
+
+
+def item_key(
+    part_number: str,
+    branch_id: str,
+    fields: Optional[Iterable[str]] = None,
+    as_of: Optional[datetime] = None,
+) -> str:
+    """Cache key of a single (part_number, branch_id) lookup, optionally projected to `fields` or priced as of `as_of`."""
+    return (
+        f"item:{len(branch_id)}:{branch_id}:{len(part_number)}:{part_number}"
+        f"{_as_of_suffix(as_of)}{_fields_suffix(fields)}"
+    )
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with a per-entry TTL."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ProductCache:
+    """Read-through cache for product reads with an in-process LRU tier in front of Redis.
+
+    Keys embed the catalog version, which the workers bump after every committed
+    upload, so an upload invalidates every cached page at once and stale entries
+    simply age out. Redis errors degrade the cache to the local tier.
+    """
+
+    def __init__(
+        self,
+        redis_url: str = REDIS_CACHE_URL,
+        ttl: int = PRODUCT_CACHE_TTL,
+        local_size: int = PRODUCT_CACHE_LOCAL_SIZE,
+        local_ttl: float = PRODUCT_CACHE_LOCAL_TTL,
+    ):
+        self.redis_url = redis_url
+        self.ttl = ttl
+        self.local = LRUCache(local_size, local_ttl)
+        self._redis = None
+        self._redis_down_until = 0.0
+        self._version = 0
+        self._version_checked_at = float("-inf")
+        self._version_current = False
+        self.hits_local = 0
+        self.hits_redis = 0
+        self.misses = 0
+        self.redis_errors = 0
+
+    def _client(self):
+        if not self.redis_url or time.monotonic() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            self._redis = aioredis.from_url(
+                self.redis_url, socket_connect_timeout=0.5, socket_timeout=0.5
+            )
+        return self._redis
+
+    def reset_after_fork(self):
+        """Forgets the Redis client inherited from the parent process, whose sockets it still owns."""
+        self._redis = None
+
+    async def close(self):
+        """Closes the Redis connections, the next read reconnects."""
+        client, self._redis = self._redis, None
+        if client is not None:
+            try:
+                await client.aclose()
+            except (redis.RedisError, OSError, RuntimeError) as e:
+                logger.warning("Closing the product cache Redis client failed: %s", str(e))
+
+    def _redis_failed(self, e: Exception):
+        self.redis_errors += 1
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_INTERVAL
+        logger.warning("Product cache skipping Redis for %ss: %s", REDIS_RETRY_INTERVAL, str(e))
+
+    async def catalog_version(self, strict: bool = False) -> Optional[int]:
+        """Returns the catalog version, read from Redis at most once per check interval.
+
+        Args:
+            strict: Return None instead of the last known version while Redis
+                cannot be read, for callers that must not serve stale validators.
+        """
+        now = time.monotonic()
+        if now - self._version_checked_at >= CATALOG_VERSION_CHECK_INTERVAL:
+            self._version_checked_at = now
+            self._version_current = False
+            client = self._client()
+            if client is not None:
+                try:
+                    self._version = int(await client.get(CATALOG_VERSION_KEY) or 0)
+                    self._version_current = True
+                except (redis.RedisError, OSError) as e:
+                    self._redis_failed(e)
+        if strict and not self._version_current:
+            return None
+        return self._version
+
+    async def catalog_modified(self) -> Optional[float]:
+        """Returns the Unix time of the last catalog version bump, None when unknown."""
+        client = self._client()
+        if client is None:
+            return None
+        try:
+            value = await client.get(CATALOG_MODIFIED_KEY)
+        except (redis.RedisError, OSError) as e:
+            self._redis_failed(e)
+            return None
+        return float(value) if value is not None else None
+
+    async def _get(self, versioned_key: str) -> Any:
+        """Value of a versioned key from the local tier, then Redis, None on a miss in both."""
+        value = self.local.get(versioned_key)
+        if value is not None:
+            self.hits_local += 1
+            return value
+
+        client = self._client()
+        if client is None:
+            return None
+        try:
+            cached = await client.get(versioned_key)
+        except (redis.RedisError, OSError) as e:
+            self._redis_failed(e)
+            return None
+        if cached is None:
+            return None
+        self.hits_redis += 1
+        value = orjson.loads(cached)
+        self.local.set(versioned_key, value)
+        return value
+
+    async def peek(self, key: str) -> Any:
+        """Returns the cached value of `key`, None on a miss in both tiers. Never loads it."""
+        return await self._get(f"products:v{await self.catalog_version()}:{key}")
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Returns the cached value of `key`, calling `loader` on a miss in both tiers.
+
+        Args:
+            key: Cache key, unique for the query parameters.
+            loader: Coroutine function producing a JSON serializable value.
+        """
+        versioned_key = f"products:v{await self.catalog_version()}:{key}"
+        value = await self._get(versioned_key)
+        if value is not None:
+            return value
+
+        self.misses += 1
+        payload = dumps(await loader())
+        # both tiers hold the JSON form so hits and misses return identical values
+        value = orjson.loads(payload)
+        self.local.set(versioned_key, value)
+        client = self._client()
+        if client is not None:
+            try:
+                await client.set(versioned_key, payload, ex=self.ttl)
+            except (redis.RedisError, OSError) as e:
+                self._redis_failed(e)
+        return value
+
+    async def get_many_or_load(
+        self, keys: List[str], loader: Callable[[List[str]], Awaitable[Dict[str, Any]]]
+    ) -> List[Any]:
+        """Batched get_or_load, one Redis MGET for the local misses and one `loader` call for the rest.
+
+        Args:
+            keys: Cache keys.
+            loader: Coroutine function taking the missing keys and returning a
+                JSON serializable value for each of them.
+
+        Returns:
+            The values in the order of `keys`.
+        """
+        prefix = f"products:v{await self.catalog_version()}:"
+        values = {}
+        for key in dict.fromkeys(keys):
+            value = self.local.get(prefix + key)
+            if value is not None:
+                self.hits_local += 1
+                values[key] = value
+
+        client = self._client()
+        missing = [key for key in dict.fromkeys(keys) if key not in values]
+        if missing and client is not None:
+            try:
+                cached = await client.mget([prefix + key for key in missing])
+            except (redis.RedisError, OSError) as e:
+                self._redis_failed(e)
+                client, cached = None, []
+            for key, payload in zip(missing, cached):
+                if payload is not None:
+                    self.hits_redis += 1
+                    values[key] = orjson.loads(payload)
+                    self.local.set(prefix + key, values[key])
+            missing = [key for key in missing if key not in values]
+
+        if missing:
+            self.misses += len(missing)
+            loaded = await loader(missing)
+            payloads = {key: dumps(loaded[key]) for key in missing}
+            for key, payload in payloads.items():
+                values[key] = orjson.loads(payload)
+                self.local.set(prefix + key, values[key])
+            if client is not None:
+                try:
+                    async with client.pipeline(transaction=False) as pipe:
+                        for key, payload in payloads.items():
+                            pipe.set(prefix + key, payload, ex=self.ttl)
+                        await pipe.execute()
+                except (redis.RedisError, OSError) as e:
+                    self._redis_failed(e)
+        return [values[key] for key in keys]
+
+    def stats(self) -> dict:
+        """Hit, miss and eviction counters of both tiers."""
+        return {
+            "catalog_version": self._version,
+            "hits_local": self.hits_local,
+            "hits_redis": self.hits_redis,
+            "misses": self.misses,
+            "local_entries": len(self.local),
+            "local_evictions": self.local.evictions,
+            "local_expirations": self.local.expirations,
+            "redis_errors": self.redis_errors,
+        }
+
+
+def _sync_client(redis_url: str) -> redis.Redis:
+    return redis.Redis.from_url(redis_url, socket_connect_timeout=2, socket_timeout=2)
+
+
+def bump_catalog_version(redis_url: str = REDIS_CACHE_URL) -> Optional[int]:
+    """Invalidates every cached product read by incrementing the catalog version.
+
+    Called by the workers after every upload batch that committed changes and
+    once an upload ends. A failure is logged and the cached pages expire with
+    their TTL. The time of the bump is recorded as the catalog's Last-Modified.
+
+    Returns:
+        The new catalog version, or None when Redis is unavailable.
+    """
+    try:
+        client = _sync_client(redis_url)
+        try:
+            pipe = client.pipeline()
+            pipe.incr(CATALOG_VERSION_KEY)
+            pipe.set(CATALOG_MODIFIED_KEY, repr(time.time()))
+            version, _ = pipe.execute()
+            return version
+        finally:
+            client.close()
+    except (redis.RedisError, OSError) as e:
+        logger.error("Could not bump the product catalog version: %s", str(e))
+        return None
+
+
+def upload_key(digest: str) -> str:
+    """Redis key remembering the catalog version an upload with this digest produced."""
+    return f"products:upload:{digest}"
+
+
+def upload_versions(digest: str, redis_url: str = REDIS_CACHE_URL) -> Tuple[Optional[int], Optional[int]]:
+    """Reads the current catalog version and the version the same upload produced last time.
+
+    An upload is a duplicate when both are equal: the catalog has not changed
+    since the identical file was applied.
+
+    Returns:
+        The current catalog version and the remembered version, None when unknown
+        or when Redis is unavailable.
+    """
+    try:
+        client = _sync_client(redis_url)
+        try:
+            current, applied = client.mget([CATALOG_VERSION_KEY, upload_key(digest)])
+        finally:
+            client.close()
+    except (redis.RedisError, OSError) as e:
+        logger.error("Could not read the upload digest: %s", str(e))
+        return None, None
+    return int(current or 0), (int(applied) if applied is not None else None)
+
+
+def remember_upload(digest: str, version: int, redis_url: str = REDIS_CACHE_URL):
+    """Records that applying the upload with this digest left the catalog at `version`."""
+    try:
+        client = _sync_client(redis_url)
+        try:
+            client.set(upload_key(digest), version, ex=UPLOAD_DIGEST_TTL)
+        finally:
+            client.close()
+    except (redis.RedisError, OSError) as e:
+        logger.error("Could not remember the upload digest: %s", str(e))
+
+
+# Cache shared by the product endpoints of this process
+product_cache = ProductCache()
@@ -1,11 +1,31 @@
 # celery_tasks.py
-from celery import Celery
+from celery import Celery, chord, uuid
+from celery.signals import (
+    task_postrun, task_prerun, worker_init, worker_process_init, worker_process_shutdown, worker_shutdown
+)
 # Import CeleryConfig from the same directory level
 import celery_config
-from sqlalchemy.orm import Session, sessionmaker
-from sqlalchemy import create_engine
-from crud import insert_products_from_csv
+from elasticsearch import ConnectionError as ESConnectionError, TransportError
+from sqlalchemy.exc import DisconnectionError, OperationalError
+from sqlalchemy.orm import Session
+from database import DATABASE_URL
+from cache import bump_catalog_version, remember_upload, upload_versions
+from db_pool import EngineRegistry
+from metrics import (
+    INGEST_ROWS, INGEST_ROWS_PER_SECOND, TASK_DURATION, instrument_sqlalchemy, mark_process_dead,
+    set_worker_pool_stats, start_worker_server,
+)
+from ingest import (
+    IngestMode, IngestProgress, PROGRESS_COUNTERS, copy_file, count_data_rows, file_digest, ingest_file, split_csv
+)
+from branch_stats import refresh_stale
+from price_history import maintain
+from search_index import get_es, index_products_by_keys, reindex_all
+from throttle import IngestThrottle
 import logging
+import os
+import time
+from typing import Optional, Tuple
 
 
 # Configure the logger (adjust settings as needed)
@@ -13,31 +33,496 @@ logging.basicConfig(filename='celery_tasks.log', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-celery = Celery(
-    "tasks",
-    broker=celery_config.CELERY_BROKER_URL,  # Use configured broker URL
-    backend=celery_config.CELERY_RESULT_BACKEND  # Use configured result backend
-)
+celery = Celery("tasks")
+# Broker, result backend, queues and routes, see celery_config.py
+celery.config_from_object(celery_config, namespace="CELERY")
 
-@celery.task
-def process_csv(db_url: str, content: str):
+# Attempts after the first one for upload tasks, and the backoff between them in seconds
+UPLOAD_MAX_RETRIES = int(os.getenv("UPLOAD_MAX_RETRIES", "5"))
+UPLOAD_RETRY_BACKOFF = int(os.getenv("UPLOAD_RETRY_BACKOFF", "5"))
+UPLOAD_RETRY_BACKOFF_MAX = int(os.getenv("UPLOAD_RETRY_BACKOFF_MAX", "300"))
+# Transient failures worth retrying, bad input fails the task right away
+RETRYABLE_ERRORS = (OperationalError, DisconnectionError)
+# Attempts after the first one for indexing tasks
+INDEX_MAX_RETRIES = int(os.getenv("INDEX_MAX_RETRIES", "5"))
+# Indexing tasks retry unreachable Elasticsearch or database with exponential backoff
+INDEX_RETRY_POLICY = {
+    "autoretry_for": (ESConnectionError, TransportError, *RETRYABLE_ERRORS),
+    "retry_backoff": True,
+    "retry_backoff_max": UPLOAD_RETRY_BACKOFF_MAX,
+    "max_retries": INDEX_MAX_RETRIES,
+}
+# Batch uploads of at least this many bytes go to the ingest-bulk queue, smaller ones to ingest-small
+INGEST_BULK_BYTES = int(os.getenv("INGEST_BULK_BYTES", str(10 * 1024 * 1024)))
+# Seconds between the price history partition maintenance runs of celery beat
+PRICE_HISTORY_MAINTENANCE_INTERVAL = float(os.getenv("PRICE_HISTORY_MAINTENANCE_INTERVAL", "86400"))
+
+celery.conf.beat_schedule = {
+    "maintain-price-history": {
+        "task": "celery_tasks.maintain_price_history",
+        "schedule": PRICE_HISTORY_MAINTENANCE_INTERVAL,
+    },
+}
+
+# Engines and connection pools shared by every task of a worker process
+engines = EngineRegistry(DATABASE_URL)
+
+
+# Statement timings of every engine of the worker
+instrument_sqlalchemy()
+# Start times of the tasks running in this process, by task id
+_task_started = {}
+
+
+@worker_init.connect
+def init_worker(**kwargs):
+    """Serves the metrics of the worker and its child processes on the side port."""
+    start_worker_server()
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def record_task_metrics(task_id=None, task=None, state=None, **kwargs):
+    """Records the task duration and the pool occupancy of this process."""
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - started)
+    set_worker_pool_stats(engines.stats())
+
+
+def _record_ingest(task_name: str, result: dict):
+    """Counts the rows of a finished upload job and its throughput."""
+    for outcome in ("inserted", "updated", "unchanged", "rejected"):
+        INGEST_ROWS.labels(task_name, outcome).inc(result.get(outcome, 0))
+    if result.get("elapsed"):
+        INGEST_ROWS_PER_SECOND.labels(task_name).observe(
+            (result.get("rows", 0) + result.get("rejected", 0)) / result["elapsed"]
+        )
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """Drops engines inherited from the parent and connects the pool of this child."""
+    engines.reset_after_fork()
+    engines.get_engine()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    """Closes the pooled connections of the exiting process."""
+    engines.dispose_all()
+    mark_process_dead(os.getpid())
+
+
+def _open_session() -> Session:
+    """Create a new session on the pooled engine of this worker process"""
+    return engines.session()
+
+
+def _check_upload(path: str, mode: IngestMode) -> Tuple[str, Optional[int], bool]:
+    """Fingerprints an upload and tells whether the identical file is already applied.
+
+    Returns:
+        The digest, the current catalog version and True when the same file in the
+        same mode produced the current catalog version, i.e. nothing changed since.
+    """
+    digest = f"{mode.value}:{file_digest(path)}"
+    current, applied = upload_versions(digest)
+    return digest, current, current is not None and applied == current
+
+
+def _refresh_branch_stats():
+    """Recomputes the branch stats the upload flagged stale, see branch_stats.py."""
+    db = _open_session()
+    try:
+        refresh_stale(db)
+    except Exception as e:
+        db.rollback()
+        # The branches stay flagged and are refreshed after the next upload
+        logger.error("Error refreshing branch stats: %s", str(e))
+    finally:
+        db.close()
+
+
+def upload_queue(path: str) -> str:
+    """Queue of a batch upload by the size of its spooled file."""
+    return "ingest-bulk" if os.path.getsize(path) >= INGEST_BULK_BYTES else "ingest-small"
+
+
+def _finish_upload(digest: str, version: Optional[int], changed: bool):
+    """Invalidates cached reads if the upload wrote anything and records its digest."""
+    if changed:
+        _refresh_branch_stats()
+        # The batches bumped it already, this one also covers the refreshed branch stats
+        version = bump_catalog_version()
+    if version is not None:
+        remember_upload(digest, version)
+
+
+def _abandon_upload(progress: IngestProgress):
+    """Refreshes what a failed upload left stale, the batches it committed stay applied."""
+    snapshot = progress.snapshot()
+    if snapshot["inserted"] or snapshot["updated"]:
+        _refresh_branch_stats()
+        bump_catalog_version()
+
+
+def _totals(reports: list) -> dict:
+    """Sums the counters of batch or shard reports."""
+    return {key: sum(report.get(key, 0) for report in reports) for key in PROGRESS_COUNTERS}
+
+
+def _enqueue_indexing(batch: list, report: dict):
+    """Queues the keys of a committed batch for Elasticsearch indexing"""
+    index_products.delay([[row["part_number"], row["branch_id"]] for row in batch])
+
+
+def _retry_countdown(retries: int) -> int:
+    """Seconds before the next attempt, doubling per retry up to UPLOAD_RETRY_BACKOFF_MAX."""
+    return min(UPLOAD_RETRY_BACKOFF * 2 ** retries, UPLOAD_RETRY_BACKOFF_MAX)
+
+
+def _publish(task, progress: IngestProgress):
+    """Returns an on_commit callback storing the progress of `task` in the result backend.
+
+    Every batch that wrote products also bumps the catalog version, so cached reads
+    and validators do not outlive the batch until the whole upload is done.
+    """
+    def on_commit(report: dict):
+        progress.add(report)
+        if report.get("inserted") or report.get("updated"):
+            bump_catalog_version()
+        task.update_state(state="PROGRESS", meta=progress.snapshot())
+    return on_commit
+
+
+@celery.task(bind=True, track_started=True, max_retries=UPLOAD_MAX_RETRIES)
+def process_csv(self, path: str, checkpoint: Optional[dict] = None):
+    """Streams a spooled CSV upload into the products table.
+
+    Progress is published to the result backend, and cached reads invalidated,
+    after every committed batch. Lost database connections are retried with
+    backoff, resuming after the last committed batch; any other error, or the
+    last failed retry, fails the task with the committed batches applied.
+
+    Args:
+        path: Path of the CSV file in the shared upload directory.
+        checkpoint: Progress snapshot of the previous attempt, set by retries.
+
+    Returns:
+        The final progress snapshot, or `duplicate` when the identical file was
+        already applied.
+    """
+    digest, version, duplicate = _check_upload(path, IngestMode.batch)
+    if duplicate and checkpoint is None:
+        os.remove(path)
+        logger.info("Skipped %s, the identical file is already applied", path)
+        return {"duplicate": True}
+
+    progress = IngestProgress(count_data_rows(path), checkpoint)
+    db = _open_session()
     try:
-        # Create a new session using the provided database information
-        engine = create_engine(db_url)
-        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-        db = SessionLocal()
+        # Read the file incrementally, committing one batch at a time
+        ingest_file(
+            db, path, on_batch=_enqueue_indexing, on_commit=_publish(self, progress), start_batch=progress.batches,
+            throttle=IngestThrottle(),
+        )
+    except RETRYABLE_ERRORS as e:
+        db.rollback()  # Only the uncommitted batch is lost
+        if self.request.retries < self.max_retries:
+            logger.warning("Retrying %s from batch %s: %s", path, progress.batches, str(e))
+            raise self.retry(
+                exc=e,
+                countdown=_retry_countdown(self.request.retries),
+                args=[path],
+                kwargs={"checkpoint": progress.snapshot()},
+            )
+        logger.error("Error processing CSV %s: %s", path, str(e))
+        _abandon_upload(progress)
+        raise
+    except Exception as e:
+        db.rollback()  # Rollback changes in case of errors
+        # The upload is kept on failure for inspection
+        logger.error("Error processing CSV %s: %s", path, str(e))
+        _abandon_upload(progress)
+        raise
+    finally:
+        db.close()  # Close the session to release resources
 
+    result = progress.snapshot()
+    logger.info("CSV processed: %s", result)
+    _record_ingest(self.name, result)
+    _finish_upload(digest, version, changed=bool(result["inserted"] or result["updated"]))
+    os.remove(path)
+    return result
+
+
+@celery.task(track_started=True)
+def process_csv_sharded(path: str, shards: int):
+    """Splits a spooled CSV upload into key-aware shards and ingests them in parallel.
+
+    Every (part_number, branch_id) key is routed to exactly one shard, so the shard
+    tasks never write the same product and can run on any number of workers.
+    The chord callback aggregates the shard reports.
+
+    Args:
+        path: Path of the CSV file in the shared upload directory.
+        shards: Number of shard tasks to fan out to.
+
+    Returns:
+        The job ids of the shard tasks and of the chord callback, which job_status follows.
+    """
+    digest, version, duplicate = _check_upload(path, IngestMode.batch)
+    if duplicate:
+        os.remove(path)
+        logger.info("Skipped %s, the identical file is already applied", path)
+        return {"duplicate": True}
+
+    split = split_csv(path, shards)
+    os.remove(path)
+
+    header = [
+        process_csv_shard.s(shard_path, index).set(task_id=uuid())
+        for index, shard_path in enumerate(split["shards"])
+    ]
+    finalize = chord(header)(finalize_csv_shards.s(split["rejected"], time.time(), digest, version))
+    return {
+        "shards": len(header),
+        "rejected": split["rejected"],
+        "shard_job_ids": [signature.id for signature in header],
+        "finalize_job_id": finalize.id,
+    }
+
+
+@celery.task(bind=True, track_started=True, max_retries=UPLOAD_MAX_RETRIES)
+def process_csv_shard(self, path: str, index: int, checkpoint: Optional[dict] = None):
+    """Ingests one shard file produced by process_csv_sharded.
+
+    Lost database connections are retried from the last committed batch. Other
+    errors, and the last failed retry, are reported instead of raised so the
+    chord callback still aggregates the other shards.
+
+    Args:
+        path: Path of the shard file.
+        index: Position of the shard, used in the report.
+        checkpoint: Progress snapshot of the previous attempt, set by retries.
+
+    Returns:
+        The shard report with row counts and duration in seconds.
+    """
+    progress = IngestProgress(count_data_rows(path), checkpoint)
+    report = {"shard": index}
+    try:
+        db = _open_session()
         try:
-            # Call the insert_products_from_csv function with the new session
-            insert_products_from_csv(db, content)
-            db.commit()  # Commit the changes to the database
+            ingest_file(
+                db, path, on_batch=_enqueue_indexing, on_commit=_publish(self, progress), start_batch=progress.batches,
+                throttle=IngestThrottle(),
+            )
         except Exception as e:
-            db.rollback()  # Rollback changes in case of errors
-            raise e  # Re-raise the exception for proper handling
+            db.rollback()  # Rollback the uncommitted batch
+            raise e
         finally:
-            db.close()  # Close the session to release resources
-        return "CSV processing completed successfully"
+            db.close()
+        os.remove(path)
+    except RETRYABLE_ERRORS as e:
+        if self.request.retries < self.max_retries:
+            logger.warning("Retrying CSV shard %s from batch %s: %s", path, progress.batches, str(e))
+            raise self.retry(
+                exc=e,
+                countdown=_retry_countdown(self.request.retries),
+                args=[path, index],
+                kwargs={"checkpoint": progress.snapshot()},
+            )
+        logger.error("Error processing CSV shard %s: %s", path, str(e))
+        report["error"] = str(e)
+    except Exception as e:
+        logger.error("Error processing CSV shard %s: %s", path, str(e))
+        report["error"] = str(e)
+    snapshot = progress.snapshot()
+    report.update({key: snapshot[key] for key in PROGRESS_COUNTERS})
+    report["duration"] = snapshot["elapsed"]
+    _record_ingest(self.name, snapshot)
+    return report
+
+
+@celery.task
+def finalize_csv_shards(
+    reports: list, rejected: int, started_at: float, digest: Optional[str] = None, version: Optional[int] = None
+):
+    """Chord callback aggregating the reports of all shards of an upload.
+
+    Args:
+        reports: The reports returned by process_csv_shard.
+        rejected: Rows rejected while splitting the upload.
+        started_at: Epoch time the upload was split.
+        digest: Digest of the upload, remembered when every shard succeeded.
+        version: Catalog version read before the upload was split.
+
+    Returns:
+        The totals over all shards along with the per shard reports.
+    """
+    totals = _totals(reports)
+    totals["rejected"] += rejected
+    result = {
+        **totals,
+        "failed_shards": [report["shard"] for report in reports if "error" in report],
+        "duration": round(time.time() - started_at, 3),
+        "shards": sorted(reports, key=lambda report: report["shard"]),
+    }
+    changed = bool(totals["inserted"] or totals["updated"])
+    if result["failed_shards"] or digest is None:
+        if changed:
+            _refresh_branch_stats()
+            bump_catalog_version()
+    else:
+        _finish_upload(digest, version, changed)
+    logger.info("Sharded CSV processing finished: %s", result)
+    return result
+
+
+@celery.task(bind=True, track_started=True, max_retries=UPLOAD_MAX_RETRIES)
+def process_csv_copy(self, path: str, mode: str):
+    """Bulk loads a spooled CSV upload with COPY and applies it in one transaction.
+
+    A failed load leaves nothing behind, so lost database connections are retried
+    from the start of the file.
+
+    Args:
+        path: Path of the CSV file in the shared upload directory.
+        mode: "merge" to upsert the file, "replace" to also delete the products missing from it.
+
+    Returns:
+        The load report with valid, inserted, updated, unchanged, deleted and
+        rejected rows, or `duplicate` when the identical file was already applied.
+    """
+    digest, version, duplicate = _check_upload(path, IngestMode(mode))
+    if duplicate:
+        os.remove(path)
+        logger.info("Skipped %s, the identical file is already applied", path)
+        return {"mode": mode, "duplicate": True}
+
+    progress = IngestProgress(count_data_rows(path))
+    db = _open_session()
+    try:
+        report = copy_file(db, path, IngestMode(mode), on_progress=_publish(self, progress))
+        db.commit()
+    except RETRYABLE_ERRORS as e:
+        db.rollback()  # Drops the staging table along with the partial load
+        logger.warning("Retrying COPY load of %s: %s", path, str(e))
+        raise self.retry(exc=e, countdown=_retry_countdown(self.request.retries))
     except Exception as e:
-        # Log or handle any errors that occur during task execution
-        logger.error("Error processing CSV: %s", str(e))
-        return f"Error processing CSV: {str(e)}"
+        db.rollback()
+        logger.error("Error loading CSV %s with COPY: %s", path, str(e))
+        raise
+    finally:
+        db.close()
+
+    changed = bool(report["inserted"] or report["updated"] or report["deleted"])
+    _finish_upload(digest, version, changed)
+    if changed:
+        # the changed keys of a bulk load are not tracked, rebuild the index behind its alias
+        reindex_products.delay()
+    os.remove(path)
+    result = {**report, "elapsed": progress.snapshot()["elapsed"]}
+    _record_ingest(self.name, result)
+    return result
+
+
+def _job_error(result) -> str:
+    return f"{type(result.info).__name__}: {result.info}"
+
+
+def job_status(job_id: str) -> dict:
+    """Reports the state and counters of an upload job.
+
+    Sharded uploads are followed to their shard tasks while they run and to the
+    chord callback once it finished, so the caller sees one job.
+
+    Args:
+        job_id: Task id returned by the upload endpoint.
+
+    Returns:
+        The celery state (PENDING, STARTED, PROGRESS, RETRY, SUCCESS or FAILURE)
+        with the progress counters, the result or the error.
+    """
+    result = celery.AsyncResult(job_id)
+    status = {"job_id": job_id, "state": result.state}
+    if result.state == "PROGRESS":
+        status["progress"] = result.info
+    elif result.state in ("RETRY", "FAILURE"):
+        status["error"] = _job_error(result)
+    elif result.state == "SUCCESS":
+        status["result"] = result.info
+
+    info = result.info if result.state == "SUCCESS" else None
+    if isinstance(info, dict) and "finalize_job_id" in info:
+        finalize = celery.AsyncResult(info["finalize_job_id"])
+        if finalize.state == "SUCCESS":
+            status["result"] = finalize.info
+        elif finalize.state == "FAILURE":
+            status.update({"state": "FAILURE", "error": _job_error(finalize)})
+        else:
+            shards = [celery.AsyncResult(shard_id) for shard_id in info["shard_job_ids"]]
+            snapshots = [shard.info for shard in shards if isinstance(shard.info, dict)]
+            status["state"] = "PROGRESS"
+            status["progress"] = {
+                **_totals(snapshots),
+                "shards": len(shards),
+                "shards_done": sum(1 for shard in shards if shard.ready()),
+                "rows_per_second": round(sum(snapshot.get("rows_per_second", 0) for snapshot in snapshots), 1),
+            }
+    return status
+
+
+@celery.task(**INDEX_RETRY_POLICY)
+def index_products(keys: list):
+    """Bulk indexes the committed state of the given products into Elasticsearch.
+
+    Unreachable Elasticsearch or database is retried with backoff, any other
+    error fails the task.
+
+    Args:
+        keys: [part_number, branch_id] pairs of a committed batch.
+    """
+    db = _open_session()
+    try:
+        return index_products_by_keys(get_es(), db, [tuple(key) for key in keys])
+    finally:
+        db.close()
+
+
+@celery.task(**INDEX_RETRY_POLICY)
+def reindex_products():
+    """Rebuilds the Elasticsearch products index from the database and swaps its alias."""
+    db = _open_session()
+    try:
+        return reindex_all(get_es(), db)
+    finally:
+        db.close()
+
+
+@celery.task
+def maintain_price_history():
+    """Creates the upcoming monthly price history partitions and drops the expired ones.
+
+    Returns:
+        The names of the created and dropped partitions.
+    """
+    return maintain(engines.get_engine())
+
+
+@celery.task
+def db_pool_stats():
+    """Reports connection pool occupancy and checkout wait metrics of the worker process running it.
+
+    Returns:
+        One entry per engine with size, checked out and overflow connections, the
+        number of checkouts, pool timeouts and the total and maximum checkout wait.
+    """
+    return engines.stats()
@@ -1,12 +1,25 @@
 # crud.py
 from datetime import datetime
-import string
+import base64
+import csv
+import hashlib
+import io
+import json
+import os
+from collections import Counter
+from itertools import islice
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.engine import Result
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.exc import IntegrityError  # Import IntegrityError
 from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from models import Product
-from typing import List
-from schemas import ProductBaseSchema  # Import ProductBaseSchema
+from models import BranchStats, BranchUpdateDay, Product
+from branch_stats import refresh_stale
+from price_history import price_as_of, record_price_changes
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from validation import iter_column_batches, normalize_header, validate_batch
 from fastapi import HTTPException  # Import HTTPException
 import logging
 
@@ -15,6 +28,36 @@ import logging
 logging.basicConfig(filename='web.log', level=logging.ERROR)
 logger = logging.getLogger(__name__)
 
+# Number of CSV rows applied per INSERT ... ON CONFLICT statement
+UPSERT_CHUNK_SIZE = int(os.getenv("UPSERT_CHUNK_SIZE", "1000"))
+
+# Columns returned by the product reads, in API order
+PRODUCT_FIELDS = ("id", "part_number", "branch_id", "part_price", "short_desc", "createdat", "updatedat")
+
+
+def product_columns(
+    fields: Optional[Iterable[str]] = None,
+    required: Iterable[str] = (),
+    as_of: Optional[datetime] = None
+) -> list:
+    """Columns of a projected product read.
+
+    Args:
+        fields: Product fields the caller uses, all of PRODUCT_FIELDS when empty.
+        required: Fields always read, e.g. the id the page cursor is made of.
+        as_of: Read part_price as of this time from the price history.
+
+    Returns:
+        The product table columns in PRODUCT_FIELDS order.
+    """
+    wanted = set(fields or PRODUCT_FIELDS) | set(required)
+    columns = [Product.__table__.c[field] for field in PRODUCT_FIELDS if field in wanted]
+    if as_of is not None:
+        columns = [
+            price_as_of(as_of).label("part_price") if column.key == "part_price" else column for column in columns
+        ]
+    return columns
+
 
 def get_products(
     db: Session, 
@@ -36,101 +79,397 @@ def get_products(
     Returns:
         A list of product dictionaries, where each dictionary represents a product's attributes.
     """
-    # Convert SQLAlchemy objects to dictionaries
-    product_dicts = []
-        
+    stmt = select(*product_columns())
     # Check if it is for a particular product
     if part_number and branch_id:
-        product = db.query(Product).filter(
-            Product.part_number == part_number
-        ).filter(
-            Product.branch_id == branch_id
-        ).first()
-        if product:
-            product_dict = {
-                "id": product.id,
-                "part_number": product.part_number,
-                "branch_id": product.branch_id,
-                "part_price": product.part_price,
-                "short_desc": product.short_desc,
-                "createdat": product.createdat,
-                "updatedat": product.updatedat,
-            }
-            return [product_dict]
-        else:
-            return []
+        stmt = stmt.where(Product.part_number == part_number, Product.branch_id == branch_id).limit(1)
     else:
         # Query the database for products, applying pagination using offset and limit
-        products = db.query(Product).offset(skip).limit(limit).all()
-        
-        product_dicts = [
-            {
-                "id": product.id,
-                "part_number": product.part_number,
-                "branch_id": product.branch_id,
-                "part_price": product.part_price,
-                "short_desc": product.short_desc,
-                "createdat": product.createdat,
-                "updatedat": product.updatedat,
-            }
-            for product in products
-        ]
-        
-    return product_dicts
+        stmt = stmt.order_by(Product.id).offset(skip).limit(limit)
+    return _product_dicts(db.execute(stmt))
 
 
-def insert_products_from_csv(db: Session, content: str):
-    """Insert or update the products table from a CSV. 
-    If the record already available then need to update, otherwise, it will be a new record and insert.
+def encode_cursor(product_id: int) -> str:
+    """Encodes the id of the last product of a page into an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps({"id": product_id}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Decodes a cursor made by encode_cursor.
+
+    Raises:
+        ValueError: The cursor is malformed.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        product_id = payload["id"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Invalid cursor") from e
+    # bool is a subclass of int, true and false are not ids
+    if type(product_id) is not int:
+        raise ValueError("Invalid cursor")
+    return product_id
+
+
+def next_cursor(products: List[dict], limit: int) -> Optional[str]:
+    """Returns the cursor of the page following `products`, or None after the last page."""
+    if limit > 0 and len(products) == limit:
+        return encode_cursor(products[-1]["id"])
+    return None
+
+
+async def get_products_async(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 10,
+    part_number: str = None,
+    branch_id: str = None,
+    after: str = None,
+    fields: Optional[Iterable[str]] = None,
+    as_of: Optional[datetime] = None
+) -> List[dict]:
+    """Async variant of get_products running on an AsyncSession.
+
+    Pages are ordered by id. With `after` the page seeks past the cursor on the
+    primary key index instead of scanning `skip` rows, so it costs the same at any depth.
+    With `as_of` the products are priced as of that time and the products without a
+    known price then, e.g. created later, are left out.
+
+    Args:
+        db: SQLAlchemy async session object.
+        skip: Number of products to skip from the beginning of the result set.
+            Ignored when `after` is given. Defaults to 0.
+        limit: Maximum number of products to return. Defaults to 10.
+        part_number: Part number for querying a specific product. Defaults to None.
+        branch_id: Branch ID for querying a specific product. Defaults to None.
+        after: Cursor returned with the previous page. Defaults to None.
+        fields: Only read these columns, plus the id. Defaults to all of PRODUCT_FIELDS.
+        as_of: Price the products as of this time. Defaults to the current prices.
+
+    Returns:
+        A list of product dictionaries, where each dictionary represents a product's attributes.
+    """
+    stmt = select(*product_columns(fields, required=("id",), as_of=as_of))
+    if as_of is not None:
+        stmt = stmt.where(price_as_of(as_of).is_not(None))
+    if part_number and branch_id:
+        stmt = stmt.where(
+            Product.part_number == part_number,
+            Product.branch_id == branch_id,
+        ).limit(1)
+    elif after:
+        stmt = stmt.where(Product.id > decode_cursor(after)).order_by(Product.id).limit(limit)
+    else:
+        stmt = stmt.order_by(Product.id).offset(skip).limit(limit)
+
+    return _product_dicts(await db.execute(stmt))
+
+
+async def get_last_modified_async(db: AsyncSession) -> Optional[datetime]:
+    """Returns the latest updatedat of the catalog, None when it is empty."""
+    return (await db.execute(select(func.max(Product.updatedat)))).scalar()
+
+
+def get_products_by_keys(db: Session, keys: List[tuple]) -> List[dict]:
+    """Retrieves the products of many (part_number, branch_id) keys in one query.
+
+    Args:
+        db: SQLAlchemy session object.
+        keys: (part_number, branch_id) pairs.
+
+    Returns:
+        The product dictionaries of the keys that exist, in no particular order.
+    """
+    if not keys:
+        return []
+    stmt = select(*product_columns()).where(tuple_(Product.part_number, Product.branch_id).in_(keys))
+    return _product_dicts(db.execute(stmt))
+
+
+async def get_products_by_keys_async(
+    db: AsyncSession,
+    keys: List[tuple],
+    fields: Optional[Iterable[str]] = None,
+    as_of: Optional[datetime] = None
+) -> List[dict]:
+    """Async variant of get_products_by_keys, one query for all keys.
+
+    Args:
+        db: SQLAlchemy async session object.
+        keys: (part_number, branch_id) pairs.
+        fields: Only read these columns, plus the key. Defaults to all of PRODUCT_FIELDS.
+        as_of: Price the products as of this time, see get_products_async.
+
+    Returns:
+        The product dictionaries of the keys that exist, in no particular order.
+    """
+    if not keys:
+        return []
+    stmt = select(*product_columns(fields, required=("part_number", "branch_id"), as_of=as_of)).where(
+        tuple_(Product.part_number, Product.branch_id).in_(keys)
+    )
+    if as_of is not None:
+        stmt = stmt.where(price_as_of(as_of).is_not(None))
+    return _product_dicts(await db.execute(stmt))
+
+
+def _product_dicts(result: Result) -> List[dict]:
+    """Converts the rows of a column select to the dictionaries returned by the API.
+
+    The reads select plain columns, so rows are tuples: no ORM instance, identity
+    map entry or RowMapping is built per row.
+    """
+    keys = tuple(result.keys())
+    return [dict(zip(keys, row)) for row in result]
+
+
+def _chunked(rows: Iterable[dict], size: int) -> Iterable[List[dict]]:
+    """Yields lists of at most `size` rows from `rows`."""
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _insert_for(db: Session):
+    """Returns the dialect specific `insert` construct that supports ON CONFLICT.
 
     Args:
         db: SQLAlchemy session object.
-        content: CSV content as a string.
     """
-    lines = content.strip().split('\n')
-    header = lines[0].strip().split(',')
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise ValueError(f"Bulk upsert is not supported for the {dialect} dialect")
+
+
+def _least(db: Session, *values):
+    return (func.least if db.get_bind().dialect.name == "postgresql" else func.min)(*values)
+
+
+def _greatest(db: Session, *values):
+    return (func.greatest if db.get_bind().dialect.name == "postgresql" else func.max)(*values)
+
+
+def _record_branch_changes(db: Session, changes: List[tuple], updated_at: datetime):
+    """Applies the rows written by a chunk to branch_stats and branch_update_days as deltas.
+
+    Counts, sums and the update histogram are exact after every chunk. A changed
+    price may have been the minimum or maximum of its branch, so the branch is
+    flagged stale and branch_stats.refresh_stale recomputes it after the upload.
+
+    Args:
+        db: SQLAlchemy session object, the deltas commit with the chunk.
+        changes: (branch_id, existed, old_price, new_price, old_updatedat) per written row,
+            existed is False and the old values None for new products.
+        updated_at: The updatedat written with the chunk.
+    """
+    stats, days = {}, Counter()
+    for branch_id, existed, old_price, new_price, old_updatedat in changes:
+        new_price = float(new_price)
+        entry = stats.setdefault(branch_id, {
+            "branch_id": branch_id, "product_count": 0, "price_sum": 0.0,
+            "price_min": new_price, "price_max": new_price, "stale": False, "updatedat": updated_at,
+        })
+        entry["product_count"] += not existed
+        entry["price_sum"] += new_price - float(old_price or 0)
+        entry["price_min"] = min(entry["price_min"], new_price)
+        entry["price_max"] = max(entry["price_max"], new_price)
+        entry["stale"] |= existed and (old_price is None or round(float(old_price), 2) != round(new_price, 2))
+        days[(branch_id, updated_at.date())] += 1
+        if old_updatedat is not None:
+            days[(branch_id, old_updatedat.date())] -= 1
+    if not stats:
+        return
+
+    insert = _insert_for(db)
+    # Sorted like the products so concurrent chunks lock the rows in the same order
+    stmt = insert(BranchStats).values([stats[branch_id] for branch_id in sorted(stats)])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[BranchStats.branch_id],
+        set_={
+            "product_count": BranchStats.product_count + stmt.excluded.product_count,
+            "price_sum": BranchStats.price_sum + stmt.excluded.price_sum,
+            "price_min": _least(db, func.coalesce(BranchStats.price_min, stmt.excluded.price_min), stmt.excluded.price_min),
+            "price_max": _greatest(db, func.coalesce(BranchStats.price_max, stmt.excluded.price_max), stmt.excluded.price_max),
+            "stale": BranchStats.stale | stmt.excluded.stale,
+            "updatedat": stmt.excluded.updatedat,
+        },
+    )
+    db.execute(stmt)
+
+    day_rows = [
+        {"branch_id": branch_id, "day": day, "products": products}
+        for (branch_id, day), products in sorted(days.items()) if products
+    ]
+    if day_rows:
+        stmt = insert(BranchUpdateDay).values(day_rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[BranchUpdateDay.branch_id, BranchUpdateDay.day],
+            set_={"products": BranchUpdateDay.products + stmt.excluded.products},
+        )
+        db.execute(stmt)
+
+
+def row_fingerprint(part_price: float, short_desc: Optional[str]) -> str:
+    """Content hash of the mutable columns of a product, stored in `row_hash`.
+
+    Prices are rounded to the cents kept by the database so 3.1 and 3.10 match.
+    """
+    content = f"{round(float(part_price), 2):.2f}\x1f{short_desc or ''}"
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _upsert_chunk(db: Session, chunk: List[dict]) -> Tuple[Dict[str, int], List[dict]]:
+    """Applies one chunk of validated rows with a single INSERT ... ON CONFLICT statement.
+
+    Rows whose fingerprint matches the stored `row_hash` are left out of the
+    statement, so an unchanged product is never rewritten and keeps its updatedat.
+
+    Args:
+        db: SQLAlchemy session object.
+        chunk: Validated product dictionaries.
 
-    for line in lines[1:]:  # Skip the header
-        data = line.strip().split(',')
-        row_dict = dict(zip(header, data))
+    Returns:
+        Counts of the rows staged, inserted, updated and unchanged by the chunk,
+        and the rows that were written.
+    """
+    # Postgres refuses to touch the same row twice in one statement,
+    # so keep only the last occurrence of each key like the row-by-row path did
+    staged = {}
+    for row in chunk:
+        staged[(row['part_number'], row['branch_id'])] = row
 
-        # Use ProductBaseSchema to validate each row
-        product_data = ProductBaseSchema(**row_dict)
+    # One round trip to learn which keys already exist, the fingerprint, price and updatedat they hold
+    existing = {
+        (part_number, branch_id): (row_hash, part_price, updatedat)
+        for part_number, branch_id, row_hash, part_price, updatedat in db.execute(
+            select(Product.part_number, Product.branch_id, Product.row_hash, Product.part_price, Product.updatedat).where(
+                tuple_(Product.part_number, Product.branch_id).in_(list(staged))
+            )
+        )
+    }
 
-        # Convert Pydantic model to dictionary
-        validated_data = product_data.dict()
+    # require to set createdat and updatedat col values
+    current_datetime = datetime.utcnow()
+    written, values, repriced, changes = [], [], [], []
+    # Sorted so concurrent transactions lock the index rows in the same order
+    for key, row in sorted(staged.items()):
+        row_hash = row_fingerprint(row['part_price'], row.get('short_desc'))
+        if key in existing and existing[key][0] == row_hash:
+            continue
+        written.append(row)
+        _, old_price, old_updatedat = existing.get(key, (None, None, None))
+        changes.append((row['branch_id'], key in existing, old_price, row['part_price'], old_updatedat))
+        if old_price is None or round(float(old_price), 2) != round(float(row['part_price']), 2):
+            repriced.append(row)
+        values.append({
+            "part_number": row['part_number'],
+            "branch_id": row['branch_id'],
+            "part_price": row['part_price'],
+            "short_desc": row.get('short_desc'),
+            "row_hash": row_hash,
+            "createdat": current_datetime,
+            "updatedat": current_datetime,
+        })
 
-        existing_product = (
-            db.query(Product)
-            .filter(Product.part_number == validated_data['part_number'])
-            .filter(Product.branch_id == validated_data['branch_id'])
-            .first()
+    if values:
+        stmt = _insert_for(db)(Product).values(values)
+        # createdat is deliberately left out so existing rows keep it
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Product.part_number, Product.branch_id],
+            set_={
+                "part_price": stmt.excluded.part_price,
+                "short_desc": stmt.excluded.short_desc,
+                "row_hash": stmt.excluded.row_hash,
+                "updatedat": stmt.excluded.updatedat,
+            },
         )
-        
-        # require to set createdat and updatedat col values
-        current_datetime = datetime.utcnow()
-
-        if existing_product:
-            # Remove id from validated_data to prevent updating the id
-            validated_data.pop('id', None)
-            
-            # Update existing record
-            for key, value in validated_data.items():
-                if key not in ['createdat', 'updatedat']:
-                    setattr(existing_product, key, value)
-            existing_product.updatedat = current_datetime
-        else:
-            # Insert new record along with createdat and updatedat
-            validated_data['createdat'] = current_datetime
-            validated_data['updatedat'] = current_datetime
-            db_product = Product(**validated_data)
-            # After creating the Product object, it is added to the SQLAlchemy session (db)
-            db.add(db_product)
+        db.execute(stmt)
+        # the prices of new products and price changes, valid from the updatedat just written
+        record_price_changes(db, repriced, current_datetime)
+        _record_branch_changes(db, changes, current_datetime)
+
+    updated = sum(1 for row in written if (row['part_number'], row['branch_id']) in existing)
+    report = {
+        "rows": len(chunk),
+        "inserted": len(written) - updated,
+        "updated": updated,
+        "unchanged": len(staged) - len(written),
+    }
+    return report, written
+
+
+def upsert_products(
+    db: Session,
+    rows: Iterable[dict],
+    chunk_size: int = UPSERT_CHUNK_SIZE,
+    on_chunk: Optional[Callable[[List[dict], dict], None]] = None,
+) -> List[dict]:
+    """Insert or update products in set-based chunks keyed on (part_number, branch_id).
+
+    Each chunk is applied with one INSERT ... ON CONFLICT DO UPDATE statement backed by
+    the `ix_part_number_branch_id` unique index. Rows identical to the stored product
+    are skipped. The caller owns the transaction.
+
+    Args:
+        db: SQLAlchemy session object.
+        rows: Validated product dictionaries.
+        chunk_size: Maximum number of rows per statement. Defaults to UPSERT_CHUNK_SIZE.
+        on_chunk: Called with the written rows and the report of every chunk.
+
+    Returns:
+        A report per chunk with the number of rows, inserted, updated and unchanged products.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer")
+
+    reports = []
+    for index, chunk in enumerate(_chunked(rows, chunk_size)):
+        report, written = _upsert_chunk(db, chunk)
+        report["chunk"] = index
+        logger.info("Upserted chunk %s: %s", index, report)
+        reports.append(report)
+        if on_chunk is not None:
+            on_chunk(written, report)
+    return reports
+
+
+def insert_products_from_csv(db: Session, content: str, chunk_size: int = UPSERT_CHUNK_SIZE) -> List[dict]:
+    """Insert or update the products table from a CSV. 
+    If the record already available then need to update, otherwise, it will be a new record and insert.
+
+    Args:
+        db: SQLAlchemy session object.
+        content: CSV content as a string.
+        chunk_size: Number of rows applied per bulk upsert statement.
+
+    Returns:
+        The per chunk report of inserted and updated counts. Invalid rows are
+        skipped and logged.
+    """
+    reader = csv.reader(io.StringIO(content.strip()))
+    # headers are matched case-insensitively, e.g. PART_NUMBER or part_number
+    header = normalize_header(next(reader, []))
+    rejected = []
+
+    def validated_rows():
+        for columns in iter_column_batches(reader, header, chunk_size):
+            rows, batch_rejected = validate_batch(columns)
+            rejected.extend(batch_rejected)
+            yield from rows
 
     try:
+        reports = upsert_products(db, validated_rows(), chunk_size=chunk_size)
         db.commit()
+        refresh_stale(db)
     except IntegrityError as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Integrity error during commit: {str(e)}")
-
-
+    for reject in rejected:
+        logger.warning("Rejected CSV line %s: %s", reject["line"], reject["reason"])
+    return reports
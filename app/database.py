@@ -1,18 +1,46 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session, declarative_base
 import os
 from dotenv import load_dotenv
 
+from db_pool import capped_pool_options
+
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 load_dotenv(os.path.join(BASE_DIR, ".env"))
 DB_URI = os.getenv("DB_URI")
+# Connections all web worker processes of one server may hold together, 0 keeps SQLAlchemy's pool sizes
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "60"))
+# Web worker processes sharing DB_MAX_CONNECTIONS, set by gunicorn.conf.py
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
 
 # Update the DATABASE_URL to use PostgreSQL
 DATABASE_URL = DB_URI.replace("postgres://", "postgresql://")
-engine = create_engine(DATABASE_URL)
+# every process has a sync and an async engine
+engine = create_engine(DATABASE_URL, **capped_pool_options(DATABASE_URL, DB_MAX_CONNECTIONS, WEB_CONCURRENCY, 2))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def async_database_url(url: str) -> str:
+    """Maps a synchronous database URL to its asyncio driver (asyncpg or aiosqlite)."""
+    for prefix, async_prefix in (
+        ("postgresql+psycopg2://", "postgresql+asyncpg://"),
+        ("postgresql://", "postgresql+asyncpg://"),
+        ("sqlite://", "sqlite+aiosqlite://"),
+    ):
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return url
+
+
+# asyncio engine used by the read endpoints so a worker can overlap many queries
+ASYNC_DATABASE_URL = async_database_url(DATABASE_URL)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, **capped_pool_options(ASYNC_DATABASE_URL, DB_MAX_CONNECTIONS, WEB_CONCURRENCY, 2)
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -41,17 +69,12 @@ def get_db():
         db.close()
         
         
-def get_db_graphql():
-    """In the context of FastAPI and dependency injection, when a route function depends on get_db, 
-    FastAPI will execute get_db() to get a database session (db). 
-    Using yield db allows FastAPI to provide the database session to the route function and ensure that 
-    the session is properly closed (db.close()) after the route function finishes its execution.
+async def get_async_db():
+    """Async counterpart of get_db, yields an AsyncSession that is closed after the request.
 
     Yields:
-        _type_: _description_
+        AsyncSession: the database session
     """
-    db = SessionLocal()
-    try:
-        return db
-    finally:
-        db.close()
\ No newline at end of file
+    async with AsyncSessionLocal() as db:
+        yield db
+
@@ -0,0 +1,209 @@
+# db_pool.py
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# Pool settings, keep pool size + overflow times processes under Postgres max_connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+
+class PoolMetrics:
+    """Counters describing how busy a connection pool is."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_checkout(self, waited: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    metrics: Optional[PoolMetrics] = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            if self.metrics:
+                self.metrics.record_timeout()
+            raise
+        if self.metrics:
+            self.metrics.record_checkout(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        # dispose() swaps in a new pool, keep counting into the same metrics
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+def _in_memory(url: str) -> bool:
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")
+
+
+def pool_options(url: str) -> dict:
+    """Returns the create_engine pool keyword arguments for `url`.
+
+    In-memory SQLite databases live inside a single connection and keep
+    SQLAlchemy's default pool.
+    """
+    if _in_memory(url):
+        return {}
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def capped_pool_options(url: str, max_connections: int, processes: int, engines: int = 1) -> dict:
+    """Returns pool_size and max_overflow of one engine of `processes` processes with `engines` engines each,
+    so that all of them together open at most `max_connections` connections.
+
+    A third of the share of an engine is overflow, closed again once the burst is over. Empty, i.e.
+    SQLAlchemy's defaults, when `max_connections` is 0 and for in-memory SQLite.
+    """
+    if max_connections <= 0 or _in_memory(url):
+        return {}
+    share = max(max_connections // (max(processes, 1) * engines), 1)
+    max_overflow = share // 3
+    return {"pool_size": share - max_overflow, "max_overflow": max_overflow}
+
+
+class EngineRegistry:
+    """Per-process registry of engines and session factories keyed by database URL.
+
+    Engines are created lazily on first use and reused by every task of the
+    process. A registry inherited through fork() drops the parent's engines
+    without closing their sockets, which still belong to the parent.
+    """
+
+    def __init__(self, default_url: str):
+        self.default_url = default_url
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._engines: Dict[str, Engine] = {}
+        self._sessionmakers: Dict[str, sessionmaker] = {}
+        self._metrics: Dict[str, PoolMetrics] = {}
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            self.reset_after_fork()
+
+    def reset_after_fork(self):
+        """Forgets the engines inherited from the parent process."""
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose(close=False)
+            self._engines.clear()
+            self._sessionmakers.clear()
+            self._metrics.clear()
+            self._pid = os.getpid()
+
+    def get_engine(self, url: Optional[str] = None) -> Engine:
+        """Returns the engine of `url`, creating it on first use.
+
+        Args:
+            url: Database URL. Defaults to the registry's default URL.
+        """
+        url = url or self.default_url
+        self._check_fork()
+        engine = self._engines.get(url)
+        if engine is not None:
+            return engine
+
+        with self._lock:
+            if url not in self._engines:
+                engine = create_engine(url, **pool_options(url))
+                metrics = PoolMetrics()
+                if isinstance(engine.pool, InstrumentedQueuePool):
+                    engine.pool.metrics = metrics
+                event.listen(engine, "connect", lambda *args: metrics.record_connect())
+                self._metrics[url] = metrics
+                self._sessionmakers[url] = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+                self._engines[url] = engine
+            return self._engines[url]
+
+    def session(self, url: Optional[str] = None) -> Session:
+        """Returns a new session bound to the pooled engine of `url`."""
+        url = url or self.default_url
+        self.get_engine(url)
+        return self._sessionmakers[url]()
+
+    def dispose_all(self):
+        """Closes every pooled connection of this process."""
+        with self._lock:
+            for url, engine in self._engines.items():
+                logger.info("Disposing engine pool: %s", self._stats(url, engine))
+                engine.dispose()
+            self._engines.clear()
+            self._sessionmakers.clear()
+            self._metrics.clear()
+
+    def _stats(self, url: str, engine: Engine) -> dict:
+        stats = {"url": engine.url.render_as_string(hide_password=True), "pid": self._pid}
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+                "checked_in": pool.checkedin(),
+            })
+        stats.update(self._metrics[url].as_dict())
+        return stats
+
+    def stats(self) -> list:
+        """Returns pool occupancy and checkout metrics for every engine of this process."""
+        self._check_fork()
+        with self._lock:
+            return [self._stats(url, engine) for url, engine in self._engines.items()]
@@ -0,0 +1,102 @@
+# export.py
+"""Streamed catalog export for GET /products/export.
+
+Rows are read with a server-side cursor in partitions of EXPORT_BATCH_SIZE and
+encoded and optionally gzip compressed partition by partition, so memory stays
+constant whatever the size of the catalog.
+"""
+import csv
+import io
+import os
+import zlib
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import select
+
+from crud import PRODUCT_FIELDS, product_columns
+from cache import dumps
+from database import AsyncSessionLocal
+from models import Product
+from price_history import naive_utc
+
+
+# Rows fetched from the cursor and encoded per chunk
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+# Seconds an incremental export looks back before updated_since. updatedat is stamped before a
+# batch commits, so a concurrent upload can commit rows older than the previous export's watermark
+# after that export read the table; the next export repeats the rows of this window instead.
+EXPORT_WATERMARK_MARGIN = float(os.getenv("EXPORT_WATERMARK_MARGIN", "60"))
+# zlib level of gzip exports, 1 to 9, speed matters more than ratio for a stream
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "5"))
+
+
+class ExportFormat(str, Enum):
+    """Export formats; csv has the upload header, so an export can be uploaded again"""
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv; charset=utf-8",
+}
+
+
+def export_statement(branch_id: Optional[str] = None, updated_since: Optional[datetime] = None):
+    """Products of the export in id order, optionally of one branch or updated around or after `updated_since`."""
+    stmt = select(*product_columns()).order_by(Product.id)
+    if branch_id:
+        stmt = stmt.where(Product.branch_id == branch_id)
+    if updated_since is not None:
+        # updatedat is stored as naive UTC, see EXPORT_WATERMARK_MARGIN for the look-back
+        since = naive_utc(updated_since) - timedelta(seconds=EXPORT_WATERMARK_MARGIN)
+        stmt = stmt.where(Product.updatedat >= since)
+    return stmt
+
+
+def _encode_ndjson(rows: list) -> bytes:
+    return b"".join(dumps(dict(zip(PRODUCT_FIELDS, row))) + b"\n" for row in rows)
+
+
+def _encode_csv(rows: list) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(
+        [value.isoformat() if isinstance(value, datetime) else value for value in row] for row in rows
+    )
+    return buffer.getvalue().encode()
+
+
+async def iter_export(
+    export_format: ExportFormat,
+    branch_id: Optional[str] = None,
+    updated_since: Optional[datetime] = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    session_factory=AsyncSessionLocal,
+) -> AsyncIterator[bytes]:
+    """Yields the encoded export, one chunk per partition of `batch_size` rows.
+
+    The session is opened here rather than by a request dependency because it
+    has to stay open until the last row has been sent.
+    """
+    encode = _encode_ndjson if export_format == ExportFormat.ndjson else _encode_csv
+    if export_format == ExportFormat.csv:
+        yield _encode_csv([PRODUCT_FIELDS])
+
+    stmt = export_statement(branch_id, updated_since).execution_options(yield_per=batch_size)
+    async with session_factory() as db:
+        result = await db.stream(stmt)
+        async for rows in result.partitions():
+            yield encode(rows)
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes], level: int = EXPORT_GZIP_LEVEL) -> AsyncIterator[bytes]:
+    """Compresses a byte stream into one gzip member, flushing once per chunk."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,112 @@
+# graphql_limits.py
+"""Depth and cost limits of GraphQL documents, checked before any resolver runs.
+
+starlette-graphene3 does not take extra validation rules, so the limits are
+applied by the execution context class passed to GraphQLApp. The cost of a
+field is 1 plus the cost of its selections, multiplied by the page size for
+list fields, so `products(limit: 1000) { id partNumber }` costs 2001.
+"""
+import os
+from typing import Any, Dict, Optional
+
+from graphene.validation import depth_limit_validator
+from graphql import GraphQLError, validate
+from graphql.execution import ExecutionContext
+from graphql.language import (
+    FieldNode, FragmentSpreadNode, InlineFragmentNode, IntValueNode, SelectionSetNode, VariableNode,
+)
+
+
+# Deepest selection accepted, introspection fields are not counted
+GRAPHQL_MAX_DEPTH = int(os.getenv("GRAPHQL_MAX_DEPTH", "5"))
+# Highest document cost accepted
+GRAPHQL_MAX_COST = int(os.getenv("GRAPHQL_MAX_COST", "10000"))
+
+# Page size of the root list fields when the document does not pass a limit
+LIST_FIELDS = {"products": 10, "productsPage": 10}
+# Arguments turning `products` into a single row lookup
+EXACT_LOOKUP_ARGUMENTS = {"partNumber", "branchId"}
+
+_depth_limit = depth_limit_validator(max_depth=GRAPHQL_MAX_DEPTH)
+
+
+def _argument(node: FieldNode, name: str, variables: Dict[str, Any]) -> Any:
+    for argument in node.arguments or ():
+        if argument.name.value != name:
+            continue
+        if isinstance(argument.value, VariableNode):
+            return variables.get(argument.value.name.value)
+        if isinstance(argument.value, IntValueNode):
+            return int(argument.value.value)
+        return getattr(argument.value, "value", None)
+    return None
+
+
+def _multiplier(node: FieldNode, variables: Dict[str, Any]) -> int:
+    name = node.name.value
+    if name not in LIST_FIELDS:
+        return 1
+    arguments = {argument.name.value for argument in node.arguments or ()}
+    if name == "products" and EXACT_LOOKUP_ARGUMENTS <= arguments:
+        return 1
+    limit = _argument(node, "limit", variables)
+    try:
+        return max(int(limit), 1) if limit is not None else LIST_FIELDS[name]
+    except (TypeError, ValueError):
+        return LIST_FIELDS[name]
+
+
+def selection_cost(
+    selection_set: Optional[SelectionSetNode],
+    fragments: Dict[str, Any],
+    variables: Dict[str, Any],
+    visited: frozenset = frozenset(),
+    root: bool = True,
+) -> int:
+    """Cost of a selection set, fragments expanded.
+
+    Args:
+        selection_set: Selections of an operation or field.
+        fragments: Fragment definitions of the document by name.
+        variables: Raw variable values of the request.
+        visited: Fragments being expanded, guards against cycles.
+        root: The selections are root fields, the only ones with a page size.
+    """
+    if selection_set is None:
+        return 0
+    cost = 0
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            if selection.name.value.startswith("__"):
+                continue
+            children = selection_cost(selection.selection_set, fragments, variables, visited, root=False)
+            cost += 1 + (_multiplier(selection, variables) if root else 1) * children
+        elif isinstance(selection, InlineFragmentNode):
+            cost += selection_cost(selection.selection_set, fragments, variables, visited, root)
+        elif isinstance(selection, FragmentSpreadNode):
+            name = selection.name.value
+            if name in fragments and name not in visited:
+                cost += selection_cost(fragments[name].selection_set, fragments, variables, visited | {name}, root)
+    return cost
+
+
+class LimitedExecutionContext(ExecutionContext):
+    """Execution context rejecting documents deeper than GRAPHQL_MAX_DEPTH or costlier than GRAPHQL_MAX_COST."""
+
+    @classmethod
+    def build(cls, schema, document, root_value=None, context_value=None, raw_variable_values=None,
+              operation_name=None, *args, **kwargs):
+        errors = validate(schema, document, [_depth_limit])
+        if errors:
+            return errors
+
+        context = super().build(
+            schema, document, root_value, context_value, raw_variable_values, operation_name, *args, **kwargs
+        )
+        if isinstance(context, list):
+            return context
+
+        cost = selection_cost(context.operation.selection_set, context.fragments, raw_variable_values or {})
+        if cost > GRAPHQL_MAX_COST:
+            return [GraphQLError(f"Query cost {cost} exceeds the maximum of {GRAPHQL_MAX_COST}")]
+        return context
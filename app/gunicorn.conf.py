@@ -0,0 +1,58 @@
+# gunicorn.conf.py
+"""Production web server: gunicorn managing uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+WEB_CONCURRENCY workers (the CPU count by default) share DB_MAX_CONNECTIONS,
+see database.py. Each worker is restarted after about WEB_MAX_REQUESTS requests
+to bound memory growth, the jitter keeps them from restarting together.
+"""
+import multiprocessing
+import os
+import tempfile
+
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY") or multiprocessing.cpu_count())
+worker_class = "serving.UvloopWorker"
+
+# Import the app once in the master, workers start faster and share its memory pages
+preload_app = os.getenv("WEB_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("WEB_MAX_REQUESTS_JITTER", str(max_requests // 10)))
+# Seconds a silent worker lives before it is killed, and a recycled one has to finish its requests
+timeout = int(os.getenv("WEB_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+
+accesslog = os.getenv("WEB_ACCESS_LOG") or None
+errorlog = "-"
+
+# read by database.py to size the pools of every worker
+os.environ["WEB_CONCURRENCY"] = str(workers)
+# /metrics of any worker has to aggregate the samples of all of them
+if workers > 1:
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "prometheus-web"))
+# the preloaded app imports metrics, which writes its samples there, before on_starting runs
+if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def on_starting(server):
+    from metrics import clear_multiprocess_dir
+
+    clear_multiprocess_dir()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from serving import reset_after_fork
+
+        reset_after_fork()
+
+
+def child_exit(server, worker):
+    from metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
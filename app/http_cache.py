@@ -0,0 +1,97 @@
+# http_cache.py
+"""Conditional GET support of the product read endpoints.
+
+A product response only changes when an upload commits, which bumps the
+catalog version, so a strong ETag is the catalog version plus a hash of the
+request's cache key. Last-Modified is the latest updatedat of the catalog or
+the time of the last bump, whichever is later, loaded once per catalog version
+through the product cache. Revalidations are answered with a 304 from these
+values without reading the products table.
+
+While Redis cannot be read the catalog version may be stale, responses then
+carry no validators and are marked `no-cache`.
+"""
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import Request
+from starlette.responses import Response
+
+from cache import product_cache
+from crud import get_last_modified_async
+
+
+# Cache-Control of cacheable product responses, the edge proxy revalidates after s-maxage
+PRODUCT_CACHE_CONTROL = os.getenv("PRODUCT_CACHE_CONTROL", "public, max-age=0, s-maxage=5")
+
+
+async def _last_modified(db: AsyncSession) -> Optional[datetime]:
+    async def load():
+        updated = await get_last_modified_async(db)
+        if updated is not None and updated.tzinfo is None:
+            # updatedat is stored as naive UTC
+            updated = updated.replace(tzinfo=timezone.utc)
+        modified = await product_cache.catalog_modified()
+        if modified is not None:
+            bumped = datetime.fromtimestamp(modified, timezone.utc)
+            updated = max(updated, bumped) if updated is not None else bumped
+        return updated.timestamp() if updated is not None else None
+
+    timestamp = await product_cache.get_or_load("last_modified", load)
+    return datetime.fromtimestamp(timestamp, timezone.utc) if timestamp is not None else None
+
+
+async def validators(key: str, db: AsyncSession) -> dict:
+    """Caching headers of the product response identified by a product cache key.
+
+    Args:
+        key: Product cache key of the request, e.g. list_key or item_key.
+        db: Session used once per catalog version to read the latest updatedat.
+
+    Returns:
+        ETag, Last-Modified and Cache-Control headers, only `Cache-Control: no-cache`
+        while the catalog version is unknown.
+    """
+    version = await product_cache.catalog_version(strict=True)
+    if version is None:
+        return {"Cache-Control": "no-cache"}
+
+    digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+    headers = {"ETag": f'"{version}-{digest}"', "Cache-Control": PRODUCT_CACHE_CONTROL}
+    last_modified = await _last_modified(db)
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    return headers
+
+
+def is_not_modified(request: Request, headers: dict) -> bool:
+    """Evaluates If-None-Match, or without it If-Modified-Since, against the response headers."""
+    etag = headers.get("ETag")
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag is None:
+            return False
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        # If-None-Match uses the weak comparison
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and "Last-Modified" in headers:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP dates have a resolution of one second
+        return parsedate_to_datetime(headers["Last-Modified"]) <= since
+    return False
+
+
+def not_modified(headers: dict) -> Response:
+    """304 response carrying the validators and Cache-Control of the full response."""
+    return Response(status_code=304, headers=headers)
@@ -0,0 +1,519 @@
+# ingest.py
+import csv
+import hashlib
+import io
+import os
+import time
+import uuid
+import zlib
+from enum import Enum
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from fastapi import UploadFile
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from branch_stats import rebuild as rebuild_branch_stats
+from crud import row_fingerprint, upsert_products
+from price_history import ensure_partitions
+from throttle import IngestThrottle
+from validation import Quarantine, iter_column_batches, normalize_header, validate_batch
+import logging
+
+
+# Used from both the web and the celery side, which configure logging themselves
+logger = logging.getLogger(__name__)
+
+# Directory shared by the web and celery containers for uploaded CSV files
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads"))
+# Modes of the spool directory and of the spooled files, octal. The workers run as another
+# user (--uid=nobody): they reach the spool through a group shared with the web process, the
+# setgid bit gives every spooled file that group, and they delete the uploads and write the
+# quarantine and shard files next to them.
+UPLOAD_DIR_MODE = int(os.getenv("UPLOAD_DIR_MODE", "2775"), 8)
+UPLOAD_FILE_MODE = int(os.getenv("UPLOAD_FILE_MODE", "664"), 8)
+# Bytes copied from the request body per read
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Rows validated, upserted and committed together by the worker
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", os.getenv("UPSERT_CHUNK_SIZE", "1000")))
+# Upper bound for the number of shards a single upload may be split into
+MAX_INGEST_SHARDS = int(os.getenv("MAX_INGEST_SHARDS", "32"))
+# Bytes handed to COPY FROM STDIN per read
+COPY_BUFFER_SIZE = int(os.getenv("COPY_BUFFER_SIZE", str(256 * 1024)))
+
+
+class IngestMode(str, Enum):
+    """How an upload is applied to the products table."""
+
+    # validated batches upserted and committed one at a time, optionally sharded
+    batch = "batch"
+    # COPY into an unlogged staging table, then one set-based upsert
+    merge = "merge"
+    # like merge, then delete the products missing from the file
+    replace = "replace"
+
+
+async def spool_upload(file: UploadFile, directory: str = UPLOAD_DIR, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """Copies an uploaded file to the spool directory in fixed-size chunks.
+
+    The file is written under a temporary name and renamed once complete, so a
+    worker never sees a partially written upload. The blocking file calls run
+    in the threadpool, chunk by chunk.
+
+    Args:
+        file: The uploaded file.
+        directory: Spool directory, shared with the celery workers.
+        chunk_size: Number of bytes read and written at a time.
+
+    Returns:
+        The path of the spooled file.
+    """
+    # every file system call runs in the threadpool, the event loop keeps serving requests
+    await run_in_threadpool(_make_spool_dir, directory)
+    path = os.path.join(directory, f"{uuid.uuid4().hex}.csv")
+    partial_path = f"{path}.part"
+
+    try:
+        spool = await run_in_threadpool(_open_spool_file, partial_path)
+        try:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                await run_in_threadpool(spool.write, chunk)
+        finally:
+            await run_in_threadpool(spool.close)
+        await run_in_threadpool(os.replace, partial_path, path)
+    except Exception:
+        await run_in_threadpool(remove_if_exists, partial_path)
+        raise
+    return path
+
+
+def _make_spool_dir(directory: str):
+    os.makedirs(directory, exist_ok=True)
+    # makedirs applies the umask, and a directory of another owner, e.g. a mounted volume, is left as is
+    if os.stat(directory).st_uid == os.geteuid():
+        os.chmod(directory, UPLOAD_DIR_MODE)
+
+
+def _open_spool_file(path: str):
+    spool = open(path, "wb")
+    # the mode given at creation would be narrowed by the umask
+    os.fchmod(spool.fileno(), UPLOAD_FILE_MODE)
+    return spool
+
+
+def remove_if_exists(path: str):
+    """Deletes a spooled file, e.g. one no task was queued for."""
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def file_digest(path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """SHA-256 of a spooled file, read in chunks, used to recognise re-uploaded files."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def iter_csv_rows(path: str) -> Iterator[dict]:
+    """Lazily reads a CSV file into row dictionaries keyed by the lower-cased header.
+
+    Args:
+        path: Path of the CSV file.
+
+    Yields:
+        One dictionary per non-empty data row.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = [column.strip().lower() for column in next(reader, [])]
+        for data in reader:
+            if not any(value.strip() for value in data):
+                continue
+            yield dict(zip(header, (value.strip() for value in data)))
+
+
+def ingest_file(
+    db: Session,
+    path: str,
+    batch_size: int = INGEST_BATCH_SIZE,
+    on_batch: Optional[Callable[[List[dict], dict], None]] = None,
+    on_commit: Optional[Callable[[dict], None]] = None,
+    start_batch: int = 0,
+    throttle: Optional[IngestThrottle] = None,
+) -> List[dict]:
+    """Streams a spooled CSV file into the products table one batch at a time.
+
+    Every batch is upserted and committed before the next one is read, so memory
+    use is bounded by the batch size rather than the file size. Rows failing
+    validation are quarantined to `<path>.rejected.csv` with their line number
+    and reason instead of failing the upload. Batches are cut the same way on
+    every read of a file, so an interrupted ingestion resumes with `start_batch`
+    set to the number of committed batches.
+
+    Args:
+        db: SQLAlchemy session object.
+        path: Path of the spooled CSV file.
+        batch_size: Number of rows per upsert and commit.
+        on_batch: Called with the inserted and updated rows and the report of every
+            batch that wrote any, once it is committed.
+        on_commit: Called with the report of every batch once it is committed.
+        start_batch: Index of the first batch to apply, earlier batches are skipped
+            without being validated.
+        throttle: Paces the batches by the time they take to write and the
+            replication lag, see throttle.py. Not throttled by default.
+
+    Returns:
+        A report per committed batch with the number of valid rows, inserted,
+        updated, unchanged and rejected products.
+    """
+    reports = []
+    with open(path, newline="", encoding="utf-8") as f, Quarantine(path, append=start_batch > 0) as quarantine:
+        reader = csv.reader(f)
+        header = normalize_header(next(reader, []))
+        for index, columns in enumerate(iter_column_batches(reader, header, batch_size)):
+            if index < start_batch:
+                continue
+            batch, rejected = validate_batch(columns)
+            written = []
+            if batch:
+                started = time.perf_counter()
+                report = upsert_products(
+                    db, batch, chunk_size=batch_size, on_chunk=lambda rows, _: written.extend(rows)
+                )[0]
+                db.commit()
+                elapsed = time.perf_counter() - started
+                report.pop("chunk")
+            else:
+                report = {"rows": 0, "inserted": 0, "updated": 0, "unchanged": 0}
+            # quarantined after the commit so a retried batch is not quarantined twice
+            quarantine.write(rejected)
+            report["rejected"] = len(rejected)
+            report["batch"] = index
+            logger.info("Committed batch %s of %s: %s", index, path, report)
+            reports.append(report)
+            if on_batch is not None and written:
+                on_batch(written, report)
+            if on_commit is not None:
+                on_commit(report)
+            if throttle is not None and batch:
+                throttle.pause(db, elapsed)
+
+    if quarantine.count:
+        logger.warning("Quarantined %s rejected rows of %s in %s", quarantine.count, path, quarantine.path)
+    return reports
+
+
+def count_data_rows(path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> int:
+    """Counts the lines after the header of a CSV file, the row estimate behind the ETA."""
+    lines, last = 0, b"\n"
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            lines += chunk.count(b"\n")
+            last = chunk[-1:]
+    if last != b"\n":
+        lines += 1
+    return max(lines - 1, 0)
+
+
+# Counters of an ingestion job, summed over its batches
+PROGRESS_COUNTERS = ("rows", "inserted", "updated", "unchanged", "rejected")
+
+
+class IngestProgress:
+    """Running counters, throughput and ETA of an ingestion job.
+
+    A snapshot is the checkpoint of the job: it holds the number of committed
+    batches and the time spent so far, and a retried job continues from it.
+    """
+
+    def __init__(self, total_rows: int, checkpoint: Optional[dict] = None):
+        checkpoint = checkpoint or {}
+        self.total_rows = total_rows
+        self.counters = {key: checkpoint.get(key, 0) for key in PROGRESS_COUNTERS}
+        self.batches = checkpoint.get("batches", 0)
+        self.attempts = checkpoint.get("attempts", 0) + 1
+        self._elapsed_before = checkpoint.get("elapsed", 0.0)
+        self._started = time.monotonic()
+
+    def add(self, report: dict):
+        """Adds the counts of a committed batch or streamed chunk."""
+        for key in PROGRESS_COUNTERS:
+            self.counters[key] += report.get(key, 0)
+        self.batches = report.get("batch", self.batches - 1) + 1
+
+    def snapshot(self) -> dict:
+        """Counters with rows processed, rows per second and the ETA in seconds."""
+        elapsed = self._elapsed_before + time.monotonic() - self._started
+        processed = self.counters["rows"] + self.counters["rejected"]
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total_rows - processed, 0)
+        return {
+            **self.counters,
+            "batches": self.batches,
+            "processed": processed,
+            "total_rows": self.total_rows,
+            "attempts": self.attempts,
+            "elapsed": round(elapsed, 3),
+            "rows_per_second": round(rate, 1),
+            "eta_seconds": round(remaining / rate, 1) if rate else None,
+        }
+
+
+def shard_for(part_number: str, branch_id: str, shards: int) -> int:
+    """Returns the shard of a (part_number, branch_id) key.
+
+    The hash is stable across processes, so every row of a key lands in the same
+    shard and no two shard tasks ever write the same product.
+    """
+    return zlib.crc32(f"{branch_id}\x1f{part_number}".encode("utf-8")) % shards
+
+
+def split_csv(path: str, shards: int) -> Dict[str, object]:
+    """Splits a spooled CSV file into key-aware shard files next to it.
+
+    Rows keep their relative order inside a shard, so the last occurrence of a
+    duplicated key still wins. Rows without a part_number or branch_id cannot be
+    routed and are rejected.
+
+    Args:
+        path: Path of the spooled CSV file.
+        shards: Number of shards to split into.
+
+    Returns:
+        The paths of the non-empty shard files and the number of rejected rows.
+    """
+    if not 1 <= shards <= MAX_INGEST_SHARDS:
+        raise ValueError(f"shards must be between 1 and {MAX_INGEST_SHARDS}")
+
+    shard_paths = [f"{path}.shard{index}" for index in range(shards)]
+    files = [open(shard_path, "w", newline="", encoding="utf-8") for shard_path in shard_paths]
+    counts = [0] * shards
+    rejected = 0
+    try:
+        writers = [csv.writer(f) for f in files]
+        with open(path, newline="", encoding="utf-8") as source:
+            reader = csv.reader(source)
+            header = [column.strip().lower() for column in next(reader, [])]
+            for writer in writers:
+                writer.writerow(header)
+
+            for data in reader:
+                if not any(value.strip() for value in data):
+                    continue
+                row = dict(zip(header, (value.strip() for value in data)))
+                if not row.get("part_number") or not row.get("branch_id"):
+                    rejected += 1
+                    continue
+                index = shard_for(row["part_number"], row["branch_id"], shards)
+                writers[index].writerow(data)
+                counts[index] += 1
+    finally:
+        for f in files:
+            f.close()
+
+    non_empty = []
+    for shard_path, count in zip(shard_paths, counts):
+        if count:
+            non_empty.append(shard_path)
+        else:
+            os.remove(shard_path)
+    if rejected:
+        logger.warning("Rejected %s rows without part_number or branch_id in %s", rejected, path)
+    return {"shards": non_empty, "rejected": rejected}
+
+
+# Staging table columns, `seq` keeps the file order so the last occurrence of a key wins
+STAGING_COLUMNS = ("seq", "part_number", "branch_id", "part_price", "short_desc", "row_hash")
+
+MERGE_STAGING_SQL = """
+WITH staged AS (
+    SELECT DISTINCT ON (part_number, branch_id) part_number, branch_id, part_price, short_desc, row_hash
+    FROM {staging}
+    ORDER BY part_number, branch_id, seq DESC
+), history AS (
+    -- new products and price changes, read from the products rows before the upsert
+    INSERT INTO product_price_history (part_number, branch_id, part_price, valid_from)
+    SELECT s.part_number, s.branch_id, s.part_price, now() AT TIME ZONE 'utc'
+    FROM staged AS s
+    LEFT JOIN products AS p ON p.part_number = s.part_number AND p.branch_id = s.branch_id
+    WHERE round(p.part_price::numeric, 2) IS DISTINCT FROM round(s.part_price, 2)
+), upserted AS (
+    INSERT INTO products AS p (part_number, branch_id, part_price, short_desc, row_hash, createdat, updatedat)
+    SELECT part_number, branch_id, part_price, short_desc, row_hash,
+        now() AT TIME ZONE 'utc', now() AT TIME ZONE 'utc'
+    FROM staged
+    ON CONFLICT (part_number, branch_id) DO UPDATE SET
+        part_price = EXCLUDED.part_price,
+        short_desc = EXCLUDED.short_desc,
+        row_hash = EXCLUDED.row_hash,
+        updatedat = EXCLUDED.updatedat
+    -- unchanged products are neither rewritten nor returned
+    WHERE p.row_hash IS DISTINCT FROM EXCLUDED.row_hash
+    RETURNING (xmax = 0) AS inserted
+)
+SELECT
+    (SELECT count(*) FROM upserted WHERE inserted),
+    (SELECT count(*) FROM upserted WHERE NOT inserted),
+    (SELECT count(*) FROM staged) - (SELECT count(*) FROM upserted)
+"""
+
+
+DELETE_MISSING_SQL = """
+DELETE FROM products AS p
+WHERE NOT EXISTS (
+    SELECT 1 FROM {staging} AS s
+    WHERE s.part_number = p.part_number AND s.branch_id = p.branch_id
+)
+"""
+
+
+class CopyStream:
+    """Read-only file object over an iterator of byte chunks, as consumed by COPY FROM STDIN."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+def iter_copy_chunks(
+    path: str,
+    quarantine: Quarantine,
+    counts: dict,
+    batch_size: int = INGEST_BATCH_SIZE,
+    on_chunk: Optional[Callable[[dict], None]] = None,
+) -> Iterator[bytes]:
+    """Validates a CSV file batch by batch and encodes the valid rows for COPY in CSV format.
+
+    Args:
+        path: Path of the spooled CSV file.
+        quarantine: Receives the rejected rows.
+        counts: Updated in place with the number of valid and rejected rows.
+        batch_size: Rows validated per batch.
+        on_chunk: Called with the valid and rejected counts of every batch.
+
+    Yields:
+        One chunk of CSV encoded staging rows per batch.
+    """
+    counts.setdefault("rows", 0)
+    counts.setdefault("rejected", 0)
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = normalize_header(next(reader, []))
+        for columns in iter_column_batches(reader, header, batch_size):
+            rows, rejected = validate_batch(columns)
+            quarantine.write(rejected)
+            counts["rejected"] += len(rejected)
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator="\n")
+            for row in rows:
+                counts["rows"] += 1
+                # an unquoted empty field is NULL in COPY's CSV format
+                writer.writerow((
+                    counts["rows"], row["part_number"], row["branch_id"], row["part_price"], row["short_desc"],
+                    row_fingerprint(row["part_price"], row["short_desc"]),
+                ))
+            if on_chunk is not None:
+                on_chunk({"rows": len(rows), "rejected": len(rejected)})
+            if rows:
+                yield buffer.getvalue().encode("utf-8")
+
+
+def copy_file(
+    db: Session,
+    path: str,
+    mode: IngestMode = IngestMode.merge,
+    batch_size: int = INGEST_BATCH_SIZE,
+    on_progress: Optional[Callable[[dict], None]] = None,
+) -> dict:
+    """Bulk loads a spooled CSV file through a staging table with PostgreSQL COPY.
+
+    Validated rows are streamed with COPY FROM STDIN into an unlogged staging
+    table, then applied to products with one INSERT ... SELECT ... ON CONFLICT
+    statement that skips the products whose row_hash did not change and records
+    the new prices in the price history. The branch stats are rebuilt
+    afterwards. In replace
+    mode the products missing from the file are deleted by the same transaction,
+    so readers see either the old or the new catalog. The staging table is
+    created and dropped inside the transaction; the caller commits.
+
+    Args:
+        db: SQLAlchemy session object on a PostgreSQL database.
+        path: Path of the spooled CSV file.
+        mode: IngestMode.merge or IngestMode.replace.
+        batch_size: Rows validated per batch while streaming.
+        on_progress: Called with the valid and rejected counts of every streamed batch.
+
+    Returns:
+        The number of valid, inserted, updated, unchanged, deleted and rejected rows.
+
+    Raises:
+        ValueError: The database is not PostgreSQL, the mode is not a COPY mode,
+            or a replace would empty the catalog.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        raise ValueError("COPY ingestion requires PostgreSQL")
+    if mode not in (IngestMode.merge, IngestMode.replace):
+        raise ValueError(f"COPY ingestion does not support the {mode} mode")
+
+    staging = f"products_staging_{uuid.uuid4().hex[:12]}"
+    counts = {"rows": 0, "rejected": 0}
+    with Quarantine(path) as quarantine:
+        db.execute(text(
+            f"CREATE UNLOGGED TABLE {staging} ("
+            "seq bigint, part_number varchar(100), branch_id varchar(100), "
+            "part_price numeric, short_desc varchar(255), row_hash varchar(32))"
+        ))
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {staging} ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                CopyStream(iter_copy_chunks(path, quarantine, counts, batch_size, on_progress)),
+                size=COPY_BUFFER_SIZE,
+            )
+        finally:
+            cursor.close()
+
+    if mode == IngestMode.replace and not counts["rows"]:
+        raise ValueError(f"Refusing to replace the catalog with {path}, it has no valid rows")
+
+    db.execute(text(f"ANALYZE {staging}"))
+    ensure_partitions(db.get_bind().engine)
+    inserted, updated, unchanged = db.execute(text(MERGE_STAGING_SQL.format(staging=staging))).one()
+    deleted = 0
+    if mode == IngestMode.replace:
+        deleted = db.execute(text(DELETE_MISSING_SQL.format(staging=staging))).rowcount
+    db.execute(text(f"DROP TABLE {staging}"))
+    # the load writes no per row deltas, recompute every branch in the same transaction
+    rebuild_branch_stats(db)
+
+    report = {
+        "mode": mode.value,
+        **counts,
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": unchanged,
+        "deleted": deleted,
+    }
+    logger.info("Loaded %s with COPY: %s", path, report)
+    if quarantine.count:
+        logger.warning("Quarantined %s rejected rows of %s in %s", quarantine.count, path, quarantine.path)
+    return report
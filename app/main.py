@@ -1,13 +1,19 @@
 import logging
+from contextlib import asynccontextmanager
 from logging.handlers import TimedRotatingFileHandler
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from starlette_graphene3 import GraphQLApp, make_graphiql_handler
-from elasticsearch import Elasticsearch
 
-from database import Base, engine
+from cache import product_cache
+from database import async_engine, engine
+from graphql_limits import LimitedExecutionContext
+from metrics import MetricsMiddleware, instrument_sqlalchemy, metrics_payload, register_pool_collector
+from readiness import readiness
+from search_index import close_es
 import product
+import search
 
 # Configure logging with a rotating file handler
 logging.basicConfig(level=logging.ERROR)
@@ -17,17 +23,26 @@ formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(messag
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
-# FastAPI app
-app = FastAPI()
 
-# Elasticsearch
-es = Elasticsearch(hosts=["http://elasticsearch:9200"])
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup does no I/O: the engines, Redis and Elasticsearch clients connect on
+    first use, and the schema is managed by `python schema.py`, not by the web
+    processes. Shutdown releases the connections of this process."""
+    yield
+    await product_cache.close()
+    await async_engine.dispose()
+    engine.dispose()
+    close_es()
+
 
-# Create "products" index
-index_name = "products"
+# FastAPI app
+app = FastAPI(lifespan=lifespan)
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Prometheus instrumentation: statement timings, pool occupancy and request latency per route
+instrument_sqlalchemy()
+register_pool_collector(lambda: [("sync", engine), ("async", async_engine.sync_engine)])
+app.add_middleware(MetricsMiddleware)
 
 # CORS setup
 origins = [
@@ -45,12 +60,23 @@ app.add_middleware(
 # Include product router
 app.include_router(product.router)
 
-# Add GraphQL route using add_route method
+# Include Elasticsearch backed search router
+app.include_router(search.router)
+
+# Add GraphQL route using add_route method, documents over the depth and cost limits are rejected
 app.add_route("/graphql", GraphQLApp(
-    schema=product.Schema(query=product.Query),
-    on_get=make_graphiql_handler()
+    schema=product.schema,
+    on_get=make_graphiql_handler(),
+    context_value=product.graphql_context,
+    execution_context_class=LimitedExecutionContext
 ))
 
+# Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    payload, content_type = metrics_payload()
+    return Response(content=payload, media_type=content_type)
+
 # Health check endpoint
 @app.get("/")
 async def live():
@@ -60,11 +86,10 @@ async def live():
         logger.error("Error processing live check: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
-# Elasticsearch check endpoint
-@app.get("/search")
-async def search():
-    try:
-        return {"message": "Elasticsearch activated"}
-    except Exception as e:
-        logger.error("Error processing Elasticsearch check: %s", str(e))
-        raise HTTPException(status_code=500, detail=str(e))
+# Readiness endpoint, 503 while a required dependency is unavailable
+@app.get("/ready")
+async def ready(response: Response):
+    report = await readiness()
+    if not report["ready"]:
+        response.status_code = 503
+    return report
@@ -0,0 +1,300 @@
+# metrics.py
+"""Prometheus metrics shared by the web and worker processes.
+
+Web processes expose them on GET /metrics, celery workers on a side port
+(WORKER_METRICS_PORT). With PROMETHEUS_MULTIPROC_DIR set, every process writes
+its samples to that directory and the exposing process aggregates them, which
+is required for prefork celery workers and multi-process web servers.
+"""
+import json
+import os
+import re
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess,
+    start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# Port of the worker's metrics endpoint
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9808"))
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+# metrics without labels open their sample file below as soon as they are defined
+if MULTIPROCESS:
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+# Request latencies are in the milliseconds, bulk work takes seconds to minutes
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+TASK_BUCKETS = (.01, .1, .5, 1, 5, 15, 30, 60, 300, 900, 1800, 3600)
+THROUGHPUT_BUCKETS = (100, 500, 1000, 5000, 10000, 25000, 50000, 100000, 250000, 1000000)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+GRAPHQL_REQUEST_DURATION = Histogram(
+    "graphql_request_duration_seconds", "GraphQL request latency by operation",
+    ["operation"], buckets=LATENCY_BUCKETS,
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Database statement execution time",
+    ["operation"], buckets=LATENCY_BUCKETS,
+)
+ES_REQUEST_DURATION = Histogram(
+    "elasticsearch_request_duration_seconds", "Elasticsearch call latency",
+    ["operation"], buckets=LATENCY_BUCKETS,
+)
+TASK_DURATION = Histogram(
+    "celery_task_duration_seconds", "Celery task run time",
+    ["task", "state"], buckets=TASK_BUCKETS,
+)
+INGEST_ROWS = Counter(
+    "ingest_rows_total", "Upload rows processed by the workers",
+    ["task", "outcome"],
+)
+INGEST_ROWS_PER_SECOND = Histogram(
+    "ingest_rows_per_second", "Throughput of finished upload jobs",
+    ["task"], buckets=THROUGHPUT_BUCKETS,
+)
+INGEST_THROTTLE_SECONDS = Counter(
+    "ingest_throttle_seconds", "Time batch uploads paused for database latency or replication lag",
+)
+# Pool gauges of the web processes in multiprocess mode, where collectors do not aggregate, set after
+# every request. Not registered: PoolCollector exposes the same name otherwise, MultiProcessCollector reads the files.
+WEB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections", "Connections of the database pools",
+    ["engine", "state"], multiprocess_mode="livesum", registry=None,
+)
+# Pool gauges of worker processes, set after every task
+WORKER_POOL_CONNECTIONS = Gauge(
+    "celery_db_pool_connections", "Connections of the worker's database pool",
+    ["state"], multiprocess_mode="livesum",
+)
+
+
+# Label children are cached, label lookups take a lock and hash the values on every call
+_children: Dict[Tuple, object] = {}
+
+
+def _child(metric, *labels):
+    key = (metric, labels)
+    child = _children.get(key)
+    if child is None:
+        child = _children[key] = metric.labels(*labels)
+    return child
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware timing every HTTP request by its route template.
+
+    Unmatched paths share one label so scanners cannot blow up the series count.
+    GraphQL POST bodies are buffered as they stream through to label the
+    request with the operation name.
+    """
+
+    def __init__(self, app, graphql_path: str = "/graphql"):
+        self.app = app
+        self.graphql_path = graphql_path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]
+        body = [] if scope["path"] == self.graphql_path and scope["method"] == "POST" else None
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                body.append(message.get("body", b""))
+            return message
+
+        try:
+            await self.app(scope, receive if body is None else receive_wrapper, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            if _publish_pools is not None:
+                _publish_pools()
+            route = scope.get("route")
+            if route is not None:
+                template = route.path
+            elif scope["path"] == self.graphql_path:
+                template = self.graphql_path
+            else:
+                template = "unmatched"
+            _child(HTTP_REQUEST_DURATION, scope["method"], template, str(status[0])).observe(elapsed)
+            if body is not None:
+                _child(GRAPHQL_REQUEST_DURATION, graphql_operation(b"".join(body))).observe(elapsed)
+
+
+_OPERATION_NAME = re.compile(r"^\s*(?:query|mutation|subscription)\s+(\w+)")
+_FIRST_FIELD = re.compile(r"{\s*(\w+)")
+
+
+def graphql_operation(body: bytes) -> str:
+    """Returns the operation name of a GraphQL request body, or its first root field."""
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        return "invalid"
+    if not isinstance(payload, dict):
+        return "invalid"
+    if payload.get("operationName"):
+        return str(payload["operationName"])[:64]
+    query = str(payload.get("query") or "")
+    match = _OPERATION_NAME.match(query) or _FIRST_FIELD.search(query)
+    return match.group(1)[:64] if match else "anonymous"
+
+
+_STATEMENT_OPERATIONS = {"SELECT": "select", "INSERT": "insert", "UPDATE": "update", "DELETE": "delete"}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # the execution context lives exactly as long as the statement, cheaper than conn.info
+    context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_started
+    operation = _STATEMENT_OPERATIONS.get(statement[:6], None) or _STATEMENT_OPERATIONS.get(
+        statement.lstrip()[:6].upper(), "other"
+    )
+    _child(DB_QUERY_DURATION, operation).observe(elapsed)
+
+
+def instrument_sqlalchemy():
+    """Times every statement of every engine of the process, sync and async."""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, operation: str):
+        self.child = _child(histogram, operation)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.started)
+
+
+def time_elasticsearch(operation: str) -> _Timer:
+    """Context manager timing one Elasticsearch call, failures included."""
+    return _Timer(ES_REQUEST_DURATION, operation)
+
+
+class PoolCollector:
+    """Reports the occupancy of the web process's connection pools at scrape time."""
+
+    def __init__(self, engines: Callable[[], Iterable[Tuple[str, Engine]]]):
+        self.engines = engines
+
+    def collect(self):
+        family = GaugeMetricFamily(
+            "db_pool_connections", "Connections of the database pools", labels=["engine", "state"]
+        )
+        for name, engine in self.engines():
+            if isinstance(engine.pool, QueuePool):
+                for state, value in _pool_occupancy(engine.pool).items():
+                    family.add_metric([name, state], value)
+        yield family
+
+
+def _pool_occupancy(pool: QueuePool) -> Dict[str, int]:
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "checked_in": pool.checkedin(),
+    }
+
+
+# Publishes the pool gauges of this web process in multiprocess mode, set by register_pool_collector
+_publish_pools: Optional[Callable[[], None]] = None
+
+
+def register_pool_collector(engines: Callable[[], Iterable[Tuple[str, Engine]]]):
+    """Exposes the pools of `engines` on /metrics.
+
+    Collectors only see the scraped process, so in multiprocess mode the pools of
+    every web process are published to livesum gauges after each of its requests
+    instead, like set_worker_pool_stats does after every task.
+    """
+    global _publish_pools
+    if not MULTIPROCESS:
+        REGISTRY.register(PoolCollector(engines))
+        return
+
+    def publish():
+        for name, engine in engines():
+            if isinstance(engine.pool, QueuePool):
+                for state, value in _pool_occupancy(engine.pool).items():
+                    _child(WEB_POOL_CONNECTIONS, name, state).set(value)
+
+    _publish_pools = publish
+
+
+def set_worker_pool_stats(stats: list):
+    """Publishes the pool occupancy returned by EngineRegistry.stats of a worker process."""
+    for state in ("size", "checked_out", "overflow", "checked_in"):
+        _child(WORKER_POOL_CONNECTIONS, state).set(sum(max(entry.get(state, 0), 0) for entry in stats))
+
+
+def _registry() -> CollectorRegistry:
+    if not MULTIPROCESS:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_payload() -> Tuple[bytes, str]:
+    """Returns the exposition text of this process, or of all processes in multiprocess mode."""
+    if _publish_pools is not None:
+        _publish_pools()
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def clear_multiprocess_dir():
+    """Removes the samples a previous server left in the multiprocess directory, call before forking."""
+    if MULTIPROCESS:
+        directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith(".db"):
+                os.remove(os.path.join(directory, name))
+
+
+def start_worker_server(port: int = WORKER_METRICS_PORT):
+    """Serves the worker metrics on a side port from the main worker process.
+
+    Samples left in the multiprocess directory by a previous worker are removed first.
+    """
+    clear_multiprocess_dir()
+    start_http_server(port, registry=_registry())
+    logger.info("Serving worker metrics on port %s", port)
+
+
+def mark_process_dead(pid: int):
+    """Drops the live gauges of an exited process in multiprocess mode."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
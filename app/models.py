@@ -1,5 +1,5 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Boolean, Float, MetaData, Index, TIMESTAMP, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, Float, MetaData, Index, TIMESTAMP, Date, DateTime, PrimaryKeyConstraint
 from sqlalchemy.sql import func
 from database import Base
 
@@ -12,6 +12,8 @@ class Product(Base):
     branch_id = Column(String, index=True)
     part_price = Column(Float)
     short_desc = Column(String)
+    # fingerprint of part_price and short_desc, unchanged rows of an upload are skipped
+    row_hash = Column(String(32))
     createdat = Column(DateTime, default=func.now())
     updatedat = Column(DateTime, default=func.now(), onupdate=func.now())
 
@@ -28,3 +30,53 @@ class Product(Base):
 
     # (Optional) Add methods for manipulating or validating product data.
 
+
+class ProductPriceHistory(Base):
+    """One price of a product, valid from `valid_from` until the next row of the same key.
+
+    On PostgreSQL the table is range partitioned by month of valid_from, see price_history.py.
+    """
+    __tablename__ = "product_price_history"
+
+    part_number = Column(String, nullable=False)
+    branch_id = Column(String, nullable=False)
+    part_price = Column(Float, nullable=False)
+    valid_from = Column(DateTime, nullable=False)
+
+    # The primary key index on (part_number, branch_id, valid_from) answers the as-of reads,
+    # a partitioned table needs the partition key in its primary key anyway
+    __table_args__ = (
+        PrimaryKeyConstraint('part_number', 'branch_id', 'valid_from', name='pk_product_price_history'),
+        {'postgresql_partition_by': 'RANGE (valid_from)'},
+    )
+
+    def __repr__(self):
+        return f"<ProductPriceHistory part_number={self.part_number}, branch_id={self.branch_id}, \
+    part_price={self.part_price}, valid_from={self.valid_from}>"
+
+
+class BranchStats(Base):
+    """Price aggregates of the products of one branch, maintained by the uploads, see branch_stats.py."""
+    __tablename__ = "branch_stats"
+
+    branch_id = Column(String, primary_key=True)
+    product_count = Column(Integer, nullable=False, default=0)
+    price_sum = Column(Float, nullable=False, default=0)
+    price_min = Column(Float)
+    price_max = Column(Float)
+    # a price moved off price_min or price_max, they are recomputed after the upload
+    stale = Column(Boolean, nullable=False, default=False)
+    updatedat = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<BranchStats branch_id={self.branch_id}, product_count={self.product_count}, \
+    price_min={self.price_min}, price_max={self.price_max}>"
+
+
+class BranchUpdateDay(Base):
+    """Number of products of a branch whose updatedat falls on `day` (UTC)."""
+    __tablename__ = "branch_update_days"
+
+    branch_id = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    products = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,226 @@
+# price_history.py
+"""Price history of the products and the as-of reads answered from it.
+
+Every insert or price change of an upload appends a (part_number, branch_id,
+part_price, valid_from) row to product_price_history in the transaction of the
+upload. The price of a product at a time is the latest row at or before it,
+one seek on the (part_number, branch_id, valid_from) primary key index.
+
+On PostgreSQL the table is range partitioned by month of valid_from, so a
+query for a time only reads the partitions up to it and old history is pruned
+by dropping whole partitions instead of deleting rows. Partitions are created
+PRICE_HISTORY_PARTITIONS_AHEAD months ahead before the first write of every
+process and by the periodic maintain_price_history task, which also drops the
+partitions older than PRICE_HISTORY_RETENTION_MONTHS. Other databases keep a
+single table and prune it with a DELETE.
+
+Usage (from the app directory):
+
+    python price_history.py maintain   # create upcoming partitions, drop expired ones
+    python price_history.py backfill   # record the current price of products without history
+"""
+import argparse
+import os
+import re
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import case, exists, func, insert, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from models import Product, ProductPriceHistory
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# Months of partitions created ahead of the current one
+PRICE_HISTORY_PARTITIONS_AHEAD = int(os.getenv("PRICE_HISTORY_PARTITIONS_AHEAD", "2"))
+# Months of history kept, older partitions are dropped
+PRICE_HISTORY_RETENTION_MONTHS = int(os.getenv("PRICE_HISTORY_RETENTION_MONTHS", "24"))
+
+HISTORY_TABLE = ProductPriceHistory.__tablename__
+PARTITION_NAME = re.compile(rf"^{HISTORY_TABLE}_y(\d{{4}})m(\d{{2}})$")
+
+# Partitions known to exist, so a process checks them once and not on every write
+_partitions = set()
+
+
+def naive_utc(value: datetime) -> datetime:
+    """Converts an aware datetime to the naive UTC the timestamps are stored in."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def month_start(value: datetime, months: int = 0) -> datetime:
+    """First instant of the month of `value`, moved by `months` months."""
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{HISTORY_TABLE}_y{month.year}m{month.month:02d}"
+
+
+def _partitioned(engine: Engine) -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+def ensure_partitions(engine: Engine, since: Optional[datetime] = None, now: Optional[datetime] = None) -> List[str]:
+    """Creates the missing monthly partitions from the month of `since` (default now) to
+    PRICE_HISTORY_PARTITIONS_AHEAD months after now.
+
+    The partitions are created in their own transaction, so they outlive a rolled back
+    upload. A no-op on databases without partitioning.
+
+    Returns:
+        The names of the partitions checked, empty when all were known already.
+    """
+    if not _partitioned(engine):
+        return []
+    now = now or datetime.utcnow()
+    month = month_start(since or now)
+    last = month_start(now, PRICE_HISTORY_PARTITIONS_AHEAD)
+    months = []
+    while month <= last:
+        if partition_name(month) not in _partitions:
+            months.append(month)
+        month = month_start(month, 1)
+    if not months:
+        return []
+
+    with engine.begin() as conn:
+        for month in months:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {HISTORY_TABLE} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{month_start(month, 1).isoformat()}')"
+            ))
+    names = [partition_name(month) for month in months]
+    _partitions.update(names)
+    return names
+
+
+def prune_partitions(
+    engine: Engine, retention_months: int = PRICE_HISTORY_RETENTION_MONTHS, now: Optional[datetime] = None
+) -> List[str]:
+    """Drops the history older than `retention_months` months before the current month.
+
+    Returns:
+        The names of the dropped partitions. Without partitioning the rows are deleted
+        and nothing is returned.
+    """
+    cutoff = month_start(now or datetime.utcnow(), -retention_months)
+    with engine.begin() as conn:
+        if not _partitioned(engine):
+            conn.execute(ProductPriceHistory.__table__.delete().where(ProductPriceHistory.valid_from < cutoff))
+            return []
+
+        partitions = conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :parent"
+        ), {"parent": HISTORY_TABLE}).scalars()
+        dropped = []
+        for name in partitions:
+            match = PARTITION_NAME.match(name)
+            if match and month_start(datetime(int(match[1]), int(match[2]), 1), 1) <= cutoff:
+                conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                dropped.append(name)
+    _partitions.difference_update(dropped)
+    return dropped
+
+
+def record_price_changes(db: Session, rows: List[dict], valid_from: datetime):
+    """Appends the new prices of `rows` in the transaction of `db` with one bulk insert.
+
+    Args:
+        db: SQLAlchemy session object.
+        rows: Product dictionaries with part_number, branch_id and part_price.
+        valid_from: Time the prices took effect, the updatedat written with them.
+    """
+    if not rows:
+        return
+    ensure_partitions(db.get_bind().engine, now=valid_from)
+    db.execute(insert(ProductPriceHistory), [
+        {
+            "part_number": row["part_number"],
+            "branch_id": row["branch_id"],
+            "part_price": row["part_price"],
+            "valid_from": valid_from,
+        }
+        for row in rows
+    ])
+
+
+def price_as_of(as_of: datetime):
+    """Price of the enclosing products row at `as_of`.
+
+    Products not updated since `as_of` still have that price. For the others the
+    latest history row at or before `as_of` is looked up by its key. NULL when the
+    product did not exist yet or its price then is older than the kept history.
+    """
+    as_of = naive_utc(as_of)
+    history = (
+        select(ProductPriceHistory.part_price)
+        .where(
+            ProductPriceHistory.part_number == Product.part_number,
+            ProductPriceHistory.branch_id == Product.branch_id,
+            ProductPriceHistory.valid_from <= as_of,
+        )
+        .order_by(ProductPriceHistory.valid_from.desc())
+        .limit(1)
+        .correlate(Product)
+        .scalar_subquery()
+    )
+    return case((Product.updatedat <= as_of, Product.part_price), else_=history)
+
+
+def backfill(db: Session) -> int:
+    """Records the current price of every product without history as valid since its last update.
+
+    Returns:
+        The number of history rows written.
+    """
+    valid_from = func.coalesce(Product.updatedat, Product.createdat)
+    since = db.execute(select(func.min(valid_from))).scalar()
+    if since is None:
+        return 0
+    ensure_partitions(db.get_bind().engine, since=since)
+    missing = select(Product.part_number, Product.branch_id, Product.part_price, valid_from).where(
+        valid_from.is_not(None),
+        ~exists().where(
+            ProductPriceHistory.part_number == Product.part_number,
+            ProductPriceHistory.branch_id == Product.branch_id,
+        ),
+    )
+    result = db.execute(insert(ProductPriceHistory).from_select(
+        ["part_number", "branch_id", "part_price", "valid_from"], missing
+    ))
+    db.commit()
+    return result.rowcount
+
+
+def maintain(engine: Engine) -> dict:
+    """Creates the upcoming partitions and drops the expired ones."""
+    report = {"created": ensure_partitions(engine), "dropped": prune_partitions(engine)}
+    logger.info("Maintained the price history: %s", report)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Price history partition maintenance")
+    parser.add_argument("command", choices=["maintain", "backfill"])
+    args = parser.parse_args()
+
+    from database import SessionLocal, engine
+
+    if args.command == "maintain":
+        print(maintain(engine))
+    else:
+        db = SessionLocal()
+        try:
+            print(f"{backfill(db)} products backfilled")
+        finally:
+            db.close()
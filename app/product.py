@@ -1,14 +1,34 @@
 # product.py
-from fastapi import Depends, HTTPException, status, APIRouter, UploadFile, File
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Iterator, Optional
+
+from aiodataloader import DataLoader
+from fastapi import Depends, HTTPException, status, APIRouter, UploadFile, File, Query as QueryParam
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from elasticsearch import Elasticsearch
+from starlette.background import BackgroundTasks
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
 
 import logging
-from graphene import ObjectType, List, String, Schema
+from graphene import ObjectType, List, String, Int, DateTime, Field, Schema
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
 
-from database import get_db_graphql, get_db, DATABASE_URL
-from crud import get_products
-from celery_tasks import process_csv
+from branch_stats import STATS_RECENT_DAYS, get_branch_stats_async
+from database import AsyncSessionLocal, get_async_db, get_db
+from crud import (
+    PRODUCT_FIELDS, decode_cursor, get_last_modified_async, get_products_async, get_products_by_keys_async, next_cursor,
+)
+from cache import item_key, list_key, product_cache
+from celery_tasks import job_status, process_csv, process_csv_copy, process_csv_sharded, upload_queue
+from responses import OrjsonResponse
+import http_cache
+from export import MEDIA_TYPES, ExportFormat, gzip_stream, iter_export
+from ingest import spool_upload, remove_if_exists, IngestMode, MAX_INGEST_SHARDS
 import schemas
 
 
@@ -16,17 +36,101 @@ import schemas
 logging.basicConfig(filename='web.log', level=logging.ERROR)
 logger = logging.getLogger(__name__)
 
-# elasticsearch
-es = Elasticsearch(hosts=["http://elasticsearch:9200"])
+router = APIRouter(tags=["Products"], prefix="/products")
 
-# Create "products" index
-index_name = "products"
+class RequestSession:
+    """The AsyncSession of one GraphQL request, opened on first use and closed after the response.
+
+    Sibling fields resolve concurrently while an AsyncSession supports one
+    operation at a time, so the resolvers take turns on the session.
+    """
+
+    def __init__(self, background: BackgroundTasks):
+        self._background = background
+        self._lock = asyncio.Lock()
+        self._session = None
+
+    @asynccontextmanager
+    async def __call__(self):
+        async with self._lock:
+            if self._session is None:
+                self._session = AsyncSessionLocal()
+                self._background.add_task(self._session.close)
+            yield self._session
+
+
+class ProductLoader(DataLoader):
+    """Batches the exact lookups of one GraphQL request.
+
+    Keys are (part_number, branch_id, fields, as_of). All the `products(partNumber, branchId)`
+    fields of a document are read through the product cache in one batch, the
+    misses with one IN query per distinct field set and as_of.
+    """
+
+    def __init__(self, session: RequestSession):
+        super().__init__()
+        self.session = session
+
+    async def batch_load_fn(self, keys: list) -> list:
+        cache_keys = [item_key(*key) for key in keys]
+
+        async def load(missing: list) -> dict:
+            found = {cache_key: [] for cache_key in missing}
+            pending = [key for key, cache_key in zip(keys, cache_keys) if cache_key in found]
+            async with self.session() as db:
+                for fields, as_of in dict.fromkeys(key[2:] for key in pending):
+                    pairs = [(part_number, branch_id) for part_number, branch_id, *rest in pending if rest == [fields, as_of]]
+                    for product in await get_products_by_keys_async(db, pairs, fields, as_of):
+                        found[item_key(product["part_number"], product["branch_id"], fields, as_of)] = [product]
+            return found
+
+        return await product_cache.get_many_or_load(cache_keys, load)
+
+
+def graphql_context(request: Request) -> dict:
+    """Context of a GraphQL request with its lazily opened session and product loader"""
+    background = BackgroundTasks()
+    session = RequestSession(background)
+    return {
+        "request": request,
+        "background": background,
+        "session": session,
+        "product_loader": ProductLoader(session),
+    }
+
+
+def _selections(info, selection_set) -> Iterator[FieldNode]:
+    """Fields of a selection set with the fragments expanded"""
+    if selection_set is None:
+        return
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            yield selection
+        elif isinstance(selection, InlineFragmentNode):
+            yield from _selections(info, selection.selection_set)
+        elif isinstance(selection, FragmentSpreadNode):
+            yield from _selections(info, info.fragments[selection.name.value].selection_set)
+
+
+def selected_fields(info, *path: str) -> tuple:
+    """Product columns selected under the resolved field, following `path` into nested fields.
+
+    Returns:
+        The selected PRODUCT_FIELDS in column order, empty when none is selected.
+    """
+    nodes = list(info.field_nodes)
+    for name in path:
+        nodes = [node for parent in nodes for node in _selections(info, parent.selection_set) if node.name.value == name]
+    names = {to_snake_case(node.name.value) for parent in nodes for node in _selections(info, parent.selection_set)}
+    return tuple(field for field in PRODUCT_FIELDS if field in names)
 
-router = APIRouter(tags=["Products"], prefix="/products")
 
 class Query(ObjectType):
     """GraphQl query class for resolver 
 
+    Resolvers read only the columns the document selects and share the
+    request's session, see graphql_context.
+
     Args:
         ObjectType (_type_): _description_
 
@@ -36,82 +140,266 @@ class Query(ObjectType):
     Returns:
         _type_: _description_
     """
-    products = List(schemas.ProductSchema, skip=String(), limit=String(), part_number=String(), branch_id=String())
+    products = List(
+        schemas.ProductSchema, skip=Int(), limit=Int(), part_number=String(), branch_id=String(), after=String(),
+        as_of=DateTime(description="Price the products as of this time from the price history"),
+    )
+    products_page = Field(schemas.ProductPageSchema, limit=Int(), after=String())
+    branch_stats = List(schemas.BranchStatsSchema, branch_id=String())
     
-    async def resolve_products(self, info, skip: int = 0, limit: int = 10, part_number: str = None, branch_id = None):
+    async def resolve_products(
+        self, info, skip: int = 0, limit: int = 10, part_number: str = None, branch_id = None, after: str = None,
+        as_of: datetime = None
+    ):
+        fields = selected_fields(info)
         try:
-            db = get_db_graphql() # get the DB session
-            
             # Check if both part_number and branch_id are provided for filtering
             if part_number and branch_id:
-                # Elasticsearch query to filter products based on part_number and branch_id
-                es_query = {
-                    "query": {
-                        "bool": {
-                            "must": [
-                                {"match": {"part_number": part_number}},
-                                {"match": {"branch_id": branch_id}}
-                            ]
-                        }
-                    },
-                    "size": limit  # Specify the limit for the number of results
-                }
-                logger.info(f"Elasticsearch query: {es_query}")
-
-                # Execute the Elasticsearch query and retrieve the results
-                es_result = es.search(index="products", body=es_query)
-                logger.info(f"Elasticsearch result: {es_result}")
-
-                # Extract the source data from Elasticsearch hits
-                products = [hit["_source"] for hit in es_result["hits"]["hits"]]
-                logger.info(f"Filtered products: {products}")
+                # Exact lookups use the unique (part_number, branch_id) index through the cache,
+                # the loader turns every lookup of the document into one batch
+                products = await info.context["product_loader"].load((part_number, branch_id, fields, as_of))
             else:
-                # If no filtering parameters are provided, fetch all products using get_products from crud.py
-                products = get_products(db, skip=skip, limit=limit)
+                # If no filtering parameters are provided, fetch all products using get_products_async from crud.py
+                async def load():
+                    async with info.context["session"]() as db:
+                        return await get_products_async(db, skip=skip, limit=limit, after=after, fields=fields, as_of=as_of)
+
+                products = await product_cache.get_or_load(list_key(skip, limit, after, fields, as_of), load)
 
             # Return the filtered or all products based on the conditions
             return products
 
-        except ConnectionError as ce:
-            logger.error("Connection error to Elasticsearch: %s", str(ce))
-            raise HTTPException(status_code=500, detail="Error connecting to Elasticsearch. Check Elasticsearch status and connection details.")
         except Exception as e:
             logger.error("Error processing products db: %s", str(e))
             raise HTTPException(status_code=500, detail=str(e))
+
+    async def resolve_products_page(self, info, limit: int = 10, after: str = None):
+        """Keyset paginated products, pass `nextCursor` back as `after` for the following page"""
+        fields = selected_fields(info, "products")
+        try:
+            async def load():
+                async with info.context["session"]() as db:
+                    return await get_products_async(db, limit=limit, after=after, fields=fields)
+
+            products = await product_cache.get_or_load(list_key(0, limit, after, fields), load)
+            return schemas.ProductPageSchema(products=products, next_cursor=next_cursor(products, limit))
+        except Exception as e:
+            logger.error("Error processing products db: %s", str(e))
+            raise HTTPException(status_code=500, detail=str(e))
+
+    async def resolve_branch_stats(self, info, branch_id: str = None):
+        """Price aggregates per branch, read from the maintained branch_stats table"""
+        try:
+            async with info.context["session"]() as db:
+                return await get_branch_stats_async(db, branch_id=branch_id)
+        except Exception as e:
+            logger.error("Error processing branch stats db: %s", str(e))
+            raise HTTPException(status_code=500, detail=str(e))
            
 
+async def lookup_product(db: AsyncSession, part_number: str, branch_id: str) -> list:
+    """Point lookup of one product through the product cache, an empty list when it does not exist"""
+    return await product_cache.get_or_load(
+        item_key(part_number, branch_id),
+        lambda: get_products_async(db, part_number=part_number, branch_id=branch_id)
+    )
+
+
 # @router.get("/", response_model=List[dict], status_code=status.HTTP_200_OK)
-@router.get("", status_code=status.HTTP_200_OK)
-async def get_products_list(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
+@router.get("", response_model=schemas.ListProductResponse, response_class=OrjsonResponse, status_code=status.HTTP_200_OK)
+async def get_products_list(
+    request: Request,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: str = None,
+    as_of: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Lists products ordered by id.
+
+    Pages either by `skip`/`limit` or, when `cursor` is given, by seeking past the
+    `next_cursor` of the previous page, which stays fast at any depth.
+
+    With `as_of` the products are priced from the price history as of that time,
+    products that did not exist then are left out. The other fields are current.
+
+    The rows come from a column select as plain dictionaries and are encoded
+    straight to JSON bytes by OrjsonResponse; `ListProductResponse` only documents
+    the shape, it does not validate the rows again.
+
+    Responses carry an ETag and Last-Modified of the catalog version, revalidations
+    with If-None-Match or If-Modified-Since get a 304 without a products query.
+    """
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    key = list_key(skip, limit, cursor, as_of=as_of)
     try:
-        products = get_products(db, skip=skip, limit=limit)
-        
-        # # Convert the list of Pydantic models to a list of dictionaries
-        # products_dict_list = [product.dict() for product in products]
-        
-        # create an instance of ListProductResponse using the retrieved products
-        response = schemas.ListProductResponse(
-            status="Success",
-            results=len(products),
-            products=products
+        headers = await http_cache.validators(key, db)
+        if http_cache.is_not_modified(request, headers):
+            return http_cache.not_modified(headers)
+
+        # read-through the product cache, invalidated whenever an upload commits
+        products = await product_cache.get_or_load(
+            key,
+            lambda: get_products_async(db, skip=skip, limit=limit, after=cursor, as_of=as_of)
         )
-        # return products
-        # return [{key: value for key, value in product.items() 
-        #         if not key.startswith('_')} for product in products]
-        
-        # return the response using the ListProductResponse
-        return response
     except Exception as e:
         # Log or handle any errors that occur during task execution
         logger.error("Error processing products db: %s", str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return OrjsonResponse({
+        "status": "Success",
+        "results": len(products),
+        "products": products,
+        "next_cursor": next_cursor(products, limit),
+    }, headers=headers)
+
+@router.get("/lookup", status_code=status.HTTP_200_OK)
+async def get_product(request: Request, part_number: str, branch_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Exact lookup of one product by its (part_number, branch_id) key.
+
+    Conditional GETs are answered like the listing, see get_products_list, without
+    reading the product. Only a miss the product cache already holds, cached by an
+    earlier 404, turns a matching revalidation into a 404.
+
+    Raises:
+        HTTPException: 404 when the product does not exist.
+    """
+    key = item_key(part_number, branch_id)
+    headers = await http_cache.validators(key, db)
+    if http_cache.is_not_modified(request, headers) and await product_cache.peek(key) != []:
+        return http_cache.not_modified(headers)
+
+    products = await lookup_product(db, part_number, branch_id)
+    if not products:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    return OrjsonResponse(products[0], headers=headers)
+
+@router.get("/export", status_code=status.HTTP_200_OK)
+async def export_products(
+    request: Request,
+    format: ExportFormat = QueryParam(ExportFormat.ndjson),
+    branch_id: Optional[str] = None,
+    updated_since: Optional[datetime] = None
+):
+    """Streams the whole catalog, or the products of one branch, as NDJSON or CSV.
+
+    Rows are read with a server-side cursor and sent as they are encoded, gzip
+    compressed when the client accepts it, so the export never builds in memory.
+
+    Args:
+        format (ExportFormat): `ndjson`, one product object per line, or `csv`.
+        branch_id (str, optional): Only export this branch.
+        updated_since (datetime, optional): Incremental export of the products
+            updated after this time. Pass the `X-Export-Watermark` of the previous
+            export. The export looks back EXPORT_WATERMARK_MARGIN seconds further,
+            for batches committed after the previous export with older
+            timestamps, so it may repeat some rows of the previous one. Deleted
+            products are not reported.
+
+    Returns:
+        StreamingResponse: the chunked export.
+    """
+    try:
+        # the latest updatedat when the export starts, the next incremental export resumes from it.
+        # Read on a short session, the stream opens its own and keeps it until the last row.
+        async with AsyncSessionLocal() as db:
+            watermark = await get_last_modified_async(db)
+    except Exception as e:
+        logger.error("Error processing products db: %s", str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+    extension = "ndjson" if format == ExportFormat.ndjson else "csv"
+    headers = {
+        "Content-Disposition": f'attachment; filename="products.{extension}"',
+        "Vary": "Accept-Encoding",
+    }
+    if watermark is not None:
+        headers["X-Export-Watermark"] = watermark.isoformat()
+
+    chunks = iter_export(format, branch_id=branch_id, updated_since=updated_since)
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        chunks = gzip_stream(chunks)
+    return StreamingResponse(chunks, media_type=MEDIA_TYPES[format], headers=headers)
+
+@router.get("/stats", response_model=schemas.BranchStatsResponse, response_class=OrjsonResponse, status_code=status.HTTP_200_OK)
+async def get_branch_stats(branch_id: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    """Product count, average, minimum and maximum price and recently updated products per branch.
+
+    The aggregates are maintained by the uploads, see branch_stats.py, so the
+    response does not scan the products table.
+
+    Args:
+        branch_id (str, optional): Only report this branch.
+    """
+    try:
+        branches = await get_branch_stats_async(db, branch_id=branch_id)
+    except Exception as e:
+        logger.error("Error processing branch stats db: %s", str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return OrjsonResponse({
+        "status": "Success",
+        "results": len(branches),
+        "recent_days": STATS_RECENT_DAYS,
+        "branches": branches,
+    })
+
+@router.post("/lookup", status_code=status.HTTP_200_OK)
+async def lookup_products(request: schemas.ProductLookupRequest, db: AsyncSession = Depends(get_async_db)):
+    """Batch exact lookup, answered with a single (part_number, branch_id) IN (...) query.
+
+    Args:
+        request (ProductLookupRequest): up to LOOKUP_MAX_KEYS keys.
+
+    Returns:
+        ProductLookupResponse: the products found and the keys that do not exist.
+    """
+    keys = list(dict.fromkeys((key.part_number, key.branch_id) for key in request.items))
+    try:
+        products = await get_products_by_keys_async(db, keys)
+    except Exception as e:
+        logger.error("Error processing products db: %s", str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+    found = {(product["part_number"], product["branch_id"]) for product in products}
+    return schemas.ProductLookupResponse(
+        status="Success",
+        results=len(products),
+        products=products,
+        missing=[
+            schemas.ProductKeySchema(part_number=part_number, branch_id=branch_id)
+            for part_number, branch_id in keys if (part_number, branch_id) not in found
+        ]
+    )
+
+@router.get("/cache/stats", status_code=status.HTTP_200_OK)
+async def get_cache_stats():
+    """Hit, miss and eviction counters of the product cache of this web process"""
+    return product_cache.stats()
 
 @router.post("/upload", status_code=status.HTTP_201_CREATED)
-async def upload_file(file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_file(
+    file: UploadFile = File(...),
+    shards: int = QueryParam(0, ge=0, le=MAX_INGEST_SHARDS),
+    mode: IngestMode = QueryParam(IngestMode.batch),
+    db: Session = Depends(get_db)
+):
     """
     This API method will push the work upload file for celery
 
     Args:
         file (UploadFile, optional): _description_. Defaults to File(...).
+        shards (int, optional): Split the upload into this many key-aware shards
+            processed in parallel. 0 or 1 ingests it as a single task. Defaults to 0.
+        mode (IngestMode, optional): `batch` upserts and commits the file batch by batch,
+            `merge` bulk loads it with COPY and upserts it in one statement, `replace`
+            also deletes the products missing from the file. Defaults to batch.
         db (Session, optional): _description_. Defaults to Depends(get_db).
 
     Raises:
@@ -120,17 +408,49 @@ async def upload_file(file: UploadFile = File(...), db: Session = Depends(get_db
     Returns:
         _type_: _description_
     """
+    if mode != IngestMode.batch and shards > 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="shards only apply to the batch mode")
+
+    path = None
     try:
-        content = await file.read()
-        content_str = content.decode('utf-8')
+        # Stream the body to the shared upload directory, only the path goes through the broker
+        path = await spool_upload(file)
 
-        # Use the DATABASE_URL directly for Celery task
-        process_csv.delay(DATABASE_URL, content_str)
+        # The workers connect with their own pooled engines
+        if mode != IngestMode.batch:
+            job = process_csv_copy.delay(path, mode.value)
+        elif shards > 1:
+            job = process_csv_sharded.delay(path, shards)
+        else:
+            # small uploads, e.g. price corrections, do not wait behind full catalog loads
+            job = process_csv.apply_async([path], queue=upload_queue(path))
 
-        return {"message": "File uploaded successfully"}
+        # poll GET /products/uploads/{job_id} for progress
+        return {"message": "File uploaded successfully", "job_id": job.id}
     except Exception as e:
         logger.error("Error processing CSV: %s", str(e)) 
+        # no task owns the spooled file when queuing it failed
+        if path is not None:
+            await run_in_threadpool(remove_if_exists, path)
         raise HTTPException(status_code=500, detail=str(e))
     
+@router.get("/uploads/{job_id}", response_model=schemas.UploadJobResponse, status_code=status.HTTP_200_OK)
+async def get_upload_job(job_id: str):
+    """State and counters of an upload job.
+
+    Args:
+        job_id (str): The `job_id` returned by the upload.
+
+    Returns:
+        UploadJobResponse: rows processed, rows per second, committed batches and
+        ETA while the job runs, the final report or the error once it is done.
+        Unknown ids are reported as PENDING.
+    """
+    try:
+        return await run_in_threadpool(job_status, job_id)
+    except Exception as e:
+        logger.error("Error reading upload job %s: %s", job_id, str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Schema attribute for GraphQL
 schema = Schema(query=Query)
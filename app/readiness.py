@@ -0,0 +1,130 @@
+# readiness.py
+"""Dependency probes behind GET /ready.
+
+Every probe result is cached for READY_CACHE_SECONDS and concurrent requests
+share one in-flight probe, so frequent readiness checks of many replicas do not
+turn into a stream of connections to the database, Elasticsearch and the broker.
+A probe that does not answer within READY_PROBE_TIMEOUT counts as not ready.
+
+Only the dependencies in READY_REQUIRED gate readiness, the others are reported.
+By default only the database is required: an Elasticsearch or broker outage
+fails search or uploads, not every product read, and taking all replicas out of
+the load balancer for it would turn a partial outage into a full one.
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from celery_tasks import celery
+from database import async_engine
+from search_index import get_es
+
+
+# Seconds a probe result is served from memory
+READY_CACHE_SECONDS = float(os.getenv("READY_CACHE_SECONDS", "5"))
+# Seconds a probe may take before its dependency counts as not ready
+READY_PROBE_TIMEOUT = float(os.getenv("READY_PROBE_TIMEOUT", "2"))
+# Comma separated probes that must pass for the instance to be ready
+READY_REQUIRED = tuple(
+    name.strip() for name in os.getenv("READY_REQUIRED", "database").split(",") if name.strip()
+)
+
+
+class Probe:
+    """Runs one dependency check and caches its result for `ttl` seconds."""
+
+    def __init__(
+        self,
+        check: Callable[[], Awaitable[None]],
+        ttl: float = READY_CACHE_SECONDS,
+        timeout: float = READY_PROBE_TIMEOUT,
+    ):
+        self.check = check
+        self.ttl = ttl
+        self.timeout = timeout
+        self.runs = 0
+        self._result: Optional[dict] = None
+        self._checked_at = float("-inf")
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop = None
+
+    def _fresh(self) -> bool:
+        return self._result is not None and time.monotonic() - self._checked_at < self.ttl
+
+    async def result(self) -> dict:
+        """Returns {"ready", "latency_ms"[, "error"]} of the last check, running it when stale."""
+        if self._fresh():
+            return self._result
+        # locks are bound to the event loop they are first used in
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock, self._lock_loop = asyncio.Lock(), loop
+        async with self._lock:
+            if self._fresh():
+                return self._result
+            self.runs += 1
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(self.check(), self.timeout)
+                result = {"ready": True}
+            except asyncio.TimeoutError:
+                result = {"ready": False, "error": f"no answer within {self.timeout}s"}
+            except Exception as e:
+                result = {"ready": False, "error": f"{type(e).__name__}: {e}"}
+            result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            self._result, self._checked_at = result, time.monotonic()
+        return self._result
+
+
+async def check_database():
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+def _ping_elasticsearch():
+    if not get_es().ping():
+        raise ConnectionError("Elasticsearch did not answer the ping")
+
+
+async def check_elasticsearch():
+    await run_in_threadpool(_ping_elasticsearch)
+
+
+def _connect_broker():
+    with celery.connection_for_write() as conn:
+        conn.ensure_connection(max_retries=1, interval_start=0, timeout=READY_PROBE_TIMEOUT)
+
+
+async def check_broker():
+    await run_in_threadpool(_connect_broker)
+
+
+PROBES: Dict[str, Probe] = {
+    "database": Probe(check_database),
+    "elasticsearch": Probe(check_elasticsearch),
+    "broker": Probe(check_broker),
+}
+
+
+async def readiness(probes: Optional[Dict[str, Probe]] = None, required: Optional[Iterable[str]] = None) -> dict:
+    """Runs the stale probes concurrently and reports whether the required ones passed.
+
+    Args:
+        probes (dict): probes by dependency name, PROBES by default
+        required (Iterable[str]): names of the probes that gate readiness, READY_REQUIRED by default
+
+    Returns:
+        dict: {"ready": bool, "checks": {name: probe result}}
+    """
+    probes = PROBES if probes is None else probes
+    required = READY_REQUIRED if required is None else required
+    results = await asyncio.gather(*(probe.result() for probe in probes.values()))
+    checks = {name: dict(result, required=name in required) for name, result in zip(probes, results)}
+    return {
+        "ready": all(result["ready"] for result in checks.values() if result["required"]),
+        "checks": checks,
+    }
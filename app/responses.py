@@ -0,0 +1,20 @@
+# responses.py
+from typing import Any
+
+from starlette.responses import Response
+
+from cache import dumps
+
+
+class OrjsonResponse(Response):
+    """JSON response encoded with orjson straight to bytes.
+
+    Routes returning plain dictionaries and lists use it to skip FastAPI's
+    jsonable_encoder pass and response model validation; datetimes are encoded
+    as ISO 8601 strings like the cached values.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
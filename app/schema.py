@@ -0,0 +1,103 @@
+# schema.py
+"""Creates the application tables, columns and indexes that do not exist yet.
+
+The schema is managed by this one-shot command, e.g. the `migrate` service of
+docker-compose, instead of by the web processes, so starting or scaling out
+the API never waits on DDL.
+
+create_all only creates missing tables, so the columns and indexes the models
+gained since are also added to tables that already exist, e.g. row_hash to a
+products table made by an older init-db.sql. Products sharing a (part_number,
+branch_id) key are deduplicated before the unique index is created, keeping
+the latest inserted one, since the uploads upsert on that key.
+
+Usage (from the app directory):
+
+    python schema.py
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from branch_stats import rebuild_if_empty
+from database import Base, engine
+import models  # noqa: F401 register the tables on Base
+from price_history import ensure_partitions
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# Keeps the latest row of every key the products are upserted on
+DEDUPLICATE_PRODUCTS_SQL = (
+    "DELETE FROM products WHERE part_number IS NOT NULL AND branch_id IS NOT NULL AND id NOT IN ("
+    "SELECT MAX(id) FROM products WHERE part_number IS NOT NULL AND branch_id IS NOT NULL "
+    "GROUP BY part_number, branch_id)"
+)
+
+
+def add_missing_columns(bind=engine) -> list:
+    """Adds the columns of the models missing from their existing tables, as nullable columns.
+
+    Returns:
+        The added columns as "table.column".
+    """
+    inspector = inspect(bind)
+    # safe to run concurrently with another migrate on PostgreSQL
+    if_not_exists = " IF NOT EXISTS" if bind.dialect.name == "postgresql" else ""
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            with bind.begin() as conn:
+                conn.execute(text(
+                    f"ALTER TABLE {table.name} ADD COLUMN{if_not_exists} {column.name} "
+                    f"{column.type.compile(dialect=bind.dialect)}"
+                ))
+            added.append(f"{table.name}.{column.name}")
+    if added:
+        logger.warning("Added the columns %s", added)
+    return added
+
+
+def create_missing_indexes(bind=engine) -> list:
+    """Creates the indexes of the models missing from their existing tables.
+
+    Returns:
+        The names of the created indexes.
+    """
+    inspector = inspect(bind)
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            with bind.begin() as conn:
+                if index.name == "ix_part_number_branch_id":
+                    deleted = conn.execute(text(DEDUPLICATE_PRODUCTS_SQL)).rowcount
+                    if deleted:
+                        logger.warning("Deleted %s duplicate products before creating %s", deleted, index.name)
+                index.create(conn)
+            created.append(index.name)
+    return created
+
+
+def create_schema(bind=engine):
+    """Creates the missing tables, columns and indexes of the models on `bind`, the price
+    history partitions of the coming months and the branch stats of an existing catalog."""
+    Base.metadata.create_all(bind=bind)
+    add_missing_columns(bind)
+    create_missing_indexes(bind)
+    ensure_partitions(bind)
+    with Session(bind=bind) as db:
+        rebuild_if_empty(db)
+
+
+if __name__ == "__main__":
+    create_schema()
@@ -1,9 +1,13 @@
 # schemas.py
 from datetime import datetime
+import os
 from typing import List, Optional
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from typing import ClassVar
-from graphene import ObjectType, String, Float, Int
+from graphene import ObjectType, String, Float, Int, List as GraphQLList
+
+# Maximum number of keys accepted by one batch lookup
+LOOKUP_MAX_KEYS = int(os.getenv("LOOKUP_MAX_KEYS", "1000"))
 
 
 class ProductSchema(ObjectType):
@@ -20,6 +24,30 @@ class ProductSchema(ObjectType):
     createdat = String()
     updatedat = String()
 
+
+class ProductPageSchema(ObjectType):
+    """graphQL based schema
+
+    Args:
+        ObjectType (_type_): page of products with the cursor of the next page
+    """
+    products = GraphQLList(ProductSchema)
+    next_cursor = String()
+
+class BranchStatsSchema(ObjectType):
+    """graphQL based schema
+
+    Args:
+        ObjectType (_type_): price aggregates of a branch
+    """
+    branch_id = String(required=True)
+    product_count = Int(required=True)
+    avg_price = Float()
+    min_price = Float()
+    max_price = Float()
+    updated_recently = Int(required=True)
+    updatedat = String()
+
 class ProductBaseSchema(BaseModel):
     """pydantic based schema
 
@@ -43,5 +71,50 @@ class ListProductResponse(BaseModel):
     status: str
     results: int
     products: List[dict]
+    next_cursor: Optional[str] = None
+
+
+class BranchStatsResponse(BaseModel):
+    """
+    pydantic based schema of the branch aggregates, `updated_recently` counts the last `recent_days` days
+    """
+    status: str
+    results: int
+    recent_days: int
+    branches: List[dict]
+
+
+class ProductKeySchema(BaseModel):
+    """
+    pydantic based schema of a (part_number, branch_id) key
+    """
+    part_number: str
+    branch_id: str
+
+
+class ProductLookupRequest(BaseModel):
+    """
+    pydantic based schema
+    """
+    items: List[ProductKeySchema] = Field(min_length=1, max_length=LOOKUP_MAX_KEYS)
+
+
+class ProductLookupResponse(BaseModel):
+    """
+    pydantic based schema
+    """
+    status: str
+    results: int
+    products: List[dict]
+    missing: List[ProductKeySchema]
+
 
-        
\ No newline at end of file
+class UploadJobResponse(BaseModel):
+    """
+    pydantic based schema of an upload job, `progress` while it runs and `result` once it succeeded
+    """
+    job_id: str
+    state: str
+    progress: Optional[dict] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
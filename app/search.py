@@ -0,0 +1,183 @@
+# search.py
+import base64
+import json
+from typing import List, Optional
+
+from elasticsearch import ApiError, TransportError
+from fastapi import APIRouter, HTTPException, Query, status
+from starlette.concurrency import run_in_threadpool
+
+from metrics import time_elasticsearch
+from search_index import PRODUCTS_INDEX, get_es
+import logging
+
+
+# Configure the logger (adjust settings as needed)
+logging.basicConfig(filename='web.log', level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+# Only the fields the clients render are read from _source
+SEARCH_SOURCE_FIELDS = ["part_number", "branch_id", "part_price", "short_desc"]
+TYPEAHEAD_SOURCE_FIELDS = ["part_number", "branch_id"]
+# Total order for search_after, the keys make ties between equal scores deterministic
+SEARCH_SORT = [{"_score": "desc"}, {"part_number": "asc"}, {"branch_id": "asc"}]
+
+router = APIRouter(tags=["Search"], prefix="/search")
+
+
+def encode_search_after(sort_values: list) -> str:
+    """Encodes the sort values of the last hit into an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps(sort_values).encode()).decode().rstrip("=")
+
+
+def decode_search_after(cursor: str) -> list:
+    """Decodes a cursor made by encode_search_after.
+
+    Raises:
+        ValueError: The cursor is malformed.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != len(SEARCH_SORT):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def build_search_query(
+    q: Optional[str] = None,
+    branch_id: Optional[List[str]] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+) -> dict:
+    """Builds the bool query of the search endpoint.
+
+    Free text is matched against the short_desc analyzer and the part number
+    prefix n-grams; the filters do not score and are cached by Elasticsearch.
+    """
+    must = []
+    if q:
+        must.append({
+            "multi_match": {
+                "query": q,
+                "fields": ["part_number.prefix^3", "short_desc"],
+                "fuzziness": "AUTO",
+                "prefix_length": 1,
+            }
+        })
+
+    filters = []
+    if branch_id:
+        filters.append({"terms": {"branch_id": branch_id}})
+    if min_price is not None or max_price is not None:
+        price_range = {}
+        if min_price is not None:
+            price_range["gte"] = min_price
+        if max_price is not None:
+            price_range["lte"] = max_price
+        filters.append({"range": {"part_price": price_range}})
+
+    return {"bool": {"must": must or [{"match_all": {}}], "filter": filters}}
+
+
+def _es_search(operation: str, **kwargs) -> dict:
+    """Runs one search request, timed as `operation`."""
+    with time_elasticsearch(operation):
+        return get_es().search(**kwargs)
+
+
+def _search_error(e: Exception):
+    logger.error("Error searching Elasticsearch: %s", str(e))
+    raise HTTPException(
+        status_code=500,
+        detail="Error connecting to Elasticsearch. Check Elasticsearch status and connection details."
+    )
+
+
+@router.get("", status_code=status.HTTP_200_OK)
+async def search_products(
+    q: Optional[str] = None,
+    branch_id: Optional[List[str]] = Query(None),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    size: int = Query(20, ge=1, le=100),
+    search_after: Optional[str] = None,
+):
+    """Full-text and filtered product search with search_after pagination.
+
+    Args:
+        q: Free text matched against the part number prefix and the description.
+        branch_id: Restrict to these branches, may be repeated.
+        min_price: Lowest part_price, inclusive.
+        max_price: Highest part_price, inclusive.
+        size: Page size.
+        search_after: The `next` cursor of the previous page.
+
+    Returns:
+        The page of products, the total number of matches and the `next` cursor.
+    """
+    body = {
+        "query": build_search_query(q, branch_id, min_price, max_price),
+        "sort": SEARCH_SORT,
+    }
+    if search_after:
+        try:
+            body["search_after"] = decode_search_after(search_after)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    try:
+        result = await run_in_threadpool(
+            _es_search,
+            "search",
+            index=PRODUCTS_INDEX,
+            size=size,
+            source=SEARCH_SOURCE_FIELDS,
+            track_scores=True,
+            **body,
+        )
+    except (ApiError, TransportError) as e:
+        _search_error(e)
+
+    hits = result["hits"]["hits"]
+    return {
+        "status": "Success",
+        "results": len(hits),
+        "total": result["hits"]["total"]["value"],
+        "products": [hit["_source"] for hit in hits],
+        "next": encode_search_after(hits[-1]["sort"]) if len(hits) == size else None,
+    }
+
+
+@router.get("/typeahead", status_code=status.HTTP_200_OK)
+async def typeahead(
+    prefix: str = Query(..., min_length=1, max_length=20),
+    branch_id: Optional[List[str]] = Query(None),
+    size: int = Query(10, ge=1, le=20),
+):
+    """Part number suggestions for a prefix, served from the edge n-gram subfield.
+
+    Only part_number and branch_id are read, totals are not tracked and the
+    response is trimmed with filter_path to keep the round trip small.
+    """
+    query = {"bool": {"must": [{"match": {"part_number.prefix": prefix}}], "filter": []}}
+    if branch_id:
+        query["bool"]["filter"].append({"terms": {"branch_id": branch_id}})
+
+    try:
+        result = await run_in_threadpool(
+            _es_search,
+            "typeahead",
+            index=PRODUCTS_INDEX,
+            query=query,
+            size=size,
+            sort=[{"part_number": "asc"}, {"branch_id": "asc"}],
+            source=TYPEAHEAD_SOURCE_FIELDS,
+            track_total_hits=False,
+            filter_path=["hits.hits._source"],
+        )
+    except (ApiError, TransportError) as e:
+        _search_error(e)
+
+    return [hit["_source"] for hit in result.get("hits", {}).get("hits", [])]
@@ -0,0 +1,317 @@
+# search_index.py
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from elasticsearch import Elasticsearch, NotFoundError, helpers
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from crud import get_products_by_keys
+from metrics import time_elasticsearch
+from models import Product
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+ELASTICSEARCH_URL = os.getenv("ELASTICSEARCH_URL", "http://elasticsearch:9200")
+# Alias the API searches, always pointing to one fully built index
+PRODUCTS_INDEX = os.getenv("PRODUCTS_INDEX", "products")
+# Documents per bulk request
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "500"))
+# Seconds the catch-up of a full reindex looks back, covers uploads committing a batch stamped just before
+REINDEX_CATCH_UP_MARGIN = float(os.getenv("REINDEX_CATCH_UP_MARGIN", "60"))
+
+# Changing the mapping or analysis requires `python search_index.py reindex`
+PRODUCTS_MAPPING = {
+    "dynamic": "strict",
+    "properties": {
+        "id": {"type": "integer"},
+        "part_number": {
+            "type": "keyword",
+            "fields": {
+                # edge n-grams for typeahead, e.g. 0121F00548 -> 0, 01, 012, ...
+                "prefix": {
+                    "type": "text",
+                    "analyzer": "part_number_prefix",
+                    "search_analyzer": "part_number_search",
+                },
+            },
+        },
+        "branch_id": {"type": "keyword"},
+        "part_price": {"type": "scaled_float", "scaling_factor": 100},
+        "short_desc": {"type": "text", "analyzer": "short_desc"},
+        "createdat": {"type": "date"},
+        "updatedat": {"type": "date"},
+    },
+}
+
+PRODUCTS_ANALYSIS = {
+    "filter": {
+        "part_number_edge_ngram": {"type": "edge_ngram", "min_gram": 1, "max_gram": 20},
+        # descriptions look like `GALV x FAB x .026 x 29.88`, the x is only a separator
+        "short_desc_separator": {"type": "stop", "stopwords": ["x"]},
+    },
+    "analyzer": {
+        "part_number_prefix": {
+            "type": "custom",
+            "tokenizer": "keyword",
+            "filter": ["lowercase", "part_number_edge_ngram"],
+        },
+        "part_number_search": {
+            "type": "custom",
+            "tokenizer": "keyword",
+            "filter": ["lowercase"],
+        },
+        # whitespace tokens keep values such as .026 and 29.88 intact
+        "short_desc": {
+            "type": "custom",
+            "tokenizer": "whitespace",
+            "filter": ["lowercase", "short_desc_separator"],
+        },
+    },
+}
+
+PRODUCTS_SETTINGS = {
+    "number_of_shards": 1,
+    "number_of_replicas": 1,
+    "refresh_interval": "1s",
+    "analysis": PRODUCTS_ANALYSIS,
+}
+
+_es: Optional[Elasticsearch] = None
+
+
+def get_es() -> Elasticsearch:
+    """Returns the Elasticsearch client of this process, created on first use."""
+    global _es
+    if _es is None:
+        _es = Elasticsearch(hosts=[ELASTICSEARCH_URL])
+    return _es
+
+
+def reset_es_after_fork():
+    """Forgets the client inherited from the parent process without closing its connections."""
+    global _es
+    _es = None
+
+
+def close_es():
+    """Closes the client of get_es, the next get_es creates a new one."""
+    global _es
+    client, _es = _es, None
+    if client is not None:
+        client.close()
+
+
+def product_document_id(part_number: str, branch_id: str) -> str:
+    """Document id of a product, stable across uploads and reindexes."""
+    return f"{branch_id}:{part_number}"
+
+
+def product_document(product: dict) -> dict:
+    """Converts a product dictionary or row mapping to its index document."""
+    document = {field: product.get(field) for field in PRODUCTS_MAPPING["properties"]}
+    for field in ("createdat", "updatedat"):
+        if document[field] is not None and not isinstance(document[field], str):
+            document[field] = document[field].isoformat()
+    return document
+
+
+def _actions(products: Iterable[dict], index: str) -> Iterator[dict]:
+    for product in products:
+        yield {
+            "_op_type": "index",
+            "_index": index,
+            "_id": product_document_id(product["part_number"], product["branch_id"]),
+            "_source": product_document(product),
+        }
+
+
+def bulk_index_products(
+    es: Elasticsearch,
+    products: Iterable[dict],
+    index: str = PRODUCTS_INDEX,
+    chunk_size: int = INDEX_BATCH_SIZE,
+) -> dict:
+    """Streams products into `index` with the bulk API, `chunk_size` documents per request.
+
+    Args:
+        es: Elasticsearch client.
+        products: Product dictionaries, consumed lazily.
+        index: Index or alias to write to.
+        chunk_size: Documents per bulk request.
+
+    Returns:
+        The number of indexed documents and failures.
+    """
+    indexed, failed = 0, 0
+    with time_elasticsearch("bulk_index"):
+        for ok, item in helpers.streaming_bulk(
+            es, _actions(products, index), chunk_size=chunk_size, raise_on_error=False, max_retries=3
+        ):
+            if ok:
+                indexed += 1
+            else:
+                failed += 1
+                logger.error("Failed to index product: %s", item)
+    return {"indexed": indexed, "failed": failed}
+
+
+def _alias_targets(es: Elasticsearch, alias: str) -> List[str]:
+    try:
+        return sorted(es.indices.get_alias(name=alias))
+    except NotFoundError:
+        return []
+
+
+def _new_index_name(es: Elasticsearch, alias: str) -> str:
+    """Timestamped name of a new concrete index behind `alias`, unique even within one millisecond."""
+    stamp = int(time.time() * 1000)
+    while es.indices.exists(index=f"{alias}-{stamp}"):
+        stamp += 1
+    return f"{alias}-{stamp}"
+
+
+def create_products_index(es: Elasticsearch, name: str, building: bool = False):
+    """Creates a concrete products index with the explicit mapping.
+
+    Args:
+        es: Elasticsearch client.
+        name: Name of the concrete index.
+        building: Disable refresh and replicas while a full reindex loads it.
+    """
+    settings = dict(PRODUCTS_SETTINGS)
+    if building:
+        settings.update({"refresh_interval": "-1", "number_of_replicas": 0})
+    es.indices.create(index=name, mappings=PRODUCTS_MAPPING, settings=settings)
+
+
+def ensure_index(es: Elasticsearch, alias: str = PRODUCTS_INDEX) -> str:
+    """Makes sure `alias` resolves to an index with the products mapping.
+
+    Returns:
+        The name of the index behind the alias.
+    """
+    targets = _alias_targets(es, alias)
+    if targets:
+        return targets[0]
+    if es.indices.exists(index=alias):
+        # a concrete index created before aliases were used, keep serving it
+        return alias
+
+    name = _new_index_name(es, alias)
+    create_products_index(es, name)
+    es.indices.update_aliases(actions=[{"add": {"index": name, "alias": alias}}])
+    logger.info("Created index %s behind alias %s", name, alias)
+    return name
+
+
+def _iter_products(db: Session, batch_size: int, updated_since: Optional[datetime] = None) -> Iterator[dict]:
+    stmt = select(*Product.__table__.columns).execution_options(stream_results=True, yield_per=batch_size)
+    if updated_since is not None:
+        stmt = stmt.where(Product.updatedat >= updated_since)
+    for row in db.execute(stmt):
+        yield row._mapping
+
+
+def _catch_up(es: Elasticsearch, db: Session, index: str, since: datetime, chunk_size: int) -> dict:
+    """Indexes the products updated since `since` into `index`, reading the latest committed state."""
+    # end the read transaction of the previous pass so the rows committed since are visible
+    db.commit()
+    return bulk_index_products(es, _iter_products(db, chunk_size, since), index=index, chunk_size=chunk_size)
+
+
+def reindex_all(
+    es: Elasticsearch,
+    db: Session,
+    alias: str = PRODUCTS_INDEX,
+    chunk_size: int = INDEX_BATCH_SIZE,
+) -> dict:
+    """Rebuilds the products index from the database and swaps the alias atomically.
+
+    The new index is loaded with refresh and replicas disabled, then the alias
+    moves from the old index to the new one in a single aliases request, so
+    searches never see a partially built index. The old indices are deleted.
+
+    Uploads keep indexing through the alias, into the old index, while the new
+    one is built. The products updated since the build started are indexed
+    again into the new index before the swap, and the ones updated during that
+    catch-up once more after it, so no change committed meanwhile is lost.
+
+    Args:
+        es: Elasticsearch client.
+        db: SQLAlchemy session object.
+        alias: Alias the API searches.
+        chunk_size: Documents per bulk request.
+
+    Returns:
+        The new index name, the bulk counts and the retired indices.
+    """
+    name = _new_index_name(es, alias)
+    create_products_index(es, name, building=True)
+
+    # updatedat is naive UTC written by the uploads, see crud._upsert_chunk
+    started = datetime.utcnow() - timedelta(seconds=REINDEX_CATCH_UP_MARGIN)
+    result = bulk_index_products(es, _iter_products(db, chunk_size), index=name, chunk_size=chunk_size)
+    caught_up = datetime.utcnow() - timedelta(seconds=REINDEX_CATCH_UP_MARGIN)
+    catch_up = _catch_up(es, db, name, started, chunk_size)
+    es.indices.put_settings(
+        index=name,
+        settings={
+            "refresh_interval": PRODUCTS_SETTINGS["refresh_interval"],
+            "number_of_replicas": PRODUCTS_SETTINGS["number_of_replicas"],
+        },
+    )
+    es.indices.refresh(index=name)
+
+    old_indices = _alias_targets(es, alias)
+    actions = [{"remove": {"index": index, "alias": alias}} for index in old_indices]
+    if not old_indices and es.indices.exists(index=alias):
+        # replace a concrete index that occupies the alias name
+        actions.append({"remove_index": {"index": alias}})
+    actions.append({"add": {"index": name, "alias": alias}})
+    es.indices.update_aliases(actions=actions)
+    # changes indexed into the old index between the catch-up and the swap
+    after_swap = _catch_up(es, db, name, caught_up, chunk_size)
+
+    for index in old_indices:
+        es.indices.delete(index=index)
+    logger.info("Reindexed %s into %s, caught up %s and %s, retired %s", result, name, catch_up, after_swap, old_indices)
+    return {
+        "index": name,
+        "retired": old_indices,
+        **result,
+        "caught_up": catch_up["indexed"] + after_swap["indexed"],
+    }
+
+
+def index_products_by_keys(
+    es: Elasticsearch,
+    db: Session,
+    keys: List[Tuple[str, str]],
+    alias: str = PRODUCTS_INDEX,
+) -> dict:
+    """Indexes the committed state of the given (part_number, branch_id) keys."""
+    ensure_index(es, alias)
+    return bulk_index_products(es, get_products_by_keys(db, keys), index=alias)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the products Elasticsearch index")
+    parser.add_argument("command", choices=["create", "reindex"])
+    args = parser.parse_args()
+
+    if args.command == "create":
+        print(ensure_index(get_es()))
+    else:
+        from database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            print(reindex_all(get_es(), db))
+        finally:
+            db.close()
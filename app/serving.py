@@ -0,0 +1,26 @@
+# serving.py
+"""Gunicorn worker class and fork hooks of the production web server (see gunicorn.conf.py)."""
+from uvicorn_worker import UvicornWorker
+
+
+class UvloopWorker(UvicornWorker):
+    """Uvicorn worker on the uvloop event loop and the httptools HTTP parser."""
+
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
+
+
+def reset_after_fork():
+    """Drops the connections a worker inherited from the preloaded master.
+
+    The master imports the app but never serves a request, so normally there is
+    nothing to drop; the sockets are still left to the master rather than
+    closed, as they would be shared with its other children.
+    """
+    from cache import product_cache
+    from database import async_engine, engine
+    from search_index import reset_es_after_fork
+
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+    product_cache.reset_after_fork()
+    reset_es_after_fork()
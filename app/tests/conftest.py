@@ -0,0 +1,29 @@
+# app/tests/conftest.py
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+
+# Create the app tables in the test database once, the web app no longer does it at import
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    from schema import create_schema
+
+    create_schema()
+
+
+# Define a fixture for an isolated in-memory SQLite session with the app tables
+@pytest.fixture(scope="function")
+def memory_db():
+    from database import Base
+    import models  # noqa: F401 register the tables on Base
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield db
+    finally:
+        db.close()
+        engine.dispose()
@@ -0,0 +1,291 @@
+# app/tests/fake_elasticsearch.py
+"""In-memory Elasticsearch for tests and offline benchmarks.
+
+`fake_elasticsearch()` returns a real `elasticsearch.Elasticsearch` client whose
+transport node answers from a dictionary instead of the network, so the client,
+`helpers.streaming_bulk` and the code under test run unmodified. Only the APIs
+used by this application are implemented and queries support a small subset
+of the DSL.
+"""
+import functools
+import json
+import re
+import time
+from typing import Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from elastic_transport import ApiResponseMeta, BaseNode, HttpHeaders
+from elastic_transport._node import NodeApiResponse
+from elasticsearch import Elasticsearch
+
+
+class FakeStore:
+    """Indices, documents and aliases of one fake cluster."""
+
+    def __init__(self):
+        self.indices = {}
+        self.aliases = {}
+        self.requests = []
+
+    def resolve(self, name: str) -> list:
+        if name in self.aliases:
+            return sorted(self.aliases[name])
+        if name in self.indices:
+            return [name]
+        return [index for index in self.indices if re.fullmatch(name.replace("*", ".*"), index)]
+
+
+def _field_values(source: dict, field: str) -> list:
+    value = source
+    for part in field.split(".")[:1]:
+        value = value.get(part) if isinstance(value, dict) else None
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _tokens(text) -> list:
+    return [token for token in re.split(r"[^0-9a-z.]+", str(text).lower()) if token]
+
+
+def _matches(query: dict, source: dict) -> bool:
+    if not query or "match_all" in query:
+        return True
+    kind, body = next(iter(query.items()))
+    if kind == "bool":
+        clauses = lambda key: body.get(key, []) if isinstance(body.get(key, []), list) else [body[key]]
+        if not all(_matches(clause, source) for clause in clauses("must") + clauses("filter")):
+            return False
+        if any(_matches(clause, source) for clause in clauses("must_not")):
+            return False
+        should = clauses("should")
+        minimum = body.get("minimum_should_match", 0 if clauses("must") + clauses("filter") else 1)
+        return not should or sum(_matches(clause, source) for clause in should) >= minimum
+    field, value = next(iter(body.items()))
+    values = _field_values(source, field)
+    if kind in ("term", "match_phrase"):
+        value = value["value"] if isinstance(value, dict) else value
+        return value in values
+    if kind == "terms":
+        return any(item in values for item in value)
+    if kind == "match" and field.endswith(".prefix"):
+        value = value["query"] if isinstance(value, dict) else value
+        return any(str(item).lower().startswith(str(value).lower()) for item in values)
+    if kind == "match":
+        value = value["query"] if isinstance(value, dict) else value
+        wanted = _tokens(value)
+        have = {token for item in values for token in _tokens(item)}
+        return any(token in have for token in wanted) or value in values
+    if kind in ("prefix", "match_phrase_prefix", "match_bool_prefix"):
+        value = value.get("value", value.get("query")) if isinstance(value, dict) else value
+        return any(str(item).lower().startswith(str(value).lower()) for item in values)
+    if kind == "range":
+        checks = {"gte": lambda a, b: a >= b, "gt": lambda a, b: a > b, "lte": lambda a, b: a <= b, "lt": lambda a, b: a < b}
+        return any(all(checks[op](item, bound) for op, bound in value.items() if op in checks) for item in values)
+    if kind == "multi_match":
+        return any(_matches({"match": {name.split("^")[0]: body["query"]}}, source) for name in body.get("fields", []))
+    raise ValueError(f"Unsupported query in fake Elasticsearch: {kind}")
+
+
+def _sort_clauses(sort: list) -> list:
+    clauses = []
+    for clause in sort:
+        if isinstance(clause, str):
+            field, order = clause, "desc" if clause == "_score" else "asc"
+        else:
+            field, options = next(iter(clause.items()))
+            order = options.get("order", "asc") if isinstance(options, dict) else options
+        clauses.append((field, order))
+    return clauses
+
+
+def _sort_values(hit: dict, clauses: list) -> list:
+    values = []
+    for field, _ in clauses:
+        if field == "_score":
+            values.append(hit["_score"])
+        elif field == "_id":
+            values.append(hit["_id"])
+        else:
+            values.append((_field_values(hit["_source"], field) or [None])[0])
+    return values
+
+
+def _compare(left: list, right: list, clauses: list) -> int:
+    for a, b, (_, order) in zip(left, right, clauses):
+        if a == b:
+            continue
+        result = -1 if (a is None or (b is not None and a < b)) else 1
+        return -result if order == "desc" else result
+    return 0
+
+
+def _filter_source(source: dict, includes) -> dict:
+    if includes is None or includes is True:
+        return source
+    if includes is False:
+        return {}
+    if isinstance(includes, dict):
+        includes = includes.get("includes", list(source))
+    if isinstance(includes, str):
+        includes = [includes]
+    return {field: value for field, value in source.items() if field in includes}
+
+
+class FakeNode(BaseNode):
+    """Transport node serving requests from the `store` class attribute."""
+
+    store: FakeStore = None
+
+    def perform_request(self, method, target, body=None, headers=None, request_timeout=None) -> NodeApiResponse:
+        url = urlsplit(target)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [unquote(part) for part in url.path.split("/") if part]
+        self.store.requests.append((method, url.path))
+        status, payload = self._handle(method, parts, params, body)
+        meta = ApiResponseMeta(
+            status=status,
+            http_version="1.1",
+            headers=HttpHeaders({"content-type": "application/json", "x-elastic-product": "Elasticsearch"}),
+            duration=0.0,
+            node=self.config,
+        )
+        return NodeApiResponse(meta, b"" if method == "HEAD" else json.dumps(payload).encode())
+
+    def close(self):
+        pass
+
+    def _handle(self, method: str, parts: list, params: dict, body: Optional[bytes]):
+        store = self.store
+        if not parts:
+            return 200, {"version": {"number": "8.14.0"}, "tagline": "You Know, for Search"}
+
+        if parts[0] == "_bulk" or (len(parts) == 2 and parts[1] == "_bulk"):
+            return 200, self._bulk(parts[0] if parts[0] != "_bulk" else None, body)
+        if parts[0] == "_aliases":
+            for action in json.loads(body)["actions"]:
+                kind, args = next(iter(action.items()))
+                if kind == "add":
+                    store.aliases.setdefault(args["alias"], set()).add(args["index"])
+                elif kind == "remove":
+                    store.aliases.get(args["alias"], set()).discard(args["index"])
+                elif kind == "remove_index":
+                    store.indices.pop(args["index"], None)
+            return 200, {"acknowledged": True}
+        if parts[0] == "_alias":
+            targets = store.aliases.get(parts[1])
+            if not targets:
+                return 404, {"error": f"alias [{parts[1]}] missing", "status": 404}
+            return 200, {index: {"aliases": {parts[1]: {}}} for index in targets}
+
+        name = parts[0]
+        if len(parts) == 1:
+            if method == "HEAD":
+                return (200 if store.resolve(name) else 404), {}
+            if method == "PUT":
+                if name in store.indices:
+                    return 400, {"error": {"type": "resource_already_exists_exception"}, "status": 400}
+                definition = json.loads(body or b"{}")
+                store.indices[name] = {
+                    "mappings": definition.get("mappings", {}),
+                    "settings": definition.get("settings", {}),
+                    "docs": {},
+                }
+                for alias in definition.get("aliases", {}):
+                    store.aliases.setdefault(alias, set()).add(name)
+                return 200, {"acknowledged": True, "index": name}
+            if method == "DELETE":
+                for index in store.resolve(name):
+                    store.indices.pop(index)
+                return 200, {"acknowledged": True}
+
+        indices = store.resolve(name)
+        if not indices:
+            return 404, {"error": {"type": "index_not_found_exception"}, "status": 404}
+        action = parts[1]
+        if action == "_settings":
+            for index in indices:
+                store.indices[index]["settings"].update(json.loads(body)["index"] if b'"index"' in body else json.loads(body))
+            return 200, {"acknowledged": True}
+        if action == "_refresh":
+            return 200, {"_shards": {"failed": 0}}
+        if action == "_mapping":
+            return 200, {index: {"mappings": store.indices[index]["mappings"]} for index in indices}
+        if action == "_count":
+            return 200, {"count": len(self._search(indices, json.loads(body or b"{}"), params)["hits"]["hits"])}
+        if action == "_search":
+            return 200, self._search(indices, json.loads(body or b"{}"), params)
+        if action == "_doc" and method == "GET":
+            for index in indices:
+                if parts[2] in store.indices[index]["docs"]:
+                    return 200, {"_index": index, "_id": parts[2], "found": True, "_source": store.indices[index]["docs"][parts[2]]}
+            return 404, {"found": False}
+        return 400, {"error": f"Unsupported request {method} /{'/'.join(parts)}", "status": 400}
+
+    def _bulk(self, default_index: Optional[str], body: bytes) -> dict:
+        lines = [json.loads(line) for line in body.decode().splitlines() if line.strip()]
+        items = []
+        position = 0
+        while position < len(lines):
+            op, meta = next(iter(lines[position].items()))
+            position += 1
+            index_name = meta.get("_index", default_index)
+            targets = self.store.resolve(index_name)
+            if not targets:
+                self.store.indices[index_name] = {"mappings": {}, "settings": {}, "docs": {}}
+                targets = [index_name]
+            docs = self.store.indices[targets[0]]["docs"]
+            if op == "delete":
+                found = docs.pop(meta["_id"], None) is not None
+                items.append({op: {"_index": targets[0], "_id": meta["_id"], "status": 200 if found else 404}})
+                continue
+            source = lines[position]
+            position += 1
+            if op == "update":
+                source = {**docs.get(meta["_id"], {}), **source.get("doc", {})}
+            created = meta["_id"] not in docs
+            docs[meta["_id"]] = source
+            items.append({op: {"_index": targets[0], "_id": meta["_id"], "status": 201 if created else 200}})
+        return {"took": 1, "errors": False, "items": items}
+
+    def _search(self, indices: list, body: dict, params: dict) -> dict:
+        started = time.perf_counter()
+        hits = []
+        for index in indices:
+            for doc_id, source in self.store.indices[index]["docs"].items():
+                if _matches(body.get("query", {}), source):
+                    hits.append({"_index": index, "_id": doc_id, "_score": 1.0, "_source": source})
+
+        sort = body.get("sort")
+        if sort:
+            clauses = _sort_clauses(sort)
+            for hit in hits:
+                hit["sort"] = _sort_values(hit, clauses)
+            hits.sort(key=functools.cmp_to_key(lambda a, b: _compare(a["sort"], b["sort"], clauses)))
+            if body.get("search_after"):
+                after = body["search_after"]
+                hits = [hit for hit in hits if _compare(hit["sort"], after, clauses) > 0]
+
+        total = len(hits)
+        offset = int(body.get("from", params.get("from", 0)))
+        size = int(body.get("size", params.get("size", 10)))
+        hits = hits[offset:offset + size]
+        for hit in hits:
+            hit["_source"] = _filter_source(hit["_source"], body.get("_source"))
+        return {
+            "took": int((time.perf_counter() - started) * 1000),
+            "timed_out": False,
+            "hits": {"total": {"value": total, "relation": "eq"}, "max_score": 1.0, "hits": hits},
+        }
+
+
+def fake_elasticsearch() -> Elasticsearch:
+    """Returns a client connected to a new, empty in-memory cluster.
+
+    The store is reachable as `client.fake_store` for assertions.
+    """
+    store = FakeStore()
+    node_class = type("BoundFakeNode", (FakeNode,), {"store": store})
+    client = Elasticsearch("http://fake-elasticsearch:9200", node_class=node_class)
+    client.fake_store = store
+    return client
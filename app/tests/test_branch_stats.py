@@ -0,0 +1,125 @@
+# app/tests/test_branch_stats.py
+import asyncio
+import sys
+from datetime import datetime, timedelta
+sys.path.append('../app')
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from branch_stats import get_branch_stats_async, rebuild, refresh_stale
+from crud import upsert_products
+from main import app
+from models import BranchStats, BranchUpdateDay, Product
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    return TestClient(app)
+
+
+def _stats(db) -> dict:
+    return {
+        row.branch_id: (row.product_count, round(row.price_sum, 2), row.price_min, row.price_max, row.stale)
+        for row in db.execute(select(BranchStats)).scalars()
+    }
+
+
+def _days(db) -> dict:
+    return {
+        (row.branch_id, row.day): row.products
+        for row in db.execute(select(BranchUpdateDay)).scalars() if row.products
+    }
+
+
+# Test case: counts, sums and min/max follow the upserts, a price change flags the branch until refreshed
+def test_upserts_maintain_branch_stats(memory_db):
+    rows = [
+        {"part_number": "A", "branch_id": "HIS", "part_price": 1.0, "short_desc": "GALV"},
+        {"part_number": "B", "branch_id": "HIS", "part_price": 5.0, "short_desc": "GALV"},
+        {"part_number": "C", "branch_id": "CIT", "part_price": 2.5, "short_desc": "GALV"},
+    ]
+    upsert_products(memory_db, rows)
+    memory_db.commit()
+    assert _stats(memory_db) == {"HIS": (2, 6.0, 1.0, 5.0, False), "CIT": (1, 2.5, 2.5, 2.5, False)}
+
+    # the minimum of HIS goes up, only a recompute can tell the new one
+    upsert_products(memory_db, [dict(rows[0], part_price=3.0), dict(rows[2], short_desc="FAB")])
+    memory_db.commit()
+    assert _stats(memory_db) == {"HIS": (2, 8.0, 1.0, 5.0, True), "CIT": (1, 2.5, 2.5, 2.5, False)}
+
+    assert refresh_stale(memory_db) == ["HIS"]
+    assert _stats(memory_db) == {"HIS": (2, 8.0, 3.0, 5.0, False), "CIT": (1, 2.5, 2.5, 2.5, False)}
+    assert refresh_stale(memory_db) == []
+
+
+# Test case: the update histogram moves products to the day of their last update and matches a rebuild
+def test_update_histogram(memory_db):
+    today = datetime.utcnow()
+    old = today - timedelta(days=30)
+    memory_db.add_all([
+        Product(part_number="A", branch_id="HIS", part_price=1.0, row_hash="-", createdat=old, updatedat=old),
+        Product(part_number="B", branch_id="HIS", part_price=2.0, row_hash="-", createdat=old, updatedat=old),
+    ])
+    memory_db.flush()
+    rebuild(memory_db)
+    memory_db.commit()
+    assert _days(memory_db) == {("HIS", old.date()): 2}
+
+    upsert_products(memory_db, [{"part_number": "A", "branch_id": "HIS", "part_price": 1.5, "short_desc": None}])
+    memory_db.commit()
+    incremental = (_stats(memory_db)["HIS"][:2], _days(memory_db))
+    assert incremental == ((2, 3.5), {("HIS", old.date()): 1, ("HIS", today.date()): 1})
+
+    rebuild(memory_db)
+    memory_db.commit()
+    assert (_stats(memory_db)["HIS"][:2], _days(memory_db)) == incremental
+
+
+# Test case: the read reports averages and the products updated in the last days
+def test_get_branch_stats(tmp_path):
+    url = f"sqlite+aiosqlite:///{tmp_path / 'stats.db'}"
+    rows = [
+        {"part_number": "A", "branch_id": "HIS", "part_price": 1.0, "short_desc": "GALV"},
+        {"part_number": "B", "branch_id": "HIS", "part_price": 2.0, "short_desc": "GALV"},
+    ]
+
+    async def run():
+        engine = create_async_engine(url)
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(lambda sync: _load(sync, rows))
+            async with AsyncSession(engine) as db:
+                return await get_branch_stats_async(db), await get_branch_stats_async(db, branch_id="CIT")
+        finally:
+            await engine.dispose()
+
+    stats, missing = asyncio.run(run())
+    assert missing == []
+    assert len(stats) == 1
+    assert {key: stats[0][key] for key in ("branch_id", "product_count", "avg_price", "min_price", "max_price", "updated_recently")} == {
+        "branch_id": "HIS", "product_count": 2, "avg_price": 1.5, "min_price": 1.0, "max_price": 2.0, "updated_recently": 2,
+    }
+
+
+def _load(conn, rows):
+    from sqlalchemy.orm import Session
+    from database import Base
+
+    Base.metadata.create_all(bind=conn)
+    db = Session(bind=conn)
+    upsert_products(db, rows)
+    db.flush()
+
+
+# Test case: GET /products/stats and GraphQL branchStats answer from the stats table
+def test_stats_endpoints(test_client):
+    response = test_client.get("/products/stats", params={"branch_id": "NO-SUCH-BRANCH"})
+    assert response.status_code == 200
+    assert response.json() == {"status": "Success", "results": 0, "recent_days": 7, "branches": []}
+
+    query = '{ branchStats(branchId: "NO-SUCH-BRANCH") { branchId productCount avgPrice updatedRecently } }'
+    response = test_client.post("/graphql", json={"query": query})
+    assert response.json() == {"data": {"branchStats": []}}
@@ -0,0 +1,72 @@
+# app/tests/test_cache.py
+import asyncio
+import sys
+sys.path.append('../app')
+
+import time
+
+from cache import LRUCache, ProductCache
+
+
+# Test case: the LRU tier evicts the least recently used entry and expires old ones
+def test_lru_cache_eviction_and_ttl(monkeypatch):
+    cache = LRUCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.evictions == 1
+
+    now = time.monotonic()
+    monkeypatch.setattr("cache.time.monotonic", lambda: now + 11)
+    assert cache.get("a") is None
+    assert cache.expirations == 1
+
+
+# Test case: without Redis the cache reads through once and serves hits locally
+def test_product_cache_read_through():
+    cache = ProductCache(redis_url=None)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        return [{"part_number": "102430"}]
+
+    async def run():
+        first = await cache.get_or_load("list:0:10:", loader)
+        second = await cache.get_or_load("list:0:10:", loader)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second == [{"part_number": "102430"}]
+    assert len(calls) == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits_local"] == 1
+
+
+# Test case: process_csv invalidates cached reads per committed batch and again when it fails midway
+def test_process_csv_bumps_per_batch_and_on_failure(tmp_path, monkeypatch):
+    import celery_tasks
+
+    events = []
+
+    def ingest_file(db, path, on_commit=None, **kwargs):
+        on_commit({"rows": 2, "inserted": 2, "updated": 0, "unchanged": 0, "rejected": 0, "batch": 0})
+        on_commit({"rows": 2, "inserted": 0, "updated": 0, "unchanged": 2, "rejected": 0, "batch": 1})
+        raise ValueError("malformed batch")
+
+    monkeypatch.setattr(celery_tasks, "ingest_file", ingest_file)
+    monkeypatch.setattr(celery_tasks, "_check_upload", lambda path, mode: ("batch:digest", 1, False))
+    monkeypatch.setattr(celery_tasks, "bump_catalog_version", lambda: events.append("bump"))
+    monkeypatch.setattr(celery_tasks, "_refresh_branch_stats", lambda: events.append("refresh"))
+    monkeypatch.setattr(celery_tasks.process_csv, "update_state", lambda **kwargs: None)
+    path = tmp_path / "upload.csv"
+    path.write_text("part_number,branch_id,part_price\n")
+
+    result = celery_tasks.process_csv.apply(args=[str(path)])
+
+    assert result.state == "FAILURE"
+    # one bump for the batch that wrote products, none for the unchanged one, then the failure
+    assert events == ["bump", "refresh", "bump"]
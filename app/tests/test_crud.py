@@ -0,0 +1,128 @@
+# app/tests/test_crud.py
+import asyncio
+import base64
+import os
+import sys
+from dotenv import load_dotenv
+sys.path.append('../app')
+
+from models import Product
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+
+from database import Base
+import pytest
+
+from crud import PRODUCT_FIELDS, decode_cursor, encode_cursor, get_products, get_products_async, get_products_by_keys_async, insert_products_from_csv, next_cursor, upsert_products
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+
+# Test case: a new CSV inserts every distinct (part_number, branch_id)
+def test_insert_products_from_csv(memory_db):
+    with open(os.path.join(BASE_DIR, "test.csv")) as f:
+        reports = insert_products_from_csv(memory_db, f.read(), chunk_size=4)
+
+    assert [report["rows"] for report in reports] == [4, 4, 1]
+    assert sum(report["inserted"] for report in reports) == 8
+    assert memory_db.query(Product).count() == 8
+    # the last occurrence of a duplicated key wins
+    product = memory_db.query(Product).filter_by(part_number="0163D00007", branch_id="CIN").one()
+    assert product.part_price == 4.27
+
+
+# Test case: re-uploading updates in place and preserves createdat
+def test_upsert_products_updates_existing(memory_db):
+    row = {"part_number": "102430", "branch_id": "TUC", "part_price": 3.14, "short_desc": "GALV"}
+    upsert_products(memory_db, [row])
+    memory_db.commit()
+    created = memory_db.query(Product).one().createdat
+
+    reports = upsert_products(memory_db, [dict(row, part_price=9.99), dict(row, branch_id="CIN")])
+    memory_db.commit()
+
+    assert reports == [{"rows": 2, "inserted": 1, "updated": 1, "unchanged": 0, "chunk": 0}]
+    memory_db.expire_all()
+    product = memory_db.query(Product).filter_by(branch_id="TUC").one()
+    assert product.part_price == 9.99
+    assert product.createdat == created
+
+
+# Test case: the async read path returns the same dictionaries on an AsyncSession
+def test_get_products_async(tmp_path):
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/async.db")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(lambda sync_conn: upsert_products(
+                Session(bind=sync_conn),
+                [{"part_number": str(i), "branch_id": "TUC", "part_price": 1.0} for i in range(5)],
+            ))
+        async with AsyncSession(engine) as db:
+            page = await get_products_async(db, skip=1, limit=2)
+            exact = await get_products_async(db, part_number="3", branch_id="TUC")
+            batch = await get_products_by_keys_async(db, [("1", "TUC"), ("4", "TUC"), ("4", "CIN")])
+            # walk every page with the cursor of the previous one
+            pages, cursor = [], None
+            while True:
+                products = await get_products_async(db, limit=2, after=cursor)
+                pages.append([product["part_number"] for product in products])
+                cursor = next_cursor(products, 2)
+                if cursor is None:
+                    break
+        await engine.dispose()
+        return page, exact, pages, batch
+
+    page, exact, pages, batch = asyncio.run(run())
+    assert len(page) == 2
+    assert [product["part_number"] for product in exact] == ["3"]
+    assert set(exact[0]) == {"id", "part_number", "branch_id", "part_price", "short_desc", "createdat", "updatedat"}
+    assert pages == [["0", "1"], ["2", "3"], ["4"]]
+    assert sorted(product["part_number"] for product in batch) == ["1", "4"]
+
+
+# Test case: the sync read path builds the API dictionaries from a column select
+def test_get_products(memory_db):
+    upsert_products(memory_db, [{"part_number": str(i), "branch_id": "TUC", "part_price": 1.0} for i in range(5)])
+
+    page = get_products(memory_db, skip=1, limit=2)
+    exact = get_products(memory_db, part_number="3", branch_id="TUC")
+
+    assert [product["part_number"] for product in page] == ["1", "2"]
+    assert list(exact[0]) == list(PRODUCT_FIELDS)
+    assert exact[0]["createdat"] is not None
+
+
+# Test case: cursors round-trip and tampered ones are rejected
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(42)) == 42
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+    for payload in (b'{"id": true}', b'{"id": false}', b'{"id": 1.5}', b'{"id": "1"}', b'[1]', b'{}'):
+        with pytest.raises(ValueError):
+            decode_cursor(base64.urlsafe_b64encode(payload).decode().rstrip("="))
+
+
+# Test case: rows identical to the stored product are not rewritten
+def test_upsert_products_skips_unchanged(memory_db):
+    rows = [
+        {"part_number": "102430", "branch_id": "TUC", "part_price": 3.14, "short_desc": "GALV"},
+        {"part_number": "102431", "branch_id": "TUC", "part_price": 1.5, "short_desc": None},
+    ]
+    upsert_products(memory_db, rows)
+    memory_db.commit()
+    updated = {product.part_number: product.updatedat for product in memory_db.query(Product)}
+
+    written = []
+    reports = upsert_products(
+        memory_db,
+        [dict(rows[0], part_price=3.140), dict(rows[1], short_desc="FAB"), dict(rows[0], branch_id="CIN")],
+        on_chunk=lambda chunk, report: written.extend(chunk),
+    )
+    memory_db.commit()
+
+    assert reports == [{"rows": 3, "inserted": 1, "updated": 1, "unchanged": 1, "chunk": 0}]
+    assert sorted((row["part_number"], row["branch_id"]) for row in written) == [("102430", "CIN"), ("102431", "TUC")]
+    memory_db.expire_all()
+    assert memory_db.query(Product).filter_by(part_number="102430", branch_id="TUC").one().updatedat == updated["102430"]
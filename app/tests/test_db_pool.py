@@ -0,0 +1,50 @@
+# app/tests/test_db_pool.py
+import sys
+sys.path.append('../app')
+
+from sqlalchemy import text
+
+from db_pool import EngineRegistry, capped_pool_options
+
+
+# Test case: tasks share one engine and its checkouts are counted
+def test_registry_reuses_engine(tmp_path):
+    registry = EngineRegistry(f"sqlite:///{tmp_path}/pool.db")
+    engine = registry.get_engine()
+
+    for _ in range(3):
+        db = registry.session()
+        db.execute(text("select 1"))
+        db.close()
+
+    assert registry.get_engine() is engine
+    [stats] = registry.stats()
+    assert stats["checkouts"] == 3
+    assert stats["connects"] == 1
+    assert stats["checked_out"] == 0
+    registry.dispose_all()
+    assert registry.stats() == []
+
+
+# Test case: a forked child does not reuse the parent's engine
+def test_registry_resets_after_fork(tmp_path, monkeypatch):
+    registry = EngineRegistry(f"sqlite:///{tmp_path}/pool.db")
+    parent_engine = registry.get_engine()
+
+    monkeypatch.setattr("db_pool.os.getpid", lambda: -1)
+
+    assert registry.get_engine() is not parent_engine
+
+
+# Test case: the pools of all workers and engines stay under the connection cap
+def test_capped_pool_options():
+    url = "postgresql://app:secret@db/app"
+    for max_connections, workers in ((60, 1), (60, 4), (100, 7), (10, 8)):
+        options = capped_pool_options(url, max_connections, workers, engines=2)
+        assert options["pool_size"] >= 1
+        if max_connections >= workers * 2:
+            assert workers * 2 * (options["pool_size"] + options["max_overflow"]) <= max_connections
+
+    assert capped_pool_options(url, 60, 4, engines=2) == {"pool_size": 5, "max_overflow": 2}
+    assert capped_pool_options(url, 0, 4) == {}
+    assert capped_pool_options("sqlite://", 60, 4) == {}
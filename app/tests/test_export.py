@@ -0,0 +1,90 @@
+# app/tests/test_export.py
+import asyncio
+import csv
+import gzip
+import io
+import json
+import sys
+import zlib
+from datetime import datetime
+sys.path.append('../app')
+
+import pytest
+from fastapi.testclient import TestClient
+
+from database import SessionLocal
+from export import ExportFormat, gzip_stream, iter_export
+from main import app
+from models import Product
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    return TestClient(app)
+
+
+# Define a fixture inserting the products of a branch used only by these tests
+@pytest.fixture(scope="function")
+def branch():
+    db = SessionLocal()
+    rows = [
+        Product(
+            part_number=f"EXP-{n}", branch_id="EXPORT", part_price=n + 0.5, short_desc=f"GALV x {n}",
+            updatedat=datetime(2024, 1, n + 1),
+        )
+        for n in range(5)
+    ]
+    try:
+        db.add_all(rows)
+        db.commit()
+        yield "EXPORT"
+        for row in rows:
+            db.delete(row)
+        db.commit()
+    finally:
+        db.close()
+
+
+# Test case: the NDJSON export streams one product per line of the requested branch
+def test_export_ndjson(test_client, branch):
+    response = test_client.get("/products/export", params={"branch_id": branch}, headers={"Accept-Encoding": "identity"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "content-encoding" not in response.headers
+    assert response.headers["x-export-watermark"]
+    products = [json.loads(line) for line in response.text.splitlines()]
+    assert [product["part_number"] for product in products] == [f"EXP-{n}" for n in range(5)]
+    assert products[0]["updatedat"] == "2024-01-01T00:00:00"
+
+
+# Test case: the CSV export is gzip compressed on request and only has rows updated since updated_since,
+# less the look-back margin
+def test_export_csv_gzip_incremental(test_client, branch):
+    response = test_client.get(
+        "/products/export",
+        params={"format": "csv", "branch_id": branch, "updated_since": "2024-01-03T00:00:30"},
+        headers={"Accept-Encoding": "gzip"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    # the client decodes the gzip stream
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    # EXP-2 was stamped 30 seconds before the watermark, within EXPORT_WATERMARK_MARGIN
+    assert [row["part_number"] for row in rows] == ["EXP-2", "EXP-3", "EXP-4"]
+    assert rows[1]["part_price"] == "3.5"
+
+
+# Test case: rows are encoded one partition at a time and the gzip stream is one valid member
+def test_iter_export_chunks(branch):
+    async def run():
+        chunks = [chunk async for chunk in iter_export(ExportFormat.ndjson, branch_id=branch, batch_size=2)]
+        compressed = [chunk async for chunk in gzip_stream(iter_export(ExportFormat.ndjson, branch_id=branch, batch_size=2))]
+        return chunks, compressed
+
+    chunks, compressed = asyncio.run(run())
+    assert [chunk.count(b"\n") for chunk in chunks] == [2, 2, 1]
+    assert gzip.decompress(b"".join(compressed)) == b"".join(chunks)
+    # every partition is flushed, so data reaches the client before the export ends
+    assert zlib.decompressobj(31).decompress(compressed[0]).count(b"\n") == 2
@@ -0,0 +1,124 @@
+# app/tests/test_graphql.py
+import sys
+import uuid
+sys.path.append('../app')
+
+import pytest
+from fastapi.testclient import TestClient
+from graphql import parse
+from sqlalchemy import event
+
+from cache import product_cache
+from database import SessionLocal, async_engine
+from graphql_limits import GRAPHQL_MAX_COST, selection_cost
+from main import app
+from models import Product
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    return TestClient(app)
+
+
+# Define a fixture recording the product statements run by the async engine
+@pytest.fixture(scope="function")
+def statements():
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "FROM products" in statement:
+            executed.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+
+# Define a fixture pinning an unused catalog version, so no cached read of either tier matches
+@pytest.fixture(scope="function")
+def cold_cache(monkeypatch):
+    version = uuid.uuid4().int % 10 ** 12
+
+    async def catalog_version(strict=False):
+        return version
+
+    monkeypatch.setattr(product_cache, "catalog_version", catalog_version)
+    return version
+
+
+# Define a fixture inserting three products with unique part numbers, so no cached read matches
+@pytest.fixture(scope="function")
+def products():
+    prefix = uuid.uuid4().hex[:8]
+    rows = [
+        Product(part_number=f"{prefix}-{n}", branch_id="BR1", part_price=float(n), short_desc=f"desc {n}")
+        for n in range(3)
+    ]
+    db = SessionLocal()
+    try:
+        db.add_all(rows)
+        db.commit()
+        yield [(row.part_number, row.branch_id) for row in rows]
+        for row in rows:
+            db.delete(row)
+        db.commit()
+    finally:
+        db.close()
+
+
+# Test case: aliased exact lookups of one document are answered by a single projected query
+def test_aliased_lookups_batch_into_one_query(test_client, statements, products):
+    aliases = "\n".join(
+        f'p{n}: products(partNumber: "{part_number}", branchId: "{branch_id}") {{ partNumber partPrice }}'
+        for n, (part_number, branch_id) in enumerate(products)
+    )
+    missing = 'missing: products(partNumber: "no-such-part", branchId: "BR1") { partNumber }'
+    response = test_client.post("/graphql", json={"query": f"{{ {aliases}\n{missing} }}"})
+
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert [data[f"p{n}"][0]["partPrice"] for n in range(3)] == [0.0, 1.0, 2.0]
+    assert data["missing"] == []
+    # one statement per distinct field set, only the selected columns are read
+    assert len(statements) == 2
+    assert all("short_desc" not in statement for statement in statements)
+
+
+# Test case: listings read only the selected columns plus the id of the cursor
+def test_products_page_projection(test_client, statements, products, cold_cache):
+    query = '{ productsPage(limit: 2) { products { partNumber } nextCursor } }'
+    response = test_client.post("/graphql", json={"query": query})
+
+    assert response.status_code == 200
+    page = response.json()["data"]["productsPage"]
+    assert len(page["products"]) == 2
+    assert len(statements) == 1
+    assert "products.id" in statements[0]
+    assert "short_desc" not in statements[0] and "part_price" not in statements[0]
+
+
+# Test case: list fields multiply the cost of their selections by the page size
+def test_selection_cost():
+    document = parse('''
+        query ($limit: Int) {
+            a: products(limit: 100) { id partNumber }
+            b: products(partNumber: "1", branchId: "2") { ...Fields }
+            c: productsPage(limit: $limit) { products { id } nextCursor }
+        }
+        fragment Fields on ProductSchema { id partNumber branchId }
+    ''')
+    fragments = {definition.name.value: definition for definition in document.definitions[1:]}
+    cost = selection_cost(document.definitions[0].selection_set, fragments, {"limit": 5})
+    assert cost == (1 + 100 * 2) + (1 + 3) + (1 + 5 * (1 + 1 + 1))
+
+
+# Test case: documents over the cost limit are rejected before any resolver runs
+def test_query_cost_limit(test_client, statements):
+    query = '{ products(limit: %d) { id partNumber } }' % GRAPHQL_MAX_COST
+    response = test_client.post("/graphql", json={"query": query})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["data"] is None
+    assert "exceeds the maximum" in body["errors"][0]["message"]
+    assert statements == []
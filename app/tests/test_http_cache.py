@@ -0,0 +1,142 @@
+# app/tests/test_http_cache.py
+import sys
+sys.path.append('../app')
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from starlette.requests import Request
+
+from cache import product_cache
+from database import SessionLocal, async_engine
+from http_cache import is_not_modified
+from main import app
+from models import Product
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    return TestClient(app)
+
+
+# Define a fixture pinning the catalog version the web process reads from Redis
+@pytest.fixture(scope="function")
+def catalog(monkeypatch):
+    state = {"version": 7}
+
+    async def catalog_version(strict=False):
+        return state["version"]
+
+    async def catalog_modified():
+        return 1700000000.0
+
+    monkeypatch.setattr(product_cache, "catalog_version", catalog_version)
+    monkeypatch.setattr(product_cache, "catalog_modified", catalog_modified)
+    return state
+
+
+# Define a fixture recording the product statements run by the async engine
+@pytest.fixture(scope="function")
+def statements():
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "products" in statement:
+            executed.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+
+def _request(**headers) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+# Test case: If-None-Match wins over If-Modified-Since and compares weakly
+def test_is_not_modified():
+    headers = {"ETag": '"7-abc"', "Last-Modified": "Tue, 14 Nov 2023 22:13:20 GMT"}
+
+    assert is_not_modified(_request(if_none_match='"6-abc", "7-abc"'), headers)
+    assert is_not_modified(_request(if_none_match='W/"7-abc"'), headers)
+    assert is_not_modified(_request(if_none_match="*"), headers)
+    assert not is_not_modified(
+        _request(if_none_match='"6-abc"', if_modified_since="Tue, 14 Nov 2023 22:13:20 GMT"), headers
+    )
+    assert is_not_modified(_request(if_modified_since="Tue, 14 Nov 2023 22:13:20 GMT"), headers)
+    assert not is_not_modified(_request(if_modified_since="Tue, 14 Nov 2023 22:13:19 GMT"), headers)
+    assert not is_not_modified(_request(if_modified_since="yesterday"), headers)
+    assert not is_not_modified(_request(if_none_match='"7-abc"'), {"Cache-Control": "no-cache"})
+
+
+# Test case: revalidating a listing answers 304 without a products query until the version changes
+def test_products_conditional_get(test_client, catalog, statements):
+    first = test_client.get("/products", params={"limit": 3})
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert etag.startswith('"7-')
+    assert first.headers["last-modified"]
+    assert first.headers["cache-control"].startswith("public")
+
+    statements.clear()
+    revalidated = test_client.get("/products", params={"limit": 3}, headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == etag
+    assert statements == []
+
+    other_page = test_client.get("/products", params={"limit": 4}, headers={"If-None-Match": etag})
+    assert other_page.status_code == 200
+
+    catalog["version"] = 8
+    changed = test_client.get("/products", params={"limit": 3}, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"].startswith('"8-')
+
+
+# Test case: a lookup revalidation with a cold product cache is answered without reading the product
+def test_lookup_conditional_get_skips_the_table(test_client, catalog, statements):
+    # Last-Modified is read once per catalog version
+    assert test_client.get("/products", params={"limit": 1}).status_code == 200
+    statements.clear()
+
+    params = {"part_number": "HTTP-CACHE-COLD", "branch_id": "TUC"}
+    headers = {"If-Modified-Since": "Wed, 01 Jan 2100 00:00:00 GMT"}
+    assert test_client.get("/products/lookup", params=params, headers=headers).status_code == 304
+    assert statements == []
+
+
+# Test case: lookups are revalidated by date as well, cached misses stay 404
+def test_lookup_if_modified_since(test_client, catalog):
+    db = SessionLocal()
+    product = Product(part_number="HTTP-CACHE-1", branch_id="TUC", part_price=1.0)
+    db.add(product)
+    db.commit()
+    try:
+        params = {"part_number": "HTTP-CACHE-1", "branch_id": "TUC"}
+        headers = {"If-Modified-Since": "Wed, 01 Jan 2100 00:00:00 GMT"}
+        assert test_client.get("/products/lookup", params=params).status_code == 200
+        assert test_client.get("/products/lookup", params=params, headers=headers).status_code == 304
+
+        params["branch_id"] = "CIN"
+        assert test_client.get("/products/lookup", params=params).status_code == 404
+        assert test_client.get("/products/lookup", params=params, headers=headers).status_code == 404
+    finally:
+        db.delete(product)
+        db.commit()
+        db.close()
+
+
+# Test case: without a readable catalog version responses carry no validators
+def test_products_without_catalog_version(test_client, monkeypatch):
+    async def catalog_version(strict=False):
+        return None if strict else 0
+
+    monkeypatch.setattr(product_cache, "catalog_version", catalog_version)
+    response = test_client.get("/products", headers={"If-None-Match": "*"})
+    assert response.status_code == 200
+    assert "etag" not in response.headers
+    assert response.headers["cache-control"] == "no-cache"
@@ -0,0 +1,165 @@
+# app/tests/test_ingest.py
+import asyncio
+import csv
+import io
+import os
+import stat
+import sys
+from dotenv import load_dotenv
+sys.path.append('../app')
+
+import pytest
+from starlette.datastructures import UploadFile
+
+from models import Product
+from ingest import (
+    CopyStream, IngestMode, IngestProgress, copy_file, count_data_rows, file_digest, ingest_file, iter_copy_chunks, iter_csv_rows, shard_for, split_csv, spool_upload
+)
+from crud import row_fingerprint
+from validation import Quarantine
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+
+# Test case: the upload is copied chunk by chunk into the spool directory
+def test_spool_upload(tmp_path):
+    upload = UploadFile(io.BytesIO(b"part_number,branch_id\n102430,TUC\n"), filename="test.csv")
+    path = asyncio.run(spool_upload(upload, directory=str(tmp_path), chunk_size=4))
+
+    assert os.path.dirname(path) == str(tmp_path)
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+    with open(path, "rb") as f:
+        assert f.read() == b"part_number,branch_id\n102430,TUC\n"
+
+
+# Test case: spooling never blocks the event loop on file system calls
+def test_spool_upload_offloads_file_io(tmp_path, monkeypatch):
+    offloaded = []
+
+    async def run_in_threadpool(func, *args, **kwargs):
+        offloaded.append(getattr(func, "__name__", func))
+        return func(*args, **kwargs)
+
+    monkeypatch.setattr("ingest.run_in_threadpool", run_in_threadpool)
+    upload = UploadFile(io.BytesIO(b"part_number,branch_id\n102430,TUC\n"), filename="test.csv")
+    asyncio.run(spool_upload(upload, directory=str(tmp_path), chunk_size=16))
+
+    assert offloaded == ["_make_spool_dir", "_open_spool_file", "write", "write", "write", "close", "replace"]
+
+
+# Test case: the spool directory and files are writable by the workers' group whatever the umask
+def test_spool_upload_modes(tmp_path):
+    directory = tmp_path / "uploads"
+    upload = UploadFile(io.BytesIO(b"part_number\n102430\n"), filename="test.csv")
+    umask = os.umask(0o077)
+    try:
+        path = asyncio.run(spool_upload(upload, directory=str(directory)))
+    finally:
+        os.umask(umask)
+
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o2775
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o664
+
+
+# Test case: quoted descriptions may contain commas
+def test_iter_csv_rows_quoted(tmp_path):
+    path = tmp_path / "quoted.csv"
+    path.write_text('PART_NUMBER,BRANCH_ID,PART_PRICE,SHORT_DESC\n102430,TUC,3.14,"GALV, FAB"\n\n')
+
+    assert list(iter_csv_rows(str(path))) == [
+        {"part_number": "102430", "branch_id": "TUC", "part_price": "3.14", "short_desc": "GALV, FAB"}
+    ]
+
+
+# Test case: the worker commits the file in fixed-size batches
+def test_ingest_file(memory_db):
+    reports = ingest_file(memory_db, os.path.join(BASE_DIR, "test.csv"), batch_size=4)
+
+    assert [report["batch"] for report in reports] == [0, 1, 2]
+    assert sum(report["inserted"] for report in reports) == 9 - 1
+    assert sum(report["updated"] for report in reports) == 1
+    assert memory_db.query(Product).count() == 8
+
+
+# Test case: a retried ingestion resumes after the last committed batch of its checkpoint
+def test_ingest_file_resume(memory_db):
+    path = os.path.join(BASE_DIR, "test.csv")
+    progress = IngestProgress(count_data_rows(path))
+    ingest_file(memory_db, path, batch_size=4, on_commit=progress.add, start_batch=0)
+    assert progress.snapshot()["batches"] == 3
+    memory_db.query(Product).delete()
+    memory_db.commit()
+
+    resumed = IngestProgress(count_data_rows(path), {"batches": 2, "rows": 8, "inserted": 7, "attempts": 1, "elapsed": 1.0})
+    reports = ingest_file(memory_db, path, batch_size=4, on_commit=resumed.add, start_batch=resumed.batches)
+
+    assert [report["batch"] for report in reports] == [2]
+    assert memory_db.query(Product).count() == 1
+    snapshot = resumed.snapshot()
+    assert (snapshot["batches"], snapshot["rows"], snapshot["processed"], snapshot["total_rows"]) == (3, 9, 9, 9)
+    assert snapshot["attempts"] == 2
+    assert snapshot["eta_seconds"] == 0
+
+
+# Test case: re-ingesting the same file writes and reindexes nothing
+def test_ingest_file_unchanged(memory_db):
+    path = os.path.join(BASE_DIR, "test.csv")
+    ingest_file(memory_db, path, batch_size=4)
+    indexed = []
+
+    # one batch, a key repeated across batches is rewritten by each of them
+    reports = ingest_file(memory_db, path, batch_size=100, on_batch=lambda rows, report: indexed.extend(rows))
+
+    assert sum(report["inserted"] + report["updated"] for report in reports) == 0
+    assert sum(report["unchanged"] for report in reports) == 8
+    assert indexed == []
+    assert file_digest(path) == file_digest(path, chunk_size=7)
+
+
+# Test case: every key lands in exactly one shard, in file order
+def test_split_csv(tmp_path):
+    path = tmp_path / "upload.csv"
+    with open(os.path.join(BASE_DIR, "test.csv")) as f:
+        path.write_text(f.read() + ",TUC,1.0,missing part number\n")
+
+    split = split_csv(str(path), 3)
+
+    assert split["rejected"] == 1
+    seen = {}
+    for shard_path in split["shards"]:
+        with open(shard_path, newline="") as f:
+            rows = list(csv.reader(f))[1:]
+        for part_number, branch_id, part_price, _ in rows:
+            assert shard_for(part_number, branch_id, 3) == int(shard_path[-1])
+            seen.setdefault((part_number, branch_id), []).append(part_price)
+    assert len(seen) == 8
+    assert seen[("0163D00007", "CIN")] == ["3.14", "4.27"]
+
+
+# Test case: COPY reads the staging rows in any read size, rejected rows are quarantined
+def test_copy_stream(tmp_path):
+    path = tmp_path / "upload.csv"
+    path.write_text('PART_NUMBER,BRANCH_ID,PART_PRICE,SHORT_DESC\n102430,TUC,3.14,"GALV, FAB"\n,TUC,1,x\n102430,TUC,4.5,\n')
+    counts = {}
+    with Quarantine(str(path)) as quarantine:
+        stream = CopyStream(iter_copy_chunks(str(path), quarantine, counts, batch_size=1))
+        data = b""
+        while True:
+            chunk = stream.read(5)
+            if not chunk:
+                break
+            data += chunk
+
+    assert data == (
+        f'1,102430,TUC,3.14,"GALV, FAB",{row_fingerprint(3.14, "GALV, FAB")}\n'
+        f'2,102430,TUC,4.5,,{row_fingerprint(4.5, None)}\n'
+    ).encode()
+    assert counts == {"rows": 2, "rejected": 1}
+    assert os.path.exists(quarantine.path)
+
+
+# Test case: COPY ingestion is refused on databases other than PostgreSQL
+def test_copy_file_requires_postgres(memory_db, tmp_path):
+    with pytest.raises(ValueError):
+        copy_file(memory_db, os.path.join(BASE_DIR, "test.csv"), IngestMode.replace)
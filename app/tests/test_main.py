@@ -53,13 +53,35 @@ def test_read_main(test_client):
 def test_upload_file(test_client, db_session):
     response = test_client.post("/products/upload", files={"file": ("test.csv")})
     assert response.status_code == 201
-    assert response.json() == {"message": "File uploaded successfully"}
+    assert response.json()["message"] == "File uploaded successfully"
+    assert response.json()["job_id"]
+
+# Test case: the spooled file is deleted when the upload cannot be queued
+def test_upload_file_unqueued_is_removed(test_client, tmp_path, monkeypatch):
+    from ingest import spool_upload
+
+    def unavailable(*args, **kwargs):
+        raise ConnectionError("broker unavailable")
+
+    monkeypatch.setattr("product.spool_upload", lambda file: spool_upload(file, directory=str(tmp_path)))
+    monkeypatch.setattr("product.process_csv.apply_async", unavailable)
+    response = test_client.post("/products/upload", files={"file": ("test.csv", b"part_number,branch_id\n")})
+    assert response.status_code == 500
+    assert os.listdir(tmp_path) == []
 
 # Test case: Ensure the products endpoint returns a valid response
 def test_read_products(test_client, db_session):
     response = test_client.get("/products")
     assert response.status_code == 200
     assert len(response.json()) >= 0
+    assert response.headers["content-type"] == "application/json"
+    assert set(response.json()) == {"status", "results", "products", "next_cursor"}
+
+# Test case: a malformed cursor, including a boolean id, is rejected with 400
+def test_read_products_invalid_cursor(test_client):
+    for cursor in ("not-a-cursor", "eyJpZCI6IHRydWV9"):  # the second is {"id": true}
+        response = test_client.get("/products", params={"cursor": cursor})
+        assert response.status_code == 400
     
 # graphql based test
 def test_query(test_client, db_session):
@@ -0,0 +1,85 @@
+# app/tests/test_metrics.py
+import sys
+sys.path.append('../app')
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+
+from metrics import MetricsMiddleware, graphql_operation, instrument_sqlalchemy
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+# Test case: requests are labelled with the route template, GraphQL with the operation
+def test_metrics_middleware():
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    @app.post("/graphql")
+    async def graphql(request: Request):
+        return {"data": {}, "query": (await request.json())["query"]}
+
+    app.add_middleware(MetricsMiddleware)
+    client = TestClient(app)
+    route = {"method": "GET", "route": "/items/{item_id}", "status": "200"}
+    before = sample("http_request_duration_seconds_count", **route)
+    before_unmatched = sample("http_request_duration_seconds_count", method="GET", route="unmatched", status="404")
+    before_graphql = sample("graphql_request_duration_seconds_count", operation="ProductsPage")
+
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/nowhere")
+    client.post("/graphql", json={"query": "query ProductsPage { productsPage { nextCursor } }"})
+
+    assert sample("http_request_duration_seconds_count", **route) == before + 2
+    assert sample("http_request_duration_seconds_count", method="GET", route="unmatched", status="404") == before_unmatched + 1
+    assert sample("graphql_request_duration_seconds_count", operation="ProductsPage") == before_graphql + 1
+
+
+def test_graphql_operation():
+    assert graphql_operation(b'{"query": "{ products(limit: 1) { id } }"}') == "products"
+    assert graphql_operation(b'{"query": "query A { products { id } }", "operationName": "B"}') == "B"
+    assert graphql_operation(b"not json") == "invalid"
+
+
+# Test case: statements of every engine are timed by operation
+def test_instrument_sqlalchemy(memory_db):
+    instrument_sqlalchemy()
+    instrument_sqlalchemy()
+    before = sample("db_query_duration_seconds_count", operation="select")
+
+    memory_db.execute(text("SELECT 1"))
+
+    assert sample("db_query_duration_seconds_count", operation="select") == before + 1
+
+
+# Test case: in multiprocess mode the web pools are published to the livesum gauges of every process
+def test_pool_gauges_multiprocess(tmp_path):
+    import os
+    import subprocess
+
+    script = f"""
+from sqlalchemy import create_engine, text
+import metrics
+
+engine = create_engine("sqlite:///{tmp_path / 'pool.db'}", pool_size=3)
+metrics.register_pool_collector(lambda: [("sync", engine)])
+with engine.connect() as conn:
+    conn.execute(text("SELECT 1"))
+    print(metrics.metrics_payload()[0].decode())
+"""
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path / "prometheus")}
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", script], cwd=app_dir, env=env, capture_output=True, text=True, check=True
+    ).stdout
+
+    assert 'db_pool_connections{engine="sync",state="size"} 3.0' in output
+    assert 'db_pool_connections{engine="sync",state="checked_out"} 1.0' in output
@@ -0,0 +1,98 @@
+# app/tests/test_price_history.py
+import sys
+from datetime import datetime, timedelta, timezone
+sys.path.append('../app')
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from crud import upsert_products
+from main import app
+from models import Product, ProductPriceHistory
+from price_history import (
+    ensure_partitions, month_start, naive_utc, partition_name, price_as_of, prune_partitions, record_price_changes,
+)
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    return TestClient(app)
+
+
+def _history(db) -> list:
+    return db.execute(
+        select(ProductPriceHistory.part_number, ProductPriceHistory.part_price, ProductPriceHistory.valid_from)
+        .order_by(ProductPriceHistory.part_number, ProductPriceHistory.valid_from)
+    ).all()
+
+
+def _prices_as_of(db, as_of: datetime) -> dict:
+    return dict(db.execute(select(Product.part_number, price_as_of(as_of)).order_by(Product.part_number)).all())
+
+
+# Test case: inserts and price changes are recorded, description only changes are not
+def test_upsert_records_price_changes(memory_db):
+    rows = [
+        {"part_number": "A", "branch_id": "HIS", "part_price": 1.0, "short_desc": "GALV"},
+        {"part_number": "B", "branch_id": "HIS", "part_price": 2.0, "short_desc": "GALV"},
+    ]
+    upsert_products(memory_db, rows)
+    memory_db.commit()
+    upsert_products(memory_db, [dict(rows[0], part_price=1.004), dict(rows[1], short_desc="FAB")])
+    memory_db.commit()
+    upsert_products(memory_db, [dict(rows[0], part_price=1.5)])
+    memory_db.commit()
+
+    history = _history(memory_db)
+    assert [(part_number, price) for part_number, price, _ in history] == [("A", 1.0), ("A", 1.5), ("B", 2.0)]
+    updatedat = dict(memory_db.execute(select(Product.part_number, Product.updatedat)).all())
+    assert history[1][2] == updatedat["A"]
+
+
+# Test case: as-of prices come from the history, products created later have none
+def test_price_as_of(memory_db):
+    start = datetime(2024, 1, 1)
+    memory_db.add_all([
+        Product(part_number="A", branch_id="HIS", part_price=3.0, createdat=start, updatedat=datetime(2024, 3, 1)),
+        Product(part_number="B", branch_id="HIS", part_price=5.0, createdat=start, updatedat=datetime(2024, 1, 1)),
+        Product(part_number="C", branch_id="HIS", part_price=7.0, createdat=datetime(2024, 6, 1), updatedat=datetime(2024, 6, 1)),
+    ])
+    record_price_changes(memory_db, [{"part_number": "A", "branch_id": "HIS", "part_price": 1.0}], start)
+    record_price_changes(memory_db, [{"part_number": "A", "branch_id": "HIS", "part_price": 3.0}], datetime(2024, 3, 1))
+    record_price_changes(memory_db, [{"part_number": "C", "branch_id": "HIS", "part_price": 7.0}], datetime(2024, 6, 1))
+    memory_db.commit()
+
+    assert _prices_as_of(memory_db, datetime(2024, 2, 1)) == {"A": 1.0, "B": 5.0, "C": None}
+    assert _prices_as_of(memory_db, datetime(2024, 7, 1)) == {"A": 3.0, "B": 5.0, "C": 7.0}
+    # aware times are compared in UTC
+    as_of = datetime(2024, 3, 1, 1, tzinfo=timezone(timedelta(hours=2)))
+    assert _prices_as_of(memory_db, as_of)["A"] == 1.0
+    assert naive_utc(as_of) == datetime(2024, 2, 29, 23)
+
+
+# Test case: monthly partition bounds, and pruning without partitions deletes the expired rows
+def test_partitions_and_retention(memory_db):
+    assert month_start(datetime(2024, 12, 15, 8), 1) == datetime(2025, 1, 1)
+    assert month_start(datetime(2024, 1, 31), -13) == datetime(2022, 12, 1)
+    assert partition_name(datetime(2024, 3, 1)) == "product_price_history_y2024m03"
+
+    engine = memory_db.get_bind()
+    assert ensure_partitions(engine) == []
+    record_price_changes(memory_db, [{"part_number": "A", "branch_id": "HIS", "part_price": 1.0}], datetime(2022, 5, 31))
+    record_price_changes(memory_db, [{"part_number": "A", "branch_id": "HIS", "part_price": 2.0}], datetime(2022, 6, 1))
+    memory_db.commit()
+
+    assert prune_partitions(engine, retention_months=24, now=datetime(2024, 6, 10)) == []
+    assert [price for _, price, _ in _history(memory_db)] == [2.0]
+
+
+# Test case: GET /products and GraphQL products answer as of a time before any product existed
+def test_as_of_endpoints(test_client):
+    response = test_client.get("/products", params={"as_of": "2000-01-01T00:00:00Z", "limit": 100})
+    assert response.status_code == 200
+    assert response.json()["products"] == []
+
+    query = '{ products(asOf: "2000-01-01T00:00:00", limit: 100) { partNumber partPrice } }'
+    response = test_client.post("/graphql", json={"query": query})
+    assert response.json() == {"data": {"products": []}}
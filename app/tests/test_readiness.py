@@ -0,0 +1,124 @@
+# app/tests/test_readiness.py
+import asyncio
+import json
+import os
+import subprocess
+import sys
+sys.path.append('../app')
+
+import pytest
+from fastapi.testclient import TestClient
+
+import readiness
+from main import app
+from readiness import Probe
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Seconds the import of main and the lifespan startup may each take
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "5"))
+
+STARTUP_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+client = TestClient(main.app)
+entering = time.perf_counter()
+with client:
+    started_up = time.perf_counter()
+    ready = client.get("/ready")
+print(json.dumps({
+    "import": imported - started,
+    "startup": started_up - entering,
+    "status": ready.status_code,
+    "report": ready.json(),
+}))
+"""
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    return TestClient(app)
+
+
+async def _passes():
+    pass
+
+
+async def _fails():
+    raise ConnectionError("refused")
+
+
+async def _hangs():
+    await asyncio.sleep(10)
+
+
+# Test case: a probe result is reused until it is older than the ttl, concurrent callers share one check
+def test_probe_caches_result():
+    probe = Probe(_passes, ttl=60)
+
+    async def run():
+        results = await asyncio.gather(*(probe.result() for _ in range(5)))
+        return results + [await probe.result()]
+
+    results = asyncio.run(run())
+    assert probe.runs == 1
+    assert all(result["ready"] for result in results)
+
+    probe.ttl = 0
+    asyncio.run(probe.result())
+    assert probe.runs == 2
+
+
+# Test case: failing and hanging checks are reported as not ready with their error
+def test_probe_failures():
+    failed = asyncio.run(Probe(_fails).result())
+    timed_out = asyncio.run(Probe(_hangs, timeout=0.05).result())
+
+    assert failed["ready"] is False
+    assert failed["error"] == "ConnectionError: refused"
+    assert timed_out["ready"] is False
+    assert "0.05s" in timed_out["error"]
+
+
+# Test case: only the required probes decide readiness, the others are reported
+def test_ready_endpoint(test_client, monkeypatch):
+    monkeypatch.setattr(readiness, "PROBES", {
+        "database": Probe(readiness.check_database),
+        "elasticsearch": Probe(_fails),
+    })
+
+    response = test_client.get("/ready")
+    assert response.status_code == 200
+    report = response.json()
+    assert report["ready"] is True
+    assert report["checks"]["database"] == {**report["checks"]["database"], "ready": True, "required": True}
+    assert report["checks"]["elasticsearch"]["ready"] is False
+    assert report["checks"]["elasticsearch"]["required"] is False
+
+    monkeypatch.setattr(readiness, "READY_REQUIRED", ("database", "elasticsearch"))
+    response = test_client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["ready"] is False
+
+
+# Test case: importing main and starting the app connect to nothing and stay within the time budget
+def test_startup_budget(tmp_path):
+    env = {
+        **os.environ,
+        # unusable dependencies: any connection attempt at import or startup would fail
+        "DB_URI": f"sqlite:///{tmp_path}/missing/app.db",
+        "ELASTICSEARCH_URL": "http://127.0.0.1:1",
+        "REDIS_CACHE_URL": "redis://127.0.0.1:1/1",
+        "READY_PROBE_TIMEOUT": "1",
+    }
+    output = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT], cwd=APP_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.splitlines()[-1])
+
+    assert result["import"] < STARTUP_BUDGET_SECONDS
+    assert result["startup"] < STARTUP_BUDGET_SECONDS
+    assert result["status"] == 503
+    assert result["report"]["checks"]["database"]["ready"] is False
@@ -0,0 +1,86 @@
+# app/tests/test_schema.py
+import sys
+sys.path.append('../app')
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from crud import upsert_products
+from schema import create_schema
+
+
+# products as created by init-db.sql before it had the unique key, with a duplicated key
+PRODUCTS_WITHOUT_KEY = """
+CREATE TABLE products (
+    id INTEGER PRIMARY KEY,
+    part_number VARCHAR(100) NOT NULL,
+    branch_id VARCHAR(100),
+    part_price NUMERIC(10, 2) NOT NULL,
+    short_desc VARCHAR(255),
+    row_hash VARCHAR(32),
+    createdat TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updatedat TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+SEED = [
+    "INSERT INTO products (part_number, branch_id, part_price) VALUES ('0163D00007', 'CIN', 3.14)",
+    "INSERT INTO products (part_number, branch_id, part_price) VALUES ('102430', 'TUC', 3.14)",
+    "INSERT INTO products (part_number, branch_id, part_price) VALUES ('0163D00007', 'CIN', 4.27)",
+]
+
+
+@pytest.fixture
+def existing_db():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    with engine.begin() as conn:
+        conn.execute(text(PRODUCTS_WITHOUT_KEY))
+        for statement in SEED:
+            conn.execute(text(statement))
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+
+
+# products as created by the original init-db.sql, before row_hash
+PRODUCTS_BASELINE = PRODUCTS_WITHOUT_KEY.replace("    row_hash VARCHAR(32),\n", "")
+
+
+# Test case: columns added to the models since are added to an existing products table
+def test_create_schema_adds_missing_columns():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    with engine.begin() as conn:
+        conn.execute(text(PRODUCTS_BASELINE))
+        conn.execute(text(SEED[1]))
+    assert "row_hash" not in {column["name"] for column in inspect(engine).get_columns("products")}
+
+    create_schema(bind=engine)
+    create_schema(bind=engine)
+
+    assert "row_hash" in {column["name"] for column in inspect(engine).get_columns("products")}
+    with Session(bind=engine) as db:
+        row = {"part_number": "102430", "branch_id": "TUC", "part_price": 3.5, "short_desc": None}
+        assert upsert_products(db, [row])[0]["updated"] == 1
+        db.commit()
+        assert upsert_products(db, [row])[0]["unchanged"] == 1
+    engine.dispose()
+
+
+# Test case: the unique key is created on an existing products table, duplicates removed first, and it is idempotent
+def test_create_schema_adds_the_product_key(existing_db):
+    create_schema(bind=existing_db)
+    create_schema(bind=existing_db)
+
+    indexes = {index["name"]: index for index in inspect(existing_db).get_indexes("products")}
+    assert indexes["ix_part_number_branch_id"]["unique"]
+    with existing_db.connect() as conn:
+        assert conn.execute(text("SELECT part_number, part_price FROM products ORDER BY id")).all() == [
+            ("102430", 3.14), ("0163D00007", 4.27),
+        ]
+
+    with Session(bind=existing_db) as db:
+        upsert_products(db, [{"part_number": "0163D00007", "branch_id": "CIN", "part_price": 5.0, "short_desc": None}])
+        db.commit()
+        assert db.execute(text("SELECT COUNT(*) FROM products WHERE part_number = '0163D00007'")).scalar() == 1
@@ -0,0 +1,64 @@
+# app/tests/test_search.py
+import os
+import sys
+from dotenv import load_dotenv
+sys.path.append('../app')
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import search
+from search_index import bulk_index_products, ensure_index
+from fake_elasticsearch import fake_elasticsearch
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+PRODUCTS = [
+    {"part_number": "0121F00548", "branch_id": "TUC", "part_price": 3.14, "short_desc": "GALV x FAB x .026 x 29.88"},
+    {"part_number": "0121G00047P", "branch_id": "TUC", "part_price": 42.5, "short_desc": "GALV x FAB x .026"},
+    {"part_number": "0121G00509", "branch_id": "CIN", "part_price": 3.14, "short_desc": "GALV x FAB"},
+    {"part_number": "102430", "branch_id": "TUC", "part_price": 3.14, "short_desc": "STEEL x .026"},
+]
+
+
+# Define a fixture for a search API backed by the in-memory Elasticsearch
+@pytest.fixture(scope="function")
+def search_client(monkeypatch):
+    es = fake_elasticsearch()
+    ensure_index(es, "products")
+    bulk_index_products(es, PRODUCTS, index="products")
+    monkeypatch.setattr(search, "get_es", lambda: es)
+
+    app = FastAPI()
+    app.include_router(search.router)
+    return TestClient(app)
+
+
+# Test case: typeahead returns only the requested fields for a part number prefix
+def test_typeahead(search_client):
+    response = search_client.get("/search/typeahead", params={"prefix": "0121G"})
+    assert response.status_code == 200
+    assert response.json() == [
+        {"part_number": "0121G00047P", "branch_id": "TUC"},
+        {"part_number": "0121G00509", "branch_id": "CIN"},
+    ]
+
+
+# Test case: filters combine and search_after walks every page exactly once
+def test_search_filters_and_pages(search_client):
+    params = {"q": ".026", "branch_id": "TUC", "max_price": 50, "size": 2}
+    first = search_client.get("/search", params=params).json()
+    second = search_client.get("/search", params={**params, "search_after": first["next"]}).json()
+
+    assert first["total"] == 3
+    assert set(first["products"][0]) == {"part_number", "branch_id", "part_price", "short_desc"}
+    part_numbers = [product["part_number"] for product in first["products"] + second["products"]]
+    assert sorted(part_numbers) == ["0121F00548", "0121G00047P", "102430"]
+    assert second["next"] is None
+
+
+# Test case: a tampered cursor is rejected
+def test_search_invalid_cursor(search_client):
+    assert search_client.get("/search", params={"search_after": "bogus"}).status_code == 400
@@ -0,0 +1,90 @@
+# app/tests/test_search_index.py
+import os
+import sys
+sys.path.append('../app')
+
+import search_index
+from crud import insert_products_from_csv, upsert_products
+from search_index import bulk_index_products, ensure_index, index_products_by_keys, reindex_all
+from fake_elasticsearch import fake_elasticsearch
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# Test case: the alias is created with the explicit mapping and bulk indexed into
+def test_bulk_index_products():
+    es = fake_elasticsearch()
+    index = ensure_index(es, "products")
+    products = [
+        {"id": i, "part_number": str(i), "branch_id": "TUC", "part_price": 1.5, "short_desc": "GALV"}
+        for i in range(7)
+    ]
+
+    assert bulk_index_products(es, products, index="products", chunk_size=3) == {"indexed": 7, "failed": 0}
+    assert es.fake_store.aliases["products"] == {index}
+    assert es.fake_store.indices[index]["mappings"]["properties"]["branch_id"] == {"type": "keyword"}
+    assert es.fake_store.requests.count(("PUT", "/_bulk")) == 3
+    assert es.count(index="products")["count"] == 7
+
+
+# Test case: a full reindex swaps the alias to a complete new index
+def test_reindex_all_swaps_alias(memory_db):
+    with open(os.path.join(BASE_DIR, "test.csv")) as f:
+        insert_products_from_csv(memory_db, f.read())
+    es = fake_elasticsearch()
+    old_index = ensure_index(es, "products")
+    index_products_by_keys(es, memory_db, [("102430", "TUC")], alias="products")
+
+    result = reindex_all(es, memory_db, alias="products", chunk_size=3)
+
+    assert result["indexed"] == 8
+    assert result["retired"] == [old_index]
+    assert es.fake_store.aliases["products"] == {result["index"]}
+    assert old_index not in es.fake_store.indices
+    hit = es.get(index="products", id="CIN:0163D00007")["_source"]
+    assert hit["part_price"] == 4.27
+
+
+# Test case: products changed while the new index is built are indexed into it before the old one is dropped
+def test_reindex_all_catches_up_changes(memory_db, monkeypatch):
+    with open(os.path.join(BASE_DIR, "test.csv")) as f:
+        insert_products_from_csv(memory_db, f.read())
+    es = fake_elasticsearch()
+    ensure_index(es, "products")
+    bulk = search_index.bulk_index_products
+    calls = []
+
+    def bulk_during_upload(es, products, index="products", chunk_size=500):
+        result = bulk(es, products, index=index, chunk_size=chunk_size)
+        calls.append(index)
+        if len(calls) == 1:
+            # an upload commits and is indexed through the alias while the full load runs
+            upsert_products(memory_db, [{"part_number": "102430", "branch_id": "TUC", "part_price": 9.99, "short_desc": "NEW"}])
+            memory_db.commit()
+            index_products_by_keys(es, memory_db, [("102430", "TUC")], alias="products")
+        return result
+
+    monkeypatch.setattr(search_index, "bulk_index_products", bulk_during_upload)
+    result = reindex_all(es, memory_db, alias="products", chunk_size=3)
+
+    assert result["caught_up"] >= 1
+    assert es.get(index="products", id="TUC:102430")["_source"]["part_price"] == 9.99
+
+
+# Test case: indexing tasks fail instead of reporting success, after retrying an unreachable Elasticsearch
+def test_index_products_retries_then_fails(monkeypatch):
+    from elasticsearch import ConnectionError as ESConnectionError
+    import celery_tasks
+
+    attempts = []
+
+    def unreachable(es, db, keys):
+        attempts.append(keys)
+        raise ESConnectionError("connection refused")
+
+    monkeypatch.setattr(celery_tasks, "index_products_by_keys", unreachable)
+    result = celery_tasks.index_products.apply(args=[[["102430", "TUC"]]])
+
+    assert result.state == "FAILURE"
+    assert isinstance(result.result, ESConnectionError)
+    assert len(attempts) == celery_tasks.INDEX_MAX_RETRIES + 1
@@ -0,0 +1,53 @@
+# app/tests/test_throttle.py
+import os
+import sys
+sys.path.append('../app')
+
+from celery_tasks import celery, upload_queue
+from ingest import ingest_file
+from throttle import IngestThrottle
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# Test case: the pause doubles while batches are slow, up to the maximum, and halves away once they are fast
+def test_throttle_backs_off_and_recovers(memory_db):
+    pauses = []
+    throttle = IngestThrottle(latency_threshold=1.0, min_delay=0.5, max_delay=3.0, sleep=pauses.append)
+
+    assert [throttle.pause(memory_db, seconds) for seconds in (0.2, 1.5, 1.5, 1.5, 1.5)] == [0.0, 0.5, 1.0, 2.0, 3.0]
+    assert [throttle.pause(memory_db, 0.2) for _ in range(4)] == [1.5, 0.75, 0.0, 0.0]
+    assert pauses == [0.5, 1.0, 2.0, 3.0, 1.5, 0.75]
+    assert throttle.total == sum(pauses)
+    # no replication lag off PostgreSQL
+    assert throttle.replication_lag(memory_db) == 0.0
+
+
+# Test case: the ingest loop reports every committed batch to the throttle
+def test_ingest_file_is_throttled(memory_db):
+    observed = []
+
+    class Recorder(IngestThrottle):
+        def pause(self, db, seconds):
+            observed.append(seconds)
+            return 0.0
+
+    reports = ingest_file(memory_db, os.path.join(BASE_DIR, "test.csv"), batch_size=4, throttle=Recorder())
+    assert len(observed) == sum(1 for report in reports if report["rows"])
+    assert all(seconds >= 0 for seconds in observed)
+
+
+# Test case: celery_config is loaded into the app and uploads are routed by size
+def test_queues_and_routing(tmp_path, monkeypatch):
+    assert {queue.name for queue in celery.conf.task_queues} == {"default", "ingest-small", "ingest-bulk", "index"}
+    assert celery.amqp.router.route({}, "celery_tasks.process_csv_copy")["queue"].name == "ingest-bulk"
+    assert celery.amqp.router.route({}, "celery_tasks.index_products")["queue"].name == "index"
+    assert celery.amqp.router.route({}, "celery_tasks.maintain_price_history")["queue"].name == "default"
+
+    monkeypatch.setattr("celery_tasks.INGEST_BULK_BYTES", 100)
+    path = tmp_path / "upload.csv"
+    path.write_bytes(b"x" * 99)
+    assert upload_queue(str(path)) == "ingest-small"
+    path.write_bytes(b"x" * 100)
+    assert upload_queue(str(path)) == "ingest-bulk"
@@ -0,0 +1,57 @@
+# app/tests/test_validation.py
+import csv
+import io
+import sys
+sys.path.append('../app')
+
+import pytest
+
+from validation import Quarantine, iter_column_batches, normalize_header, validate_batch
+
+CONTENT = """PART_NUMBER,BRANCH_ID,PART_PRICE,SHORT_DESC
+0121F00548,TUC,3.14,"GALV, FAB x .026"
+,TUC,3.14,missing part number
+0121G00509,CIN,abc,bad price
+0163D00007,CIN,-1,negative price
+0163D00007,CIN,4.27
+102430,TUC, 42.5 ,GALV
+"""
+
+
+def batches(content, batch_size):
+    reader = csv.reader(io.StringIO(content))
+    header = normalize_header(next(reader))
+    return list(iter_column_batches(reader, header, batch_size))
+
+
+# Test case: valid rows are coerced and every bad row is reported with its line
+def test_validate_batch():
+    rows, rejected = validate_batch(batches(CONTENT, 100)[0])
+
+    assert rows == [
+        {"part_number": "0121F00548", "branch_id": "TUC", "part_price": 3.14, "short_desc": "GALV, FAB x .026"},
+        {"part_number": "102430", "branch_id": "TUC", "part_price": 42.5, "short_desc": "GALV"},
+    ]
+    assert [(reject["line"], reject["reason"]) for reject in rejected] == [
+        (3, "missing part_number"),
+        (4, "part_price is not a number"),
+        (5, "part_price is negative"),
+        (6, "expected 4 fields, got 3"),
+    ]
+
+
+# Test case: batches are bounded and a missing required column fails fast
+def test_column_batches_and_header():
+    assert [len(batch) for batch in batches(CONTENT, 2)] == [2, 2, 1]
+    with pytest.raises(ValueError):
+        normalize_header(["part_number", "part_price"])
+
+
+# Test case: rejected rows are quarantined next to the upload
+def test_quarantine(tmp_path):
+    upload = tmp_path / "upload.csv"
+    with Quarantine(str(upload)) as quarantine:
+        quarantine.write([{"line": 3, "reason": "missing part_number", "row": ["", "TUC", "3.14"]}])
+
+    with open(quarantine.path, newline="") as f:
+        assert list(csv.reader(f)) == [["line", "reason", "row"], ["3", "missing part_number", ",TUC,3.14"]]
@@ -0,0 +1,106 @@
+# throttle.py
+"""Adaptive pacing of the batch uploads, so ingestion yields to the API reads.
+
+A worker committing batch after batch competes with GET /products for the
+database. After every committed batch the ingest loop reports how long the
+batch took to write. When that exceeds INGEST_THROTTLE_LATENCY seconds, or the
+replay lag of the standbys exceeds INGEST_THROTTLE_LAG seconds, the throttle
+pauses before the next batch. The pause doubles while the pressure lasts, up
+to INGEST_THROTTLE_MAX_DELAY, and halves once the database recovered.
+
+The replication lag is read from pg_stat_replication at most every
+INGEST_THROTTLE_LAG_INTERVAL seconds and only on PostgreSQL; a role that may
+not read it only throttles on latency.
+"""
+import os
+import time
+from typing import Callable
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from metrics import INGEST_THROTTLE_SECONDS
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds a batch may take to upsert and commit before the next one is delayed
+INGEST_THROTTLE_LATENCY = float(os.getenv("INGEST_THROTTLE_LATENCY", "2"))
+# Seconds of standby replay lag before the next batch is delayed, 0 disables the check
+INGEST_THROTTLE_LAG = float(os.getenv("INGEST_THROTTLE_LAG", "5"))
+# First and longest pause between two batches in seconds, a maximum of 0 disables the throttle
+INGEST_THROTTLE_MIN_DELAY = float(os.getenv("INGEST_THROTTLE_MIN_DELAY", "0.25"))
+INGEST_THROTTLE_MAX_DELAY = float(os.getenv("INGEST_THROTTLE_MAX_DELAY", "30"))
+# Seconds between two replication lag reads
+INGEST_THROTTLE_LAG_INTERVAL = float(os.getenv("INGEST_THROTTLE_LAG_INTERVAL", "5"))
+
+REPLICATION_LAG_SQL = "SELECT COALESCE(EXTRACT(EPOCH FROM MAX(replay_lag)), 0) FROM pg_stat_replication"
+
+
+class IngestThrottle:
+    """Delays the next batch of an upload while the database is under pressure."""
+
+    def __init__(
+        self,
+        latency_threshold: float = INGEST_THROTTLE_LATENCY,
+        lag_threshold: float = INGEST_THROTTLE_LAG,
+        min_delay: float = INGEST_THROTTLE_MIN_DELAY,
+        max_delay: float = INGEST_THROTTLE_MAX_DELAY,
+        lag_interval: float = INGEST_THROTTLE_LAG_INTERVAL,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.latency_threshold = latency_threshold
+        self.lag_threshold = lag_threshold
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.lag_interval = lag_interval
+        self.sleep = sleep
+        self.delay = 0.0
+        self.total = 0.0
+        self._lag = 0.0
+        self._lag_checked_at = float("-inf")
+        self._lag_readable = lag_threshold > 0
+
+    def replication_lag(self, db: Session) -> float:
+        """Replay lag of the slowest standby in seconds, 0 without standbys or off PostgreSQL."""
+        if not self._lag_readable or db.get_bind().dialect.name != "postgresql":
+            return 0.0
+        if time.monotonic() - self._lag_checked_at < self.lag_interval:
+            return self._lag
+        try:
+            self._lag = float(db.execute(text(REPLICATION_LAG_SQL)).scalar() or 0)
+            # end the read transaction, the session may sleep before the next batch
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            self._lag_readable = False
+            logger.warning("Replication lag unavailable, throttling on latency only: %s", str(e))
+            return 0.0
+        self._lag_checked_at = time.monotonic()
+        return self._lag
+
+    def pause(self, db: Session, seconds: float) -> float:
+        """Waits before the next batch of an upload, once a batch is committed.
+
+        Args:
+            db: Session of the upload, idle between two batches.
+            seconds: Time the batch took to upsert and commit.
+
+        Returns:
+            The pause in seconds, 0 when the database keeps up.
+        """
+        if self.max_delay <= 0:
+            return 0.0
+        lag = self.replication_lag(db)
+        if seconds > self.latency_threshold or lag > self.lag_threshold > 0:
+            self.delay = min(self.max_delay, max(self.delay * 2, self.min_delay))
+            logger.info("Throttling ingestion for %.2fs, batch took %.2fs, replication lag %.2fs", self.delay, seconds, lag)
+        else:
+            self.delay = self.delay / 2 if self.delay / 2 >= self.min_delay else 0.0
+        if self.delay:
+            self.sleep(self.delay)
+            self.total += self.delay
+            INGEST_THROTTLE_SECONDS.inc(self.delay)
+        return self.delay
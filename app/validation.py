@@ -0,0 +1,197 @@
+# validation.py
+import csv
+import os
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+# Column limits of the products table (init-db.sql)
+PART_NUMBER_MAX_LENGTH = 100
+BRANCH_ID_MAX_LENGTH = 100
+SHORT_DESC_MAX_LENGTH = 255
+
+REQUIRED_COLUMNS = ("part_number", "branch_id", "part_price")
+PRODUCT_COLUMNS = REQUIRED_COLUMNS + ("short_desc",)
+
+
+class ColumnBatch:
+    """A chunk of CSV rows stored column-wise, with the file line number of each row."""
+
+    def __init__(self, line_numbers: List[int], columns: dict, rejected: List[dict]):
+        self.line_numbers = line_numbers
+        self.columns = columns
+        # rows rejected while parsing, e.g. with the wrong number of fields
+        self.rejected = rejected
+
+    def __len__(self) -> int:
+        return len(self.line_numbers)
+
+
+def normalize_header(header: List[str]) -> List[str]:
+    """Lower-cases and strips the header, so PART_NUMBER and part_number both work.
+
+    Raises:
+        ValueError: A required column is missing.
+    """
+    header = [column.strip().lower() for column in header]
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"CSV header is missing columns: {', '.join(missing)}")
+    return header
+
+
+def iter_column_batches(reader: Iterable[List[str]], header: List[str], batch_size: int) -> Iterator[ColumnBatch]:
+    """Transposes CSV records into column batches of at most `batch_size` rows.
+
+    Args:
+        reader: csv.reader positioned after the header.
+        header: Normalized header.
+        batch_size: Rows per batch.
+
+    Yields:
+        ColumnBatch with one list per product column.
+    """
+    width = len(header)
+    positions = {column: header.index(column) for column in PRODUCT_COLUMNS if column in header}
+    line_num = getattr(reader, "line_num", None)
+
+    def empty():
+        return [], {column: [] for column in positions}, []
+
+    line_numbers, columns, rejected = empty()
+    count = 1
+    for record in reader:
+        count += 1
+        line = reader.line_num if line_num is not None else count
+        if not any(value.strip() for value in record):
+            continue
+        if len(record) != width:
+            rejected.append({"line": line, "reason": f"expected {width} fields, got {len(record)}", "row": record})
+            continue
+        line_numbers.append(line)
+        for column, position in positions.items():
+            columns[column].append(record[position])
+        if len(line_numbers) >= batch_size:
+            yield ColumnBatch(line_numbers, columns, rejected)
+            line_numbers, columns, rejected = empty()
+    if line_numbers or rejected:
+        yield ColumnBatch(line_numbers, columns, rejected)
+
+
+def _coerce_prices(values: np.ndarray) -> np.ndarray:
+    """Parses prices in one numpy cast, falling back element-wise only when the chunk has bad values."""
+    try:
+        return values.astype(np.float64)
+    except ValueError:
+        prices = np.empty(len(values), dtype=np.float64)
+        for position, value in enumerate(values):
+            try:
+                prices[position] = float(value)
+            except ValueError:
+                prices[position] = np.nan
+        return prices
+
+
+def validate_batch(batch: ColumnBatch) -> Tuple[List[dict], List[dict]]:
+    """Validates and coerces a column batch with vectorized checks.
+
+    Args:
+        batch: Column batch from iter_column_batches.
+
+    Returns:
+        The valid rows as product dictionaries and the rejected rows with their
+        line number and reason.
+    """
+    rejected = list(batch.rejected)
+    if not len(batch):
+        return [], rejected
+
+    part_numbers = np.char.strip(np.asarray(batch.columns["part_number"], dtype=str))
+    branch_ids = np.char.strip(np.asarray(batch.columns["branch_id"], dtype=str))
+    raw_prices = np.char.strip(np.asarray(batch.columns["part_price"], dtype=str))
+    prices = _coerce_prices(np.where(raw_prices == "", "nan", raw_prices))
+    if "short_desc" in batch.columns:
+        descriptions = np.char.strip(np.asarray(batch.columns["short_desc"], dtype=str))
+    else:
+        descriptions = np.full(len(batch), "", dtype=str)
+
+    # the first failing check of a row is its reason
+    checks = [
+        (np.char.str_len(part_numbers) == 0, "missing part_number"),
+        (np.char.str_len(part_numbers) > PART_NUMBER_MAX_LENGTH, f"part_number longer than {PART_NUMBER_MAX_LENGTH}"),
+        (np.char.str_len(branch_ids) == 0, "missing branch_id"),
+        (np.char.str_len(branch_ids) > BRANCH_ID_MAX_LENGTH, f"branch_id longer than {BRANCH_ID_MAX_LENGTH}"),
+        (~np.isfinite(prices), "part_price is not a number"),
+        (prices < 0, "part_price is negative"),
+        (np.char.str_len(descriptions) > SHORT_DESC_MAX_LENGTH, f"short_desc longer than {SHORT_DESC_MAX_LENGTH}"),
+    ]
+    invalid = np.zeros(len(batch), dtype=bool)
+    for failed, reason in checks:
+        failed = failed & ~invalid
+        for position in np.flatnonzero(failed):
+            rejected.append({
+                "line": batch.line_numbers[position],
+                "reason": reason,
+                "row": [batch.columns[column][position] for column in batch.columns],
+            })
+        invalid |= failed
+
+    valid = np.flatnonzero(~invalid)
+    rows = [
+        {
+            "part_number": part_number,
+            "branch_id": branch_id,
+            "part_price": price,
+            "short_desc": description or None,
+        }
+        for part_number, branch_id, price, description in zip(
+            part_numbers[valid].tolist(),
+            branch_ids[valid].tolist(),
+            prices[valid].tolist(),
+            descriptions[valid].tolist(),
+        )
+    ]
+    rejected.sort(key=lambda reject: reject["line"])
+    return rows, rejected
+
+
+class Quarantine:
+    """Writes rejected rows next to the upload as `<upload>.rejected.csv`, created on the first reject.
+
+    With `append` the rows of a resumed ingestion are added to the existing file.
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        self.path = f"{path}.rejected.csv"
+        self.append = append
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def write(self, rejected: List[dict]):
+        if not rejected:
+            return
+        if self._file is None:
+            resume = self.append and os.path.exists(self.path)
+            self._file = open(self.path, "a" if resume else "w", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._file)
+            if not resume:
+                self._writer.writerow(["line", "reason", "row"])
+        for reject in rejected:
+            self._writer.writerow([reject["line"], reject["reason"], ",".join(reject["row"])])
+        self.count += len(rejected)
+
+    def close(self) -> Optional[str]:
+        """Closes the file and returns its path, or None when nothing was rejected."""
+        if self._file is None:
+            return None
+        self._file.close()
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
@@ -6,9 +6,12 @@ CREATE TABLE products (
     branch_id VARCHAR(100),
     part_price NUMERIC(10, 2) NOT NULL,
     short_desc VARCHAR(255),
+    row_hash VARCHAR(32),
     createdat TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updatedat TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+-- the key the uploads upsert on (INSERT ... ON CONFLICT (part_number, branch_id))
+CREATE UNIQUE INDEX ix_part_number_branch_id ON products (part_number, branch_id);
 
 -- for test only
 INSERT INTO products (part_number, branch_id, part_price, short_desc, createdat, updatedat)
@@ -20,5 +23,4 @@ VALUES
   ('0163D00007', 'CIN', 3.14, 'GALV x FAB x 0121F00548', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP),
   ('05700-001-16-88', 'TUC', 3.14, 'GALV x FAB x 0121F00548', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP),
   ('05700-002-11-15', 'TUC', 3.14, 'GALV x FAB x 0121F00548', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP),
-  ('102430', 'TUC', 3.14, 'GALV x FAB x 0121F00548', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP),
-  ('0163D00007', 'CIN', 4.27, 'GALV x FAB x 0121F00548', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP);
+  ('102430', 'TUC', 3.14, 'GALV x FAB x 0121F00548', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP);